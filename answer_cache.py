@@ -0,0 +1,113 @@
+# answer_cache.py
+import hashlib
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+import numpy as np
+
+def normalize_question(text: str) -> str:
+    """Lowercase, drop punctuation (in any script) and collapse whitespace"""
+    text = unicodedata.normalize('NFC', text).lower()
+    text = ''.join(ch for ch in text if not unicodedata.category(ch).startswith('P'))
+    return ' '.join(text.split())
+
+class AnswerCache:
+    """
+    LRU + TTL cache of generated answers, scoped per (document, language).
+
+    Exact repeats are found by a hash of the normalized question; near-duplicate
+    wording is found by cosine similarity of the (normalized) query embeddings.
+    """
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600,
+                 similarity_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries: 'OrderedDict[Tuple[str, str, str], Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(document_id: str, language: str, question: str) -> Tuple[str, str, str]:
+        digest = hashlib.sha1(normalize_question(question).encode('utf-8')).hexdigest()
+        return (document_id, language, digest)
+
+    def _expired(self, entry: Dict[str, Any], now: float) -> bool:
+        return now - entry['created'] > self.ttl_seconds
+
+    def get(self, document_id: str, language: str, question: str,
+            embedding: Optional[np.ndarray] = None) -> Optional[str]:
+        now = time.time()
+        key = self._key(document_id, language, question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry['answer']
+
+            if embedding is not None:
+                best_key, best_score = None, self.similarity_threshold
+                for other_key, other in list(self._entries.items()):
+                    if other_key[:2] != key[:2] or other['embedding'] is None:
+                        continue
+                    if self._expired(other, now):
+                        del self._entries[other_key]
+                        continue
+                    score = float(np.dot(other['embedding'], embedding))
+                    if score >= best_score:
+                        best_key, best_score = other_key, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.semantic_hits += 1
+                    return self._entries[best_key]['answer']
+
+            self.misses += 1
+            return None
+
+    def put(self, document_id: str, language: str, question: str,
+            embedding: Optional[np.ndarray], answer: str) -> None:
+        key = self._key(document_id, language, question)
+        with self._lock:
+            self._entries[key] = {
+                'answer': answer,
+                'embedding': None if embedding is None else np.asarray(embedding, dtype='float32'),
+                'created': time.time()
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, document_id: Optional[str] = None) -> None:
+        """Drop cached answers for one document, or everything if no id is given"""
+        with self._lock:
+            if document_id is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[0] == document_id]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'exact_hits': self.exact_hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_rate': (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0
+            }
+
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv('ANSWER_CACHE_SIZE', '1000')),
+    ttl_seconds=float(os.getenv('ANSWER_CACHE_TTL', '3600')),
+    similarity_threshold=float(os.getenv('ANSWER_CACHE_SIMILARITY', '0.95'))
+)
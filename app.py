@@ -2,12 +2,20 @@
 import streamlit as st
 import os
 import tempfile
-from text_extraction import extract_text, LANGUAGE_MAP
-from embedding import embed_text, model  
-from translation import translate_text
-from database import document_store
-from qa_module import get_answer, get_language_error_message
-from utils import save_to_zip
+import time
+import uuid
+from text_extraction import LANGUAGE_MAP
+from embedding import model
+from translation import TranslationJob
+from database import indexed_document_id, new_document_store
+from qa_module import stream_answer, get_language_error_message
+from answer_cache import answer_cache
+from utils import write_zip, ZIP_COMPRESSION
+from session_store import session_store
+from metrics import start_metrics_server
+from profiling import profile_requests, PROFILE_MODES
+from job_queue import (get_queue, enqueue_extract, enqueue_embed, load_embeddings, start_workers,
+                       JOB_WORKERS, DONE, FAILED)
 import firebase
 import signup
 
@@ -19,6 +27,8 @@ MAKERS_IMAGES = {
     'maker4': os.path.join(IMAGES_DIR, 'Vinayakphoto.jpg'),
     'mentor': os.path.join(IMAGES_DIR, 'mentor.jpg')
 }
+# Q&A turns kept per session; older ones are dropped from the chat history.
+CHAT_HISTORY_TURNS = int(os.getenv('CHAT_HISTORY_TURNS', '50'))
 
 def initialize_session_state():
     """Initialize session state variables if they don't exist"""
@@ -26,6 +36,8 @@ def initialize_session_state():
         st.session_state.text_dict = None
     if 'input_language' not in st.session_state:
         st.session_state.input_language = None
+    if 'page_languages' not in st.session_state:
+        st.session_state.page_languages = {}
     if 'translation_language' not in st.session_state:
         st.session_state.translation_language = None
     if 'embeddings_created' not in st.session_state:
@@ -39,6 +51,22 @@ def initialize_session_state():
     if 'chat_history' not in st.session_state:
         st.session_state.chat_history = []
 
+def session_id():
+    """Key of this session's documents in the session store"""
+    if 'session_store_id' not in st.session_state:
+        st.session_state.session_store_id = uuid.uuid4().hex
+    return st.session_state.session_store_id
+
+def session_document_store():
+    """This session's DocumentStore; every session indexes its document into its own"""
+    if 'document_store' not in st.session_state:
+        st.session_state.document_store = new_document_store()
+    return st.session_state.document_store
+
+def add_to_chat_history(question, answer):
+    st.session_state.chat_history.append((question, answer))
+    del st.session_state.chat_history[:-CHAT_HISTORY_TURNS]
+
 def load_model():
     """Check if the model is loaded and set the flag"""
     if not st.session_state.model_loaded:
@@ -52,41 +80,127 @@ def load_model():
     return True
 
 def create_embeddings():
-    """Create embeddings from the text and store in database"""
+    """
+    Queue the document for embedding by a worker process and add the result to
+    the database once it is ready. Returns True when done, None while the job
+    is still running and False on failure.
+    """
     if not st.session_state.text_dict:
         return False
         
     if not st.session_state.embeddings_created:
+        if not load_model():
+            return False
+        
+        job_id = st.session_state.get('embed_job')
+        if job_id is None:
+            lang = st.session_state.input_language or 'English'
+            st.session_state.embed_job = enqueue_embed(dict(st.session_state.text_dict), lang,
+                                                       st.session_state.page_languages)
+            return None
+        
+        job = get_queue().get(job_id)
+        if job is not None and job['status'] not in (DONE, FAILED):
+            return None
+        
         try:
-            if not load_model():
-                return False
-                
-            with st.spinner('Creating embeddings for Q&A... This may take a moment.'):
-                progress_bar = st.progress(0)
-                
-                lang = st.session_state.input_language or 'English'
-                
-                embedded_text = embed_text(st.session_state.text_dict, lang)
-                progress_bar.progress(100)
-                
-                document_store.add_to_database(embedded_text)
-                
-                st.session_state.embeddings_created = True
-                return True
-                
+            if job is None or job['status'] == FAILED:
+                raise RuntimeError(job['error'] if job else "embedding job not found")
+            session_document_store().add_to_database(load_embeddings(get_queue().job_dir(job_id)))
+            st.session_state.embeddings_created = True
+            boilerplate = job['progress'].get('boilerplate')
+            if boilerplate and boilerplate['lines']:
+                st.caption(f"Left {boilerplate['lines']} repeated header/footer line(s) out of the index "
+                           f"({boilerplate['bytes_removed']} bytes, {boilerplate['chunks_saved']} chunks)")
+            return True
         except Exception as e:
+            st.session_state.embed_job = None
             error_msg = get_language_error_message('English', 'embedding')
             st.error(f"{error_msg}: {str(e)}")
             return False
             
     return True
 
+def poll_extract_job():
+    """
+    Show the progress and pages so far of this session's extraction job, and
+    load the result into the session once it finishes. Returns True while the
+    job is still running.
+    """
+    # A refreshed tab loses session_state but keeps the job id in the URL.
+    job_id = st.session_state.get('extract_job') or st.experimental_get_query_params().get('job', [None])[0]
+    if job_id is None or st.session_state.get('loaded_extract_job') == job_id:
+        return False
+    
+    job = get_queue().get(job_id)
+    if job is None:
+        st.session_state.extract_job = None
+        return False
+    st.session_state.extract_job = job_id
+    pages = get_queue().pages(job_id)
+    
+    if job['status'] not in (DONE, FAILED):
+        if not pages:
+            st.info("Extracting text from document...")
+            return True
+        st.info(f"Extracting text from document... {len(pages)} page(s) ready")
+        partial_page = st.selectbox('Select Page', list(pages.keys()), key=f"partial_page_{job_id}")
+        st.text_area("Page Content", value=pages[partial_page], height=300, disabled=True)
+        return True
+    
+    st.session_state.loaded_extract_job = job_id
+    if job['status'] == FAILED:
+        st.error(f"Failed to extract text from the document: {job['error']}")
+    elif all(value.startswith("Error processing") for value in pages.values()):
+        st.error(f"Failed to extract text from the document: {list(pages.values())[0]}")
+    else:
+        # Kept within the session's memory budget; the rest is read from disk page by page.
+        st.session_state.text_dict = session_store.pages(session_id(), 'text', pages)
+        st.session_state.input_language = job['payload']['language']
+        # Pages that script detection read in another language than the one selected.
+        st.session_state.page_languages = {int(page): language for page, language
+                                           in job['progress'].get('page_languages', {}).items()}
+        st.session_state.document_processed = True
+        st.session_state.selected_page = 1
+        st.success("Text extraction completed!")
+    return False
+
+def cancel_translation_job():
+    job = st.session_state.get('translation_job')
+    if job is not None:
+        job.cancel()
+        st.session_state.translation_job = None
+
+def export_download(text_dict, label, file_name, key):
+    """
+    ZIP export built only when the user asks for it; the archive is written
+    through a spooled temp file and never kept in session_state. Peak memory
+    is still one full copy of the ZIP: st.download_button keeps its data in
+    Streamlit's in-memory media store, so the spooled file is read whole.
+    """
+    compression = st.selectbox('Download compression', list(ZIP_COMPRESSION), index=2,
+                               key=f"{key}_compression",
+                               help="'stored' is fastest (no compression); 'smallest' takes the most CPU")
+    if st.button("Prepare download", key=f"{key}_prepare"):
+        with st.spinner('Preparing download...'):
+            with write_zip(text_dict, compression) as archive:
+                st.download_button(
+                    label=label,
+                    data=archive.read(),
+                    file_name=file_name,
+                    mime="application/zip",
+                    key=f"{key}_download"
+                )
+
 def reset_session():
+    cancel_translation_job()
+    st.session_state.embed_job = None
     st.session_state.embeddings_created = False
     st.session_state.document_processed = False
     st.session_state.translation_language = None
-    global document_store
-    document_store = document_store.__class__()
+    store = session_document_store()
+    answer_cache.invalidate(indexed_document_id(store))
+    store.clear()
 
 def home():
     st.title('Veda VisionGPT')
@@ -101,34 +215,16 @@ def home():
     if uploaded_file is not None:
         if st.button('Process Document'):
             reset_session()
-            
-            with st.spinner('Extracting text from document...'):
-                try:
-                    text_dict = extract_text(uploaded_file, selected_input_language)
-
-                    if isinstance(text_dict, dict) and all(isinstance(value, str) and value.startswith("Error processing") for value in text_dict.values()):
-                        st.error(f"Failed to extract text from the document: {list(text_dict.values())[0]}")
-                    else:
-                        st.session_state.text_dict = text_dict
-                        st.session_state.input_language = selected_input_language
-                        st.session_state.document_processed = True
-                        
-                        if 'selected_page' not in st.session_state:
-                            st.session_state.selected_page = 1
-
-                        st.session_state.zip_content = save_to_zip(text_dict)
-                        st.success("Text extraction completed!")
-
-                finally: 
-                    pass
-
-    if hasattr(st.session_state, 'zip_content') and st.session_state.zip_content:
-        st.download_button(
-            label="Download extracted text",
-            data=st.session_state.zip_content,
-            file_name="extracted_text.zip",
-            mime="application/zip"
-        )
+            st.session_state.text_dict = None
+            # OCR runs in a worker process; the id in the URL survives a refresh.
+            job_id = enqueue_extract(uploaded_file.name, uploaded_file.getvalue(), selected_input_language)
+            st.session_state.extract_job = job_id
+            st.experimental_set_query_params(job=job_id)
+
+    extraction_running = poll_extract_job()
+
+    if st.session_state.get('document_processed', False):
+        export_download(st.session_state.text_dict, "Download extracted text", "extracted_text.zip", "extracted")
 
     if st.session_state.get('document_processed', False):
         total_pages = len(st.session_state.text_dict)
@@ -165,6 +261,10 @@ def home():
                 st.session_state.page = "Q&A"
                 st.experimental_rerun()
 
+    if extraction_running:
+        time.sleep(1)
+        st.experimental_rerun()
+
 def translate():
     st.title("Translation")
     if not st.session_state.document_processed:
@@ -178,44 +278,48 @@ def translate():
     
     target_language = st.selectbox('Select target language', languages)
     if st.button('Translate'):
-        with st.spinner('Translating...'):
-            try:
-                translated_text = translate_text(
-                    st.session_state.text_dict, 
-                    st.session_state.input_language, 
-                    target_language
-                )
-                if translated_text:
-                    st.session_state.translation_language = target_language
-                    st.session_state.translated_text = translated_text
-                    
-                    st.session_state.translated_zip_content = save_to_zip(translated_text)
-                    st.success("Translation completed!")
-                    
-                    st.session_state.selected_page = 1
-                else:
-                    st.error("Translation failed. Please try again.")
-            except Exception as e:
+        cancel_translation_job()
+        # Runs in the background; this page reruns to show pages as they finish.
+        st.session_state.translation_job = TranslationJob(
+            st.session_state.text_dict,
+            st.session_state.input_language,
+            target_language,
+            page_languages=st.session_state.page_languages
+        )
+        st.session_state.translated_text = {}
+        st.session_state.selected_page = 1
+
+    job = st.session_state.get('translation_job')
+    if job is not None:
+        st.session_state.translated_text = job.ordered_pages()
+        if not job.done:
+            st.progress(job.progress)
+            st.caption(f"Translated {len(job.pages)} of {job.total_pages} pages...")
+        else:
+            st.session_state.translation_job = None
+            if job.error is not None or not st.session_state.translated_text:
                 st.error(get_language_error_message('English', 'translation'))
+            else:
+                st.session_state.translation_language = job.target_language
+                st.session_state.translated_text = session_store.pages(
+                    session_id(), 'translated', st.session_state.translated_text)
+                st.success("Translation completed!")
 
-    if hasattr(st.session_state, 'translated_zip_content') and st.session_state.translated_zip_content:
-        st.download_button(
-            label="Download translated text",
-            data=st.session_state.translated_zip_content,
-            file_name="translated_text.zip",
-            mime="application/zip"
-        )
+    if st.session_state.get('translated_text') and st.session_state.get('translation_job') is None:
+        export_download(st.session_state.translated_text, "Download translated text", "translated_text.zip",
+                        "translated")
 
 
     if hasattr(st.session_state, 'translated_text') and st.session_state.translated_text:
-        total_pages = len(st.session_state.translated_text)
+        available_pages = list(st.session_state.translated_text.keys())
         
         st.header("Translated Document Pages")
         
         selected_page = st.selectbox(
             'Select Page', 
-            list(range(1, total_pages + 1)), 
-            index=st.session_state.selected_page - 1
+            available_pages, 
+            index=available_pages.index(st.session_state.selected_page)
+            if st.session_state.selected_page in available_pages else 0
         )
         
         st.session_state.selected_page = selected_page
@@ -231,6 +335,9 @@ def translate():
     if st.button("Back to Home"):
         st.session_state.page = "Home"
         st.experimental_rerun()
+
+    if job is not None and not job.done:
+        time.sleep(1)
         st.experimental_rerun()
 
 def qa():
@@ -245,11 +352,19 @@ def qa():
     if not st.session_state.embeddings_created:
         st.info("Preparing document for Q&A... This may take a moment.")
         success = create_embeddings()
+        if success is None:
+            time.sleep(1)
+            st.experimental_rerun()
         if not success:
             st.error("Failed to prepare document for Q&A. Please try again.")
             return
         st.success("Document prepared for Q&A!")
 
+    # A rerun (e.g. the Stop button) interrupts a stream mid-answer; keep what arrived.
+    if st.session_state.get('streaming_answer'):
+        add_to_chat_history(*st.session_state.streaming_answer)
+        del st.session_state['streaming_answer']
+
     chat_container = st.container()
     
     with chat_container:
@@ -258,21 +373,47 @@ def qa():
             st.write("Answer:", a)
             st.write("---")
 
+    if st.session_state.get('last_answer_stats'):
+        stats = st.session_state.last_answer_stats
+        if stats.get('time_to_first_token') is not None:
+            caption = (f"First token in {stats['time_to_first_token']:.2f}s, "
+                       f"full answer in {stats['total_latency']:.2f}s")
+            if stats.get('queue_wait'):
+                caption += f" (queued {stats['queue_wait']:.2f}s)"
+            if stats.get('prompt_tokens'):
+                caption += f", ~{stats['prompt_tokens']} prompt tokens"
+            st.caption(caption)
+
     user_question = st.text_input("Enter your question about the document:")
     
     if user_question:
         if st.button('Get Answer'):
-            with st.spinner('Searching for answer...'):
-                try:
-                    answer = get_answer(
-                        user_question, 
-                        st.session_state.input_language, 
-                        st.session_state.translation_language
-                    )
-                    st.session_state.chat_history.append((user_question, answer))
-                    st.experimental_rerun()
-                except Exception as e:
-                    st.error(f"An error occurred while generating the answer: {str(e)}")
+            st.write("Question:", user_question)
+            answer_placeholder = st.empty()
+            st.button("Stop generating")
+            stats = {}
+            stream = stream_answer(
+                user_question, 
+                st.session_state.input_language, 
+                st.session_state.translation_language,
+                stats=stats,
+                store=session_document_store()
+            )
+            answer = ''
+            try:
+                with st.spinner('Searching for answer...'):
+                    for part in stream:
+                        answer += part
+                        st.session_state.streaming_answer = (user_question, answer)
+                        answer_placeholder.write(f"Answer: {answer}▌")
+                add_to_chat_history(user_question, answer.strip())
+                st.session_state.last_answer_stats = stats
+                st.session_state.pop('streaming_answer', None)
+                st.experimental_rerun()
+            except Exception as e:
+                st.error(f"An error occurred while generating the answer: {str(e)}")
+            finally:
+                stream.close()
 
     if st.button("Clear Chat History"):
         st.session_state.chat_history = []
@@ -349,18 +490,31 @@ def about():
         st.write("Senior Research Advisor")
 
 
+def is_admin():
+    """Users listed in ADMIN_EMAILS (comma-separated) get the profiling switch"""
+    admins = {email.strip().lower() for email in os.getenv('ADMIN_EMAILS', '').split(',') if email.strip()}
+    user = st.session_state.get('user')
+    return bool(user and getattr(user, 'email', None) and user.email.lower() in admins)
+
 def logout():
     """Handle user logout and clean up session"""
+    cancel_translation_job()
     keys_to_clear = [
         'text_dict', 
         'input_language', 
+        'page_languages', 
         'translation_language', 
         'embeddings_created', 
         'document_processed', 
         'chat_history', 
+        'streaming_answer',
+        'last_answer_stats',
         'translated_text',
-        'zip_content',
-        'translated_zip_content',
+        'translation_job',
+        'extract_job',
+        'loaded_extract_job',
+        'embed_job',
+        'user_info_cache',
         'user',
         'logged_in'
     ]
@@ -368,10 +522,14 @@ def logout():
     for key in keys_to_clear:
         if key in st.session_state:
             del st.session_state[key]
+    st.experimental_set_query_params()
+    session_store.release(session_id())
     
     try:
-        global document_store
-        document_store = document_store.__class__()
+        store = st.session_state.pop('document_store', None)
+        if store is not None:
+            answer_cache.invalidate(indexed_document_id(store))
+            store.clear()
     except Exception as e:
         st.error(f"Error clearing vector database: {e}")
     
@@ -445,6 +603,9 @@ def main():
     """, unsafe_allow_html=True)
 
     initialize_session_state()
+    start_metrics_server()
+    if JOB_WORKERS:
+        start_workers(JOB_WORKERS)
 
     if not hasattr(st.session_state, 'logged_in') or not st.session_state.logged_in:
         signup.main()
@@ -465,6 +626,13 @@ def main():
         if user_info:
             st.sidebar.write(f"Welcome, {user_info.get('name', 'User')}")
 
+    profile_mode = None
+    if is_admin():
+        profile_mode = st.sidebar.selectbox("Profile my requests", ('off',) + PROFILE_MODES, key="profile_mode")
+        profile_mode = None if profile_mode == 'off' else profile_mode
+        with st.sidebar.expander("Session memory"):
+            st.json(session_store.stats())
+
     st.sidebar.markdown("---") 
     if st.sidebar.button("Logout"):
         logout()
@@ -473,7 +641,8 @@ def main():
         with st.spinner("Loading Q&A model..."):
             load_model()
 
-    pages[st.session_state.page]()
+    with profile_requests(profile_mode):
+        pages[st.session_state.page]()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
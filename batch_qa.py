@@ -0,0 +1,182 @@
+# batch_qa.py
+"""
+Answer many questions against one document set without the Streamlit UI.
+
+Questions are embedded in one encode call and searched in one index call;
+LLM calls run concurrently up to --concurrency. Each answer is appended to the
+output JSONL as soon as it is ready, and a rerun with the same output file
+skips questions that already have an answer.
+
+Usage:
+    python batch_qa.py --documents gazette.pdf notice.jpg --language Marathi \
+        --questions questions.jsonl --output answers.jsonl --concurrency 8
+
+Without --documents the questions are answered from the persisted index
+loaded via DOCUMENT_INDEX_PATH (see ingest.py).
+
+The questions file is JSONL with {"id": ..., "question": ...} per line, or plain
+text with one question per line (the line number becomes the id).
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Dict, List, Any, Iterator
+
+logger = logging.getLogger(__name__)
+
+def read_questions(path: str) -> List[Dict[str, Any]]:
+    questions = []
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                record = json.loads(line)
+                questions.append({'id': str(record.get('id', line_number)), 'question': record['question']})
+            else:
+                questions.append({'id': str(line_number), 'question': line})
+    return questions
+
+def completed_ids(output_path: str) -> set:
+    """Ids answered without error in a previous (possibly interrupted) run"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                if 'error' not in record:
+                    done.add(str(record['id']))
+            except (ValueError, KeyError):
+                # A run killed mid-write can leave a truncated last line.
+                continue
+    return done
+
+def index_documents(paths: List[str], language: str) -> None:
+    from database import document_store
+    from embedding import embed_text
+    from text_extraction import extract_text
+    from utils import open_as_upload
+
+    for path in paths:
+        page_languages = {}
+        text_dict = extract_text(open_as_upload(path), language, page_languages=page_languages)
+        document_store.add_to_database(embed_text(text_dict, language, page_languages=page_languages))
+        logger.info(f"Indexed {path}: {len(text_dict)} pages")
+
+def answer_batch(questions: List[Dict[str, Any]], input_language: str, translation_language: str = None,
+                 concurrency: int = 8, timeout: float = 120.0) -> Iterator[Dict[str, Any]]:
+    """
+    Yield one result dict per question, in completion order
+    """
+    import qa_module
+    from database import archive_store, document_store, indexed_document_id, search_stores
+    from embedding import encode_queries
+    from llm_dispatch import LLMDispatcher
+
+    if not questions:
+        return
+
+    start = time.perf_counter()
+    embeddings = encode_queries([q['question'] for q in questions])
+    all_candidates = search_stores([document_store, archive_store], embeddings, k=qa_module.RETRIEVAL_K,
+                                   return_embeddings=True)
+    logger.info(f"Embedded and searched {len(questions)} questions in {time.perf_counter() - start:.1f}s")
+
+    dispatcher = LLMDispatcher(lambda: qa_module.backend, max_concurrency=concurrency,
+                               tokens_per_minute=qa_module.LLM_TOKENS_PER_MINUTE)
+    document_id = indexed_document_id()
+    pending = {}
+    answered_without_llm = []
+    work = iter(zip(questions, embeddings, all_candidates))
+
+    def submit_next() -> bool:
+        for item, embedding, candidates in work:
+            result = {'id': item['id'], 'question': item['question']}
+            result['language'] = qa_module.resolve_question_language(item['question'], input_language,
+                                                                     translation_language)
+            chunks = qa_module.pack_candidates(embedding, candidates, result)
+            if not chunks:
+                result['answer'] = qa_module.get_language_error_message(result['language'], 'no_results')
+                answered_without_llm.append(result)
+                return True
+            prompt = qa_module.build_prompt(item['question'], result['language'], chunks)
+            result['prompt_tokens'] = qa_module.estimate_tokens(prompt)
+            future, _ = dispatcher.submit(document_id, prompt, timeout=timeout)
+            pending[future] = result
+            return True
+        return False
+
+    # Keep a bounded window in flight so queued requests don't burn their deadline.
+    for _ in range(concurrency * 2):
+        if not submit_next():
+            break
+
+    while pending or answered_without_llm:
+        while answered_without_llm:
+            yield answered_without_llm.pop(0)
+            submit_next()
+        if not pending:
+            continue
+        done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+        for future in done:
+            result = pending.pop(future)
+            try:
+                llm_result = future.result()
+                result['answer'] = (llm_result['text'] or '').strip() or \
+                    qa_module.get_language_error_message(result['language'], 'no_answer')
+                result['queue_wait'] = round(llm_result['queue_wait'], 3)
+                result['generation_time'] = round(llm_result['generation_time'], 3)
+            except Exception as e:
+                result['error'] = str(e)
+            yield result
+            submit_next()
+
+def main():
+    parser = argparse.ArgumentParser(description='Batch question answering over a document set')
+    parser.add_argument('--documents', nargs='*', default=[],
+                        help='PDF/image/DOCX files to index (omit to use the index at DOCUMENT_INDEX_PATH)')
+    parser.add_argument('--language', default='English', help='input language of the documents')
+    parser.add_argument('--translation-language', default=None)
+    parser.add_argument('--questions', required=True)
+    parser.add_argument('--output', required=True, help='JSONL file; appended to and used as the checkpoint')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--timeout', type=float, default=120.0, help='per-question LLM deadline in seconds')
+    args = parser.parse_args()
+
+    questions = read_questions(args.questions)
+    done = completed_ids(args.output)
+    remaining = [q for q in questions if q['id'] not in done]
+    logger.info(f"{len(questions)} questions, {len(done)} already answered, {len(remaining)} to go")
+    if not remaining:
+        return
+
+    index_documents(args.documents, args.language)
+
+    start = time.perf_counter()
+    answered = 0
+    if os.path.exists(args.output) and os.path.getsize(args.output) > 0:
+        with open(args.output, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(b'\n')
+
+    with open(args.output, 'a', encoding='utf-8') as out:
+        for result in answer_batch(remaining, args.language, args.translation_language,
+                                   args.concurrency, args.timeout):
+            out.write(json.dumps(result, ensure_ascii=False, default=float) + '\n')
+            out.flush()
+            answered += 1
+            if answered % 100 == 0:
+                rate = answered / (time.perf_counter() - start)
+                logger.info(f"{answered}/{len(remaining)} answered ({rate:.1f}/s)")
+    print(f"Answered {answered} questions in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
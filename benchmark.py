@@ -0,0 +1,412 @@
+# benchmark.py
+"""
+Offline benchmarks for Veda VisionGPT components.
+
+Usage:
+    python benchmark.py index --chunks 200000 --modes flat,sq8,ivfpq
+    python benchmark.py langdetect
+    python benchmark.py translate --pages 20 --workers 1,8,16
+    python benchmark.py e2e --synthetic-pages 50,500 --save-baseline baseline.json
+    python benchmark.py e2e --synthetic-pages 50,500 --baseline baseline.json --fail-on-regression
+
+The e2e benchmark runs extraction, chunking, embedding, indexing, search,
+get_answer and translation over the bundled tamil.pdf and telugu.jpg plus
+synthetic corpora, with the LLM and translation served by the local stub
+server, so it needs no network access.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from typing import Dict, Any, List
+
+def percentile_ms(samples: List[float], q: float) -> float:
+    return float(np.percentile(np.array(samples) * 1000, q))
+
+def synthetic_embeddings(n: int, dimension: int = 768, clusters: int = 200, seed: int = 0) -> np.ndarray:
+    """Clustered, L2-normalized vectors that roughly mimic sentence embeddings"""
+    # Cluster centres are fixed so corpus and query sets share the same topics.
+    centers = np.random.default_rng(12345).standard_normal((clusters, dimension)).astype('float32')
+    rng = np.random.default_rng(seed)
+    vectors = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dimension)).astype('float32')
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def benchmark_index(args) -> List[Dict[str, Any]]:
+    from database import DocumentStore
+
+    corpus = synthetic_embeddings(args.chunks, args.dimension, seed=0)
+    queries = synthetic_embeddings(args.queries, args.dimension, seed=1)
+    embedded = {1: [{'text': str(i), 'embedding': v, 'language': 'English'} for i, v in enumerate(corpus)]}
+
+    results = []
+    ground_truth = None
+    for mode in args.modes.split(','):
+        store = DocumentStore(index_type=mode, code_size=args.code_size, nlist=args.nlist,
+                              nprobe=args.nprobe, rerank_k=args.rerank_k)
+        start = time.perf_counter()
+        store.add_to_database(embedded)
+        build_seconds = time.perf_counter() - start
+
+        latencies, found = [], []
+        for query in queries:
+            start = time.perf_counter()
+            hits = store.search_database(query, k=5)
+            latencies.append(time.perf_counter() - start)
+            found.append([int(hit['text']) for hit in hits])
+
+        if ground_truth is None:
+            # Exact neighbours from a flat index, computed once for every mode.
+            exact = DocumentStore(index_type='flat')
+            exact.add_to_database(embedded)
+            ground_truth = [[int(hit['text']) for hit in exact.search_database(q, k=5)] for q in queries]
+
+        recall = np.mean([len(set(f) & set(g)) / 5 for f, g in zip(found, ground_truth)])
+        results.append({
+            'mode': mode,
+            'chunks': args.chunks,
+            'build_seconds': round(build_seconds, 3),
+            'index_mb_per_million_chunks': round(store.memory_bytes() / args.chunks * 1e6 / 2**20, 1),
+            'recall_at_5': round(float(recall), 4),
+            'search_p50_ms': round(percentile_ms(latencies, 50), 3),
+            'search_p99_ms': round(percentile_ms(latencies, 99), 3),
+        })
+    return results
+
+# One short question per LANGUAGE_MAP language, detected with no preferred language.
+# Bihari and Pali have no markers of their own, so here they only match at script
+# level (Bihari comes back as Bhojpuri, Pali as Hindi); the app passes the input
+# language as preferred, which resolves both. Accuracy on held-out text is
+# asserted in tests/test_script_detection.py.
+LANGUAGE_SAMPLES = {
+    'English': "What is the date of this notification?",
+    'Marathi': "या अधिसूचनेची तारीख काय आहे?",
+    'Hindi': "इस अधिसूचना की तारीख क्या है?",
+    'Bengali': "এই বিজ্ঞপ্তির তারিখ কী?",
+    'Assamese': "এই জাননীখনৰ তাৰিখ কি?",
+    'Meetei': "ꯃꯤꯇꯩꯂꯣꯟ ꯑꯁꯤ ꯀꯔꯤꯅꯣ?",
+    'Bihari': "ई सूचना कब निकलल?",
+    'Bhojpuri': "ई सूचना कब आइल बा?",
+    'Oriya': "ଏହି ବିଜ୍ଞପ୍ତିର ତାରିଖ କଣ?",
+    'Punjabi': "ਇਸ ਸੂਚਨਾ ਦੀ ਤਾਰੀਖ ਕੀ ਹੈ?",
+    'Tamil': "இந்த அறிவிப்பின் தேதி என்ன?",
+    'Telugu': "ఈ ప్రకటన తేదీ ఏమిటి?",
+    'Kannada': "ಈ ಅಧಿಸೂಚನೆಯ ದಿನಾಂಕ ಏನು?",
+    'Nepali': "यो सूचनाको मिति के हो?",
+    'Urdu': "اس اعلان کی تاریخ کیا ہے؟",
+    'Goan': "ह्या सुचनेची तारीख कितें आसा?",
+    'Maithili': "एहि सूचनाक तिथि की अछि?",
+    'Santali': "ᱱᱚᱶᱟ ᱥᱩᱪᱱᱟ ᱫᱚ ᱪᱮᱫ ᱠᱟᱱᱟ?",
+    'Gujarati': "આ સૂચનાની તારીખ શું છે?",
+    'Malayalam': "ഈ അറിയിപ്പിന്റെ തീയതി എന്താണ്?",
+    'Pali': "इदं सासनं कदा लिखितं?",
+}
+
+def benchmark_langdetect(args) -> List[Dict[str, Any]]:
+    from script_detection import detect_language, detect_script, SCRIPT_LANGUAGES
+
+    results = []
+    for language, text in LANGUAGE_SAMPLES.items():
+        detect_language.cache_clear()
+        start = time.perf_counter()
+        detected = detect_language(text)
+        cold = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            detect_language(text)
+        cached = (time.perf_counter() - start) / args.repeat
+
+        script = detect_script(text)
+        results.append({
+            'language': language,
+            'detected': detected,
+            'correct': detected == language,
+            'script_correct': language in SCRIPT_LANGUAGES.get(script, []),
+            'cold_us': round(cold * 1e6, 1),
+            'cached_us': round(cached * 1e6, 3),
+        })
+    results.append({
+        'summary': True,
+        'accuracy': round(np.mean([r['correct'] for r in results]), 3),
+        'script_accuracy': round(np.mean([r['script_correct'] for r in results]), 3),
+    })
+    return results
+
+def synthetic_pages(pages: int, words_per_page: int, seed: int = 0, header: bool = False) -> Dict[int, str]:
+    """Random-word pages; `header` adds a letterhead and page-number footer to every page, like a scanned gazette"""
+    rng = np.random.default_rng(seed)
+    vocabulary = [f"word{i}" for i in range(2000)]
+    text_dict = {}
+    for page in range(1, pages + 1):
+        words = rng.choice(vocabulary, words_per_page)
+        text = '. '.join(' '.join(words[i:i + 12]) for i in range(0, len(words), 12)) + '.'
+        if header:
+            text = f"THE GAZETTE OF INDIA\nEXTRAORDINARY\n{text}\nPage {page} of {pages}"
+        text_dict[page] = text
+    return text_dict
+
+def scratch_translation_memory():
+    """
+    An empty TranslationMemory in a temporary directory, for benchmarks that must
+    not read from or write stub translations into the app's memory
+    """
+    from translation_memory import TranslationMemory
+    return TranslationMemory(os.path.join(tempfile.mkdtemp(prefix='translation_memory-'), 'memory.sqlite3'))
+
+def benchmark_translate(args) -> List[Dict[str, Any]]:
+    import translation
+    from stub_server import start_stub_server, StubConfig
+
+    _, url = start_stub_server(config=StubConfig(translate_latency=args.latency, translate_error_rate=args.error_rate))
+    os.environ['TRANSLATION_STUB_URL'] = url
+    translation.set_rate_limit('stub', args.rate)
+    if translation.translation_memory is not None:
+        translation.translation_memory = scratch_translation_memory()
+
+    text_dict = synthetic_pages(args.pages, args.words_per_page)
+    chunks = sum(len(translation.chunk_text(text)) for text in text_dict.values())
+    results = []
+    runs = [(int(w), False) for w in args.workers.split(',')]
+    if translation.translation_memory is not None:
+        # One more run with the memory warm from the last cold run.
+        runs.append((runs[-1][0], True))
+    for workers, warm in runs:
+        if translation.translation_memory is not None and not warm:
+            translation.translation_memory.clear()
+        start = time.perf_counter()
+        translated = translation.translate_text(text_dict, 'english', 'hindi', max_workers=workers, providers=['stub'])
+        seconds = time.perf_counter() - start
+        errors = sum(text.count('[Translation Error') for text in translated.values())
+        results.append({
+            'workers': workers,
+            'translation_memory': 'warm' if warm else 'cold',
+            'pages': args.pages,
+            'chunks': chunks,
+            'errors': errors,
+            'seconds': round(seconds, 3),
+            'pages_per_second': round(args.pages / seconds, 2),
+            'chunks_per_second': round(chunks / seconds, 2),
+        })
+    results.append({'providers': translation.get_provider_metrics()})
+    return results
+
+# Bundled sample documents and their languages.
+FIXTURES = (('tamil.pdf', 'Tamil'), ('telugu.jpg', 'Telugu'))
+# e2e metrics where a smaller value is better; the rest (throughput) should grow.
+LOWER_IS_BETTER = ('wall_seconds', 'search_p50_ms', 'search_p99_ms', 'answer_p50_ms', 'answer_p99_ms', 'peak_rss_mb')
+
+def peak_rss_mb():
+    """High-water mark of this process's resident memory (None where the resource module is missing)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return round(peak / 2**20 if sys.platform == 'darwin' else peak / 2**10, 1)
+
+def run_e2e_corpus(name: str, language: str, args, load_pages) -> Dict[str, Any]:
+    import qa_module
+    from database import document_store
+    from embedding import chunk_text, embed_text, encode_queries
+    from loadtest import sample_questions
+    import translation
+
+    stages = {}
+    wall_start = time.perf_counter()
+
+    start = time.perf_counter()
+    text_dict = load_pages()
+    stages['extract'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for text in text_dict.values():
+        chunk_text(text)
+    stages['chunk'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    embed_stats = {}
+    embedded = embed_text(text_dict, language, stats=embed_stats)
+    stages['embed'] = time.perf_counter() - start
+    indexed_chunks = sum(len(page_chunks) for page_chunks in embedded.values())
+
+    document_store.clear()
+    start = time.perf_counter()
+    document_store.add_to_database(embedded)
+    stages['index_add'] = time.perf_counter() - start
+
+    questions = []
+    if indexed_chunks:
+        try:
+            questions = sample_questions(text_dict, args.questions, seed=0)
+        except IndexError:
+            # OCR output without sentence punctuation; ask about the start of each page instead.
+            openings = [text.strip()[:200] for text in text_dict.values() if text.strip()]
+            questions = [openings[i % len(openings)] for i in range(args.questions)]
+    search_latencies = []
+    if questions:
+        for query in encode_queries(questions):
+            start = time.perf_counter()
+            document_store.search_database(query, k=5)
+            search_latencies.append(time.perf_counter() - start)
+    stages['search'] = sum(search_latencies)
+
+    answer_latencies = []
+    for question in questions:
+        start = time.perf_counter()
+        qa_module.get_answer(question, language)
+        answer_latencies.append(time.perf_counter() - start)
+    stages['answer'] = sum(answer_latencies)
+
+    if not args.skip_translate:
+        # A fresh memory per corpus: every run translates cold, so runs stay comparable
+        # with the baseline, and no stub output reaches the app's translation memory.
+        memory = translation.translation_memory
+        if memory is not None:
+            translation.translation_memory = scratch_translation_memory()
+        try:
+            start = time.perf_counter()
+            translation.translate_text(text_dict, language.lower(), 'english', providers=['stub'])
+            stages['translate'] = time.perf_counter() - start
+        finally:
+            translation.translation_memory = memory
+
+    wall = time.perf_counter() - wall_start
+    pages = len(text_dict)
+    return {
+        'corpus': name,
+        'language': language,
+        'pages': pages,
+        'chunks': indexed_chunks,
+        'boilerplate': embed_stats.get('boilerplate'),
+        'stages': {stage: round(seconds, 3) for stage, seconds in stages.items()},
+        'wall_seconds': round(wall, 3),
+        'pages_per_second': round(pages / wall, 2) if wall else 0.0,
+        'chunks_per_second': round(indexed_chunks / stages['embed'], 2) if stages['embed'] else 0.0,
+        'search_p50_ms': round(percentile_ms(search_latencies, 50), 3) if search_latencies else None,
+        'search_p99_ms': round(percentile_ms(search_latencies, 99), 3) if search_latencies else None,
+        'answer_p50_ms': round(percentile_ms(answer_latencies, 50), 1) if answer_latencies else None,
+        'answer_p99_ms': round(percentile_ms(answer_latencies, 99), 1) if answer_latencies else None,
+        # Process-wide high-water mark after this corpus, not the corpus's own usage.
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+def compare_to_baseline(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]],
+                        tolerance: float) -> Dict[str, Any]:
+    """Relative change of every e2e metric against the baseline run of the same corpus"""
+    baseline_by_corpus = {result['corpus']: result for result in baseline if 'corpus' in result}
+    changes, regressions = {}, []
+    for result in results:
+        before = baseline_by_corpus.get(result['corpus'])
+        if before is None:
+            continue
+        corpus_changes = {}
+        for metric in LOWER_IS_BETTER + ('pages_per_second', 'chunks_per_second'):
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            corpus_changes[metric] = round(change, 3)
+            worse = change > tolerance if metric in LOWER_IS_BETTER else change < -tolerance
+            if worse:
+                regressions.append(f"{result['corpus']}.{metric}: {old} -> {new}")
+        changes[result['corpus']] = corpus_changes
+    return {'comparison': changes, 'tolerance': tolerance, 'regressions': regressions}
+
+def benchmark_e2e(args) -> List[Dict[str, Any]]:
+    import qa_module
+    from answer_cache import answer_cache
+    from llm_backend import HTTPBackend
+    from stub_server import start_stub_server, StubConfig
+
+    _, url = start_stub_server(config=StubConfig(latency=args.llm_latency, tokens_per_second=args.tokens_per_second,
+                                                 answer_tokens=args.answer_tokens,
+                                                 translate_latency=args.translate_latency))
+    qa_module.set_backend(HTTPBackend(url))
+    os.environ['TRANSLATION_STUB_URL'] = url
+    # Every question should go through retrieval and the LLM.
+    answer_cache.max_entries = 0
+
+    corpora = []
+    if not args.skip_fixtures:
+        from text_extraction import extract_text
+        from utils import open_as_upload
+
+        for file_name, language in FIXTURES:
+            if not os.path.exists(file_name):
+                print(f"Skipping missing fixture {file_name}", file=sys.stderr)
+                continue
+            corpora.append((file_name, language,
+                            lambda path=file_name, language=language: extract_text(open_as_upload(path), language)))
+    for pages in (int(n) for n in args.synthetic_pages.split(',') if n):
+        corpora.append((f"synthetic-{pages}", 'English',
+                        lambda pages=pages: synthetic_pages(pages, args.words_per_page, header=True)))
+
+    results = [run_e2e_corpus(name, language, args, load_pages) for name, language, load_pages in corpora]
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            comparison = compare_to_baseline(results, json.load(f), args.tolerance)
+        args.regressed = bool(comparison['regressions'])
+        results.append(comparison)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Veda VisionGPT benchmarks')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    index_parser = subparsers.add_parser('index', help='DocumentStore memory, recall@5 and search latency')
+    index_parser.add_argument('--chunks', type=int, default=100000)
+    index_parser.add_argument('--queries', type=int, default=500)
+    index_parser.add_argument('--dimension', type=int, default=768)
+    index_parser.add_argument('--modes', default='flat,fp16,sq8,ivfpq,opqpq')
+    index_parser.add_argument('--code-size', type=int, default=64)
+    index_parser.add_argument('--nlist', type=int, default=256)
+    index_parser.add_argument('--nprobe', type=int, default=16)
+    index_parser.add_argument('--rerank-k', type=int, default=50)
+    index_parser.set_defaults(func=benchmark_index)
+
+    langdetect_parser = subparsers.add_parser('langdetect', help='Question language detection accuracy and speed')
+    langdetect_parser.add_argument('--repeat', type=int, default=10000)
+    langdetect_parser.set_defaults(func=benchmark_langdetect)
+
+    translate_parser = subparsers.add_parser('translate', help='translate_text throughput against a local stub provider')
+    translate_parser.add_argument('--pages', type=int, default=20)
+    translate_parser.add_argument('--words-per-page', type=int, default=600)
+    translate_parser.add_argument('--workers', default='1,8,16')
+    translate_parser.add_argument('--latency', type=float, default=0.2, help='stub seconds per request')
+    translate_parser.add_argument('--rate', type=float, default=100.0, help='stub requests per second limit')
+    translate_parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of stub requests failing')
+    translate_parser.set_defaults(func=benchmark_translate)
+
+    e2e_parser = subparsers.add_parser('e2e', help='Whole pipeline on the sample documents and synthetic corpora')
+    e2e_parser.add_argument('--synthetic-pages', default='50,500', help='comma-separated synthetic corpus sizes')
+    e2e_parser.add_argument('--words-per-page', type=int, default=400)
+    e2e_parser.add_argument('--questions', type=int, default=50, help='search queries and questions per corpus')
+    e2e_parser.add_argument('--skip-fixtures', action='store_true', help='leave out tamil.pdf and telugu.jpg (no OCR)')
+    e2e_parser.add_argument('--skip-translate', action='store_true')
+    e2e_parser.add_argument('--llm-latency', type=float, default=0.0, help='stub seconds before the first token')
+    e2e_parser.add_argument('--tokens-per-second', type=float, default=1000.0)
+    e2e_parser.add_argument('--answer-tokens', type=int, default=60)
+    e2e_parser.add_argument('--translate-latency', type=float, default=0.0, help='stub seconds per request')
+    e2e_parser.add_argument('--save-baseline', help='write the results to this file')
+    e2e_parser.add_argument('--baseline', help='compare against results saved with --save-baseline')
+    e2e_parser.add_argument('--tolerance', type=float, default=0.10, help='relative change counted as a regression')
+    e2e_parser.add_argument('--fail-on-regression', action='store_true', help='exit with status 1 on a regression')
+    e2e_parser.set_defaults(func=benchmark_e2e)
+
+    args = parser.parse_args()
+    for result in args.func(args):
+        print(json.dumps(result, ensure_ascii=False))
+    if args.command == 'e2e' and args.fail_on_regression and getattr(args, 'regressed', False):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
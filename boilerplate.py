@@ -0,0 +1,64 @@
+# boilerplate.py
+"""
+Cross-page boilerplate detection: letterheads, running headers, footers and
+page-number lines that recur on most pages of a scanned document.
+
+Lines are compared after collapsing whitespace; in short lines digits (in any
+script) are also replaced with '#', so "Page 3 of 40" and "Page 4 of 40" count
+as one line. A line is boilerplate when it appears on more than
+BOILERPLATE_MIN_FRACTION of the pages. Long lines are body text and are never
+removed. Only the text that is chunked and embedded is cleaned; the
+extracted pages shown and exported stay as they were.
+"""
+import logging
+import os
+from collections import Counter
+from typing import Any, Dict, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Fraction of pages a line must appear on to be treated as boilerplate; 0 disables stripping.
+BOILERPLATE_MIN_FRACTION = float(os.getenv('BOILERPLATE_MIN_FRACTION', '0.6'))
+# Documents with fewer pages than this are left alone; repetition means little on two pages.
+BOILERPLATE_MIN_PAGES = int(os.getenv('BOILERPLATE_MIN_PAGES', '3'))
+# Lines up to this many characters have their digits masked (page numbers, dates).
+NUMBERED_LINE_LENGTH = 40
+# Lines longer than this are never treated as boilerplate.
+MAX_LINE_LENGTH = 120
+
+def normalize_line(line: str) -> str:
+    line = ' '.join(line.split())
+    if len(line) > NUMBERED_LINE_LENGTH:
+        return line
+    return ''.join('#' if ch.isdigit() else ch for ch in line)
+
+def find_boilerplate(text_dict: Dict[Any, str], min_fraction: float = BOILERPLATE_MIN_FRACTION,
+                     min_pages: int = BOILERPLATE_MIN_PAGES) -> Set[str]:
+    """Normalized lines that recur on more than `min_fraction` of the pages"""
+    if min_fraction <= 0 or len(text_dict) < max(min_pages, 2):
+        return set()
+    line_pages = Counter()
+    for text in text_dict.values():
+        line_pages.update({key for key in map(normalize_line, text.splitlines()) if key})
+    threshold = min_fraction * len(text_dict)
+    return {key for key, pages in line_pages.items() if pages > threshold and len(key) <= MAX_LINE_LENGTH}
+
+def strip_boilerplate(text_dict: Dict[Any, str], min_fraction: float = BOILERPLATE_MIN_FRACTION,
+                      min_pages: int = BOILERPLATE_MIN_PAGES) -> Tuple[Dict[Any, str], Dict[str, int]]:
+    """
+    Copy of `text_dict` without its boilerplate lines, and how much was removed
+    ({'lines': distinct boilerplate lines, 'bytes_removed': UTF-8 bytes dropped})
+    """
+    boilerplate = find_boilerplate(text_dict, min_fraction, min_pages)
+    stats = {'lines': len(boilerplate), 'bytes_removed': 0}
+    if not boilerplate:
+        return dict(text_dict), stats
+
+    cleaned = {}
+    for page, text in text_dict.items():
+        kept = [line for line in text.splitlines() if normalize_line(line) not in boilerplate]
+        cleaned[page] = '\n'.join(kept)
+        stats['bytes_removed'] += len(text.encode('utf-8')) - len(cleaned[page].encode('utf-8'))
+    logger.info(f"Removed {stats['lines']} boilerplate line(s), {stats['bytes_removed']} bytes, "
+                f"from {len(text_dict)} pages")
+    return cleaned, stats
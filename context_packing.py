@@ -0,0 +1,136 @@
+# context_packing.py
+import math
+import re
+from collections import Counter
+from typing import Callable, Dict, List, Any, Optional, Tuple
+import numpy as np
+
+SENTENCE_SPLIT = re.compile(r'(?<=[।.!?॥])\s+')
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count for Gemini's tokenizer: about 4 characters per token for
+    ASCII text and about 2 per token for Indic and other non-Latin scripts
+    """
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return math.ceil(ascii_chars / 4 + (len(text) - ascii_chars) / 2)
+
+def remove_repeated_lines(texts: List[str]) -> List[str]:
+    """
+    Keep only the first occurrence of lines that appear in more than one chunk
+    (page headers, footers, letterheads)
+    """
+    line_counts = Counter()
+    for text in texts:
+        line_counts.update({line.strip() for line in text.splitlines() if line.strip()})
+
+    seen = set()
+    cleaned = []
+    for text in texts:
+        kept = []
+        for line in text.splitlines():
+            key = line.strip()
+            if key and line_counts[key] > 1:
+                if key in seen:
+                    continue
+                seen.add(key)
+            kept.append(line)
+        cleaned.append('\n'.join(kept))
+    return cleaned
+
+def mmr_select(query_embedding: np.ndarray, embeddings: np.ndarray, max_items: int,
+               lambda_mult: float = 0.7, duplicate_threshold: float = 0.95) -> Tuple[List[int], int]:
+    """
+    Maximal marginal relevance over normalized embeddings.
+    Returns the selected indices in selection order and the number of candidates
+    dropped as near-duplicates of an already selected one.
+    """
+    relevance = embeddings @ query_embedding
+    similarity = embeddings @ embeddings.T
+    selected: List[int] = []
+    remaining = list(range(len(embeddings)))
+    duplicates = 0
+
+    while remaining and len(selected) < max_items:
+        best, best_score = None, -math.inf
+        for i in list(remaining):
+            redundancy = max((similarity[i, j] for j in selected), default=0.0)
+            if redundancy >= duplicate_threshold:
+                remaining.remove(i)
+                duplicates += 1
+                continue
+            score = lambda_mult * relevance[i] - (1 - lambda_mult) * redundancy
+            if score > best_score:
+                best, best_score = i, score
+        if best is None:
+            break
+        selected.append(best)
+        remaining.remove(best)
+    return selected, duplicates
+
+def _fit_sentences(sentences: List[str], scores: List[float], budget: int) -> str:
+    """Most relevant sentences that fit the budget, kept in document order"""
+    chosen = set()
+    used = 0
+    for i in sorted(range(len(sentences)), key=lambda i: -scores[i]):
+        cost = estimate_tokens(sentences[i])
+        if used + cost <= budget:
+            chosen.add(i)
+            used += cost
+    return ' '.join(sentences[i] for i in sorted(chosen))
+
+def pack_context(query_embedding: np.ndarray, chunks: List[Dict[str, Any]], token_budget: int = 1500,
+                 max_chunks: int = 5, lambda_mult: float = 0.7, duplicate_threshold: float = 0.95,
+                 sentence_threshold: float = 0.2,
+                 encode: Optional[Callable[[List[str]], np.ndarray]] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Select, de-duplicate and trim retrieved chunks so the context fits token_budget.
+
+    chunks need an 'embedding' (see DocumentStore.search_database(return_embeddings=True)).
+    If `encode` is given, each selected chunk is cut down to its sentences whose
+    similarity to the query is at least sentence_threshold (and to what still fits
+    the budget). Returns the packed chunks and a report of what was dropped.
+    """
+    report = {'candidates': len(chunks), 'duplicates_dropped': 0, 'selected': 0,
+              'context_tokens_before': sum(estimate_tokens(c['text']) for c in chunks), 'context_tokens': 0}
+    if not chunks:
+        return [], report
+
+    order, report['duplicates_dropped'] = mmr_select(
+        query_embedding, np.stack([c['embedding'] for c in chunks]), max_chunks, lambda_mult, duplicate_threshold)
+    selected = [chunks[i] for i in order]
+    texts = remove_repeated_lines([c['text'] for c in selected])
+
+    sentences = [[s for s in SENTENCE_SPLIT.split(text) if s.strip()] for text in texts]
+    scores = None
+    if encode is not None:
+        flat = [s for chunk_sentences in sentences for s in chunk_sentences]
+        sentence_scores = list(encode(flat) @ query_embedding) if flat else []
+        scores, offset = [], 0
+        for chunk_sentences in sentences:
+            scores.append(sentence_scores[offset:offset + len(chunk_sentences)])
+            offset += len(chunk_sentences)
+
+    packed, used = [], 0
+    for i, chunk in enumerate(selected):
+        remaining = token_budget - used
+        if remaining <= 0:
+            break
+        if scores is not None:
+            relevant = [(s, score) for s, score in zip(sentences[i], scores[i]) if score >= sentence_threshold]
+            if not relevant:
+                relevant = list(zip(sentences[i], scores[i]))
+            text = _fit_sentences([s for s, _ in relevant], [score for _, score in relevant], remaining)
+        elif estimate_tokens(texts[i]) <= remaining:
+            text = texts[i]
+        else:
+            # No sentence scores: keep leading sentences that fit.
+            text = _fit_sentences(sentences[i], [-j for j in range(len(sentences[i]))], remaining)
+        if not text.strip():
+            continue
+        used += estimate_tokens(text)
+        packed.append({'text': text, 'language': chunk['language']})
+
+    report['selected'] = len(packed)
+    report['context_tokens'] = used
+    return packed, report
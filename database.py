@@ -1,14 +1,180 @@
 # database.py
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import uuid
+import weakref
 import faiss
 import numpy as np
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+from metrics import timed
+
+# 'flat' keeps full float32 vectors in RAM (exact search, ~3 KB per 768-dim chunk).
+# The compressed modes keep only short codes in RAM and re-rank the top candidates
+# against the exact vectors, which are stored on disk.
+INDEX_TYPES = ('flat', 'fp16', 'sq8', 'ivfpq', 'opqpq')
+
+# Written last by DocumentStore.save(); names the files of the current checkpoint.
+CHECKPOINT_FILE = 'checkpoint.json'
+
+def _remove_file(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+def _check_size(path: str, size: int) -> None:
+    """A file shorter than its checkpoint records means the checkpoint is damaged"""
+    actual = os.path.getsize(path)
+    if actual < size:
+        raise ValueError(f"{path} has {actual} bytes, the checkpoint expects {size}")
+
+def _read_checkpoint(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(path, CHECKPOINT_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def checkpoint_exists(path: str) -> bool:
+    """Whether DocumentStore.save() has written a checkpoint to the directory `path`"""
+    return os.path.exists(os.path.join(path, CHECKPOINT_FILE))
+
+class VectorFile:
+    """
+    Append-only file of float32 vectors, read back through a memory map
+    so only the rows being re-ranked are paged in. Without a `path` the
+    vectors go to a temporary file, deleted when the VectorFile is discarded,
+    garbage collected or at interpreter exit, whichever comes first. With a
+    `count`, only the first `count` rows of the file are used; appends
+    overwrite anything after them.
+    """
+    def __init__(self, dimension: int, path: Optional[str] = None, count: Optional[int] = None):
+        self._finalizer = None
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix='vectors_', suffix='.f32')
+            os.close(fd)
+            self._finalizer = weakref.finalize(self, _remove_file, path)
+        self.path = path
+        self.dimension = dimension
+        if count is None:
+            count = os.path.getsize(path) // (4 * dimension) if os.path.exists(path) else 0
+        self.count = count
+        self._mmap = None
+
+    def append(self, vectors: np.ndarray) -> None:
+        with open(self.path, 'r+b' if os.path.exists(self.path) else 'wb') as f:
+            f.seek(self.count * 4 * self.dimension)
+            f.write(np.ascontiguousarray(vectors, dtype='float32').tobytes())
+        self.count += len(vectors)
+        self._mmap = None
+
+    def get(self, ids) -> np.ndarray:
+        if self._mmap is None:
+            self._mmap = np.memmap(self.path, dtype='float32', mode='r',
+                                   shape=(self.count, self.dimension))
+        return np.asarray(self._mmap[ids])
+
+    def sample(self, n: int, seed: int = 0) -> np.ndarray:
+        if n >= self.count:
+            return self.get(slice(0, self.count))
+        ids = np.sort(np.random.default_rng(seed).choice(self.count, n, replace=False))
+        return self.get(ids)
+
+    def discard(self) -> None:
+        """Delete the file if it is a temporary one; saved vector files are left alone"""
+        self._mmap = None
+        if self._finalizer is not None:
+            self._finalizer()
 
 class DocumentStore:
-    def __init__(self):
+    def __init__(self, index_type: str = 'flat', code_size: int = 64, nlist: int = 256,
+                 nprobe: int = 16, rerank_k: int = 50, train_size: Optional[int] = None,
+                 vectors_path: Optional[str] = None):
+        """
+        index_type: one of INDEX_TYPES
+            flat  - exact IndexFlatL2 (default)
+            fp16  - scalar quantization to float16 (2 bytes per dimension)
+            sq8   - scalar quantization to int8 (1 byte per dimension)
+            ivfpq - IVF with product quantization, `code_size` bytes per vector
+            opqpq - OPQ rotation followed by IVF-PQ, `code_size` bytes per vector
+        code_size: PQ bytes per vector; must divide the embedding dimension
+        rerank_k: candidates fetched from the compressed index and re-ranked exactly
+        train_size: vectors to collect before training a quantizer; until then
+            searches run exactly against the on-disk vectors
+        """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}'. Expected one of {INDEX_TYPES}")
+        self.index_type = index_type
+        self.code_size = code_size
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.rerank_k = rerank_k
+        self.train_size = train_size
+        self.vectors_path = vectors_path
+        self.vectors: Optional[VectorFile] = None
+
         self.index = None
         self.text_chunks: Dict[int, Dict[str, Any]] = {}
         self.current_id = 0
-    
+        self._fingerprint = hashlib.sha1()
+        # (directory, state) of the checkpoint last written or loaded, which save() appends to.
+        self._checkpoint = None
+
+    @property
+    def document_id(self) -> str:
+        """Fingerprint of the indexed content; changes whenever chunks are added or cleared"""
+        return self._fingerprint.hexdigest()
+
+    def clear(self) -> None:
+        """Drop all indexed chunks in place so every module holding this store sees the reset"""
+        if self.vectors is not None:
+            self.vectors.discard()
+        self.vectors = None
+        self.index = None
+        self.text_chunks = {}
+        self.current_id = 0
+        self._fingerprint = hashlib.sha1()
+        self._checkpoint = None
+
+    @property
+    def compressed(self) -> bool:
+        return self.index_type != 'flat'
+
+    def _required_train_size(self) -> int:
+        if self.train_size is not None:
+            return self.train_size
+        if self.index_type in ('ivfpq', 'opqpq'):
+            # faiss wants ~39 points per centroid: nlist coarse ones and 256 per PQ sub-quantizer
+            return max(self.nlist, 256) * 39
+        if self.index_type == 'sq8':
+            return 1000
+        return 0
+
+    def _create_index(self, dimension: int):
+        if self.index_type == 'flat':
+            return faiss.IndexFlatL2(dimension)
+        if self.index_type == 'fp16':
+            return faiss.index_factory(dimension, 'SQfp16')
+        if self.index_type == 'sq8':
+            return faiss.index_factory(dimension, 'SQ8')
+        if dimension % self.code_size != 0:
+            raise ValueError(f"code_size {self.code_size} must divide the embedding dimension {dimension}")
+        prefix = f'OPQ{self.code_size},' if self.index_type == 'opqpq' else ''
+        index = faiss.index_factory(dimension, f'{prefix}IVF{self.nlist},PQ{self.code_size}')
+        faiss.ParameterSpace().set_index_parameter(index, 'nprobe', self.nprobe)
+        return index
+
+    def _train_if_ready(self) -> None:
+        if self.index.is_trained or self.vectors.count < self._required_train_size():
+            return
+        self.index.train(self.vectors.sample(self._required_train_size() * 4))
+        # Everything collected so far goes in at once, in id order.
+        for start in range(0, self.vectors.count, 65536):
+            self.index.add(self.vectors.get(slice(start, min(start + 65536, self.vectors.count))))
+
     def add_to_database(self, embedded_dict: Dict[str, List[Dict[str, Any]]]) -> None:
         """
         Add embeddings and their corresponding text to the database
@@ -23,38 +189,282 @@ class DocumentStore:
             ]
         }
         """
-        for page, chunks in embedded_dict.items():
-            embeddings = []
-            for chunk in chunks:
-                embeddings.append(chunk['embedding'])
-                self.text_chunks[self.current_id] = {
-                    'text': chunk['text'],
-                    'language': chunk['language']
-                }
-                self.current_id += 1
-            
-            embeddings_array = np.array(embeddings)
-            
-            if self.index is None and len(embeddings) > 0:
-                dimension = embeddings_array.shape[1]
-                self.index = faiss.IndexFlatL2(dimension)
-            
-            if len(embeddings) > 0:
-                self.index.add(embeddings_array)
-    
-    def search_database(self, query_embedding: np.ndarray, k: int = 3) -> List[Dict[str, Any]]:
+        with timed('index_add', index_type=self.index_type):
+            for page, chunks in embedded_dict.items():
+                embeddings = []
+                for chunk in chunks:
+                    embeddings.append(chunk['embedding'])
+                    self.text_chunks[self.current_id] = {
+                        'text': chunk['text'],
+                        'language': chunk['language']
+                    }
+                    self._fingerprint.update(chunk['text'].encode('utf-8'))
+                    self.current_id += 1
 
-        if self.index is None:
-            return []
-            
-        D, I = self.index.search(np.array([query_embedding]), k)
-        
+                embeddings_array = np.array(embeddings, dtype='float32')
+
+                if self.index is None and len(embeddings) > 0:
+                    dimension = embeddings_array.shape[1]
+                    self.index = self._create_index(dimension)
+                    if self.compressed:
+                        self.vectors = VectorFile(dimension, self.vectors_path)
+
+                if len(embeddings) == 0:
+                    continue
+
+                if not self.compressed:
+                    self.index.add(embeddings_array)
+                    continue
+
+                self.vectors.append(embeddings_array)
+                if self.index.is_trained:
+                    self.index.add(embeddings_array)
+                else:
+                    self._train_if_ready()
+
+    def _rerank(self, query: np.ndarray, candidate_ids: np.ndarray, k: int) -> np.ndarray:
+        candidate_ids = candidate_ids[candidate_ids >= 0]
+        if len(candidate_ids) == 0:
+            return candidate_ids
+        exact = self.vectors.get(np.sort(candidate_ids))
+        distances = ((exact - query) ** 2).sum(axis=1)
+        return np.sort(candidate_ids)[np.argsort(distances)[:k]]
+
+    def _search_ids(self, queries: np.ndarray, k: int) -> List[np.ndarray]:
+        """Chunk ids of the k nearest neighbours for each row of `queries`, in one index call"""
+        if not self.compressed:
+            _, I = self.index.search(queries, k)
+            return list(I)
+        if not self.index.is_trained:
+            # Too few vectors to train a quantizer yet: exact scan of the on-disk vectors.
+            every_id = np.arange(self.vectors.count)
+            return [self._rerank(query, every_id, k) for query in queries]
+        _, I = self.index.search(queries, max(k, self.rerank_k))
+        return [self._rerank(query, candidates, k) for query, candidates in zip(queries, I)]
+
+    def get_embeddings(self, ids) -> np.ndarray:
+        """Exact stored vectors for the given chunk ids"""
+        ids = [int(idx) for idx in ids]
+        if self.compressed:
+            return self.vectors.get(ids)
+        return np.stack([self.index.reconstruct(idx) for idx in ids])
+
+    def _chunks_for_ids(self, ids, return_embeddings: bool) -> List[Dict[str, Any]]:
+        ids = [idx for idx in ids if idx in self.text_chunks]
         relevant_chunks = [
             {
+                'id': int(idx),
                 'text': self.text_chunks[idx]['text'],
                 'language': self.text_chunks[idx]['language']
-            } for idx in I[0] if idx in self.text_chunks
+            } for idx in ids
         ]
+        if return_embeddings and relevant_chunks:
+            for chunk, embedding in zip(relevant_chunks, self.get_embeddings(ids)):
+                chunk['embedding'] = embedding
         return relevant_chunks
 
-document_store = DocumentStore()
\ No newline at end of file
+    def search_database(self, query_embedding: np.ndarray, k: int = 3,
+                        return_embeddings: bool = False) -> List[Dict[str, Any]]:
+
+        if self.index is None:
+            return []
+
+        with timed('index_search', index_type=self.index_type):
+            ids = self._search_ids(np.asarray([query_embedding], dtype='float32'), k)[0]
+        return self._chunks_for_ids(ids, return_embeddings)
+
+    def search_batch(self, query_embeddings: np.ndarray, k: int = 3,
+                     return_embeddings: bool = False) -> List[List[Dict[str, Any]]]:
+        """search_database for many queries with a single index search"""
+        if self.index is None:
+            return [[] for _ in query_embeddings]
+
+        with timed('index_search', index_type=self.index_type, batch='true'):
+            all_ids = self._search_ids(np.asarray(query_embeddings, dtype='float32'), k)
+        return [self._chunks_for_ids(ids, return_embeddings) for ids in all_ids]
+
+    def save(self, path: str, metadata: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Write a checkpoint of the store to the directory `path`. `metadata` is
+        stored with it and returned by load().
+
+        Chunk texts and exact vectors go to append-only files, so saving again
+        to the same path only writes what was added since the last checkpoint
+        (the compressed modes also rewrite their index, code_size bytes per
+        vector). The checkpoint itself is CHECKPOINT_FILE, which records the
+        row counts and is replaced with a single rename as the last step: an
+        interrupted save leaves the previous checkpoint in effect, and load()
+        ignores any rows written after it.
+        """
+        os.makedirs(path, exist_ok=True)
+        previous = _read_checkpoint(path)
+        # Append to the files of the checkpoint this store last wrote or loaded, if it is
+        # still the current one; otherwise start a new set so the current one stays intact.
+        if previous is not None and self._checkpoint == (os.path.abspath(path), previous):
+            generation = previous['generation']
+            chunk_count, chunk_bytes, vector_count = (previous['chunk_count'], previous['chunk_bytes'],
+                                                      previous['vector_count'])
+        else:
+            generation = uuid.uuid4().hex[:8]
+            chunk_count = chunk_bytes = vector_count = 0
+        chunks_file = f'chunks-{generation}.jsonl'
+        vectors_file = f'vectors-{generation}.f32'
+
+        with open(os.path.join(path, chunks_file), 'ab') as f:
+            f.truncate(chunk_bytes)
+            for idx in range(chunk_count, self.current_id):
+                f.write((json.dumps(self.text_chunks[idx], ensure_ascii=False) + '\n').encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        chunk_bytes = os.path.getsize(os.path.join(path, chunks_file))
+
+        dimension = self.index.d if self.index is not None else None
+        index_file = None
+        if dimension is not None:
+            target = os.path.join(path, vectors_file)
+            if not self.compressed:
+                with open(target, 'ab') as f:
+                    f.truncate(vector_count * 4 * dimension)
+                    for start in range(vector_count, self.index.ntotal, 65536):
+                        f.write(self.index.reconstruct_n(start, min(65536, self.index.ntotal - start)).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                vector_count = self.index.ntotal
+            else:
+                if os.path.abspath(self.vectors.path) != os.path.abspath(target):
+                    shutil.copyfile(self.vectors.path, target)
+                    # Later additions append to the saved file directly.
+                    self.vectors.discard()
+                    self.vectors = VectorFile(dimension, target)
+                with open(target, 'rb') as f:
+                    os.fsync(f.fileno())
+                vector_count = self.vectors.count
+                index_file = f'index-{uuid.uuid4().hex[:8]}.faiss'
+                faiss.write_index(self.index, os.path.join(path, index_file))
+
+        state = {
+            'index_type': self.index_type,
+            'code_size': self.code_size,
+            'nlist': self.nlist,
+            'nprobe': self.nprobe,
+            'rerank_k': self.rerank_k,
+            'train_size': self.train_size,
+            'dimension': dimension,
+            'generation': generation,
+            'chunks_file': chunks_file,
+            'chunk_count': self.current_id,
+            'chunk_bytes': chunk_bytes,
+            'vectors_file': vectors_file if dimension is not None else None,
+            'vector_count': vector_count,
+            'index_file': index_file,
+            'ntotal': self.index.ntotal if self.index is not None else 0,
+            'metadata': metadata or {}
+        }
+        pointer = os.path.join(path, CHECKPOINT_FILE)
+        with open(pointer + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer + '.tmp', pointer)
+        self._checkpoint = (os.path.abspath(path), state)
+
+        if previous is not None:
+            stale = [previous.get('index_file')]
+            if previous['generation'] != generation:
+                stale += [previous['chunks_file'], previous.get('vectors_file')]
+            for name in stale:
+                if name and name not in (index_file, chunks_file, vectors_file):
+                    _remove_file(os.path.join(path, name))
+
+    def load(self, path: str) -> Dict[str, Any]:
+        """Replace this store's contents, in place, with a checkpoint written by save(); returns its metadata"""
+        state = _read_checkpoint(path)
+        if state is None:
+            raise FileNotFoundError(f"No {CHECKPOINT_FILE} in {path}")
+        self.clear()
+        for name in ('index_type', 'code_size', 'nlist', 'nprobe', 'rerank_k', 'train_size'):
+            setattr(self, name, state[name])
+
+        # Only what the checkpoint records is read: rows after it belong to a save that is
+        # still running (e.g. ingest.py on the same directory) or was interrupted. The
+        # files are never modified here; save() truncates them when it appends.
+        chunks_file = os.path.join(path, state['chunks_file'])
+        _check_size(chunks_file, state['chunk_bytes'])
+        with open(chunks_file, 'rb') as f:
+            lines = f.read(state['chunk_bytes']).decode('utf-8').split('\n')[:-1]
+        for idx, line in enumerate(lines):
+            self.text_chunks[idx] = json.loads(line)
+            self._fingerprint.update(self.text_chunks[idx]['text'].encode('utf-8'))
+        if len(self.text_chunks) != state['chunk_count']:
+            raise ValueError(f"{chunks_file} has {len(self.text_chunks)} chunks, "
+                             f"the checkpoint expects {state['chunk_count']}")
+        self.current_id = state['chunk_count']
+
+        dimension = state['dimension']
+        if dimension is not None:
+            vectors_file = os.path.join(path, state['vectors_file'])
+            _check_size(vectors_file, state['vector_count'] * 4 * dimension)
+            vectors = VectorFile(dimension, vectors_file, count=state['vector_count'])
+            if self.compressed:
+                self.index = faiss.read_index(os.path.join(path, state['index_file']))
+                self.vectors = vectors
+                if self.index_type in ('ivfpq', 'opqpq') and self.index.is_trained:
+                    faiss.ParameterSpace().set_index_parameter(self.index, 'nprobe', self.nprobe)
+            else:
+                self.index = faiss.IndexFlatL2(dimension)
+                for start in range(0, vectors.count, 65536):
+                    self.index.add(vectors.get(slice(start, min(start + 65536, vectors.count))))
+            if self.index.ntotal != state['ntotal']:
+                raise ValueError(f"Index in {path} has {self.index.ntotal} vectors, "
+                                 f"the checkpoint expects {state['ntotal']}")
+        self._checkpoint = (os.path.abspath(path), state)
+        return state['metadata']
+
+    def memory_bytes(self) -> int:
+        """Approximate in-RAM size of the vector index (excludes the on-disk vectors)"""
+        if self.index is None:
+            return 0
+        return int(faiss.serialize_index(self.index).nbytes)
+
+def search_stores(stores: List[DocumentStore], query_embeddings: np.ndarray, k: int = 3,
+                  return_embeddings: bool = False) -> List[List[Dict[str, Any]]]:
+    """search_batch over several stores, keeping the k nearest chunks of all of them per query"""
+    stores = [store for store in stores if store.index is not None]
+    if len(stores) <= 1:
+        if not stores:
+            return [[] for _ in query_embeddings]
+        return stores[0].search_batch(query_embeddings, k, return_embeddings)
+    queries = np.asarray(query_embeddings, dtype='float32')
+    merged = [[] for _ in queries]
+    for store in stores:
+        for hits, query, chunks in zip(merged, queries, store.search_batch(queries, k, return_embeddings=True)):
+            hits.extend((float(((chunk['embedding'] - query) ** 2).sum()), chunk) for chunk in chunks)
+    results = []
+    for hits in merged:
+        chunks = [chunk for _, chunk in sorted(hits, key=lambda hit: hit[0])[:k]]
+        if not return_embeddings:
+            for chunk in chunks:
+                del chunk['embedding']
+        results.append(chunks)
+    return results
+
+# The process's own documents (batch_qa, benchmarks). App sessions each index into a
+# store of their own from new_document_store(), so one user's reset leaves the others alone.
+document_store = DocumentStore(index_type=os.getenv('DOCUMENT_INDEX_TYPE', 'flat'))
+
+def new_document_store() -> DocumentStore:
+    """An empty store in the configured DOCUMENT_INDEX_TYPE"""
+    return DocumentStore(index_type=os.getenv('DOCUMENT_INDEX_TYPE', 'flat'))
+
+# A persisted index (e.g. written by ingest.py) to answer questions from as well, loaded at
+# startup. It is a separate store so clearing a session's documents leaves it in place.
+archive_store = DocumentStore(index_type=os.getenv('DOCUMENT_INDEX_TYPE', 'flat'))
+if os.getenv('DOCUMENT_INDEX_PATH') and checkpoint_exists(os.getenv('DOCUMENT_INDEX_PATH')):
+    archive_store.load(os.getenv('DOCUMENT_INDEX_PATH'))
+
+def indexed_document_id(store: Optional[DocumentStore] = None) -> str:
+    """Fingerprint of everything questions are answered from (`store` and the archive), for answer caching"""
+    store = store if store is not None else document_store
+    if archive_store.index is None:
+        return store.document_id
+    return hashlib.sha1(f'{store.document_id}:{archive_store.document_id}'.encode('utf-8')).hexdigest()
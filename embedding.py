@@ -1,12 +1,99 @@
 # embedding.py
 from sentence_transformers import SentenceTransformer
 import numpy as np
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
 import torch
 from text_extraction import LANGUAGE_MAP
+from metrics import timed, count
+from boilerplate import strip_boilerplate
+from profiling import profiled, short_hash
 
 model = SentenceTransformer('paraphrase-multilingual-mpnet-base-v2')
 
+class QueryEmbeddingCache:
+    """
+    Process-wide LRU cache of normalized query text -> embedding.
+    The cache is tied to one encoder object and empties itself when a different
+    encoder is used, so swapping the model never returns stale vectors.
+    """
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, np.ndarray]' = OrderedDict()
+        self._encoder = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _bind(self, encoder) -> None:
+        if encoder is not self._encoder:
+            self._entries.clear()
+            self._encoder = encoder
+
+    def get(self, encoder, key: str):
+        with self._lock:
+            self._bind(encoder)
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, encoder, key: str, embedding: np.ndarray) -> None:
+        with self._lock:
+            self._bind(encoder)
+            embedding.setflags(write=False)
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+query_embedding_cache = QueryEmbeddingCache(int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', '2048')))
+
+def normalize_query(text: str) -> str:
+    """NFC and collapsed whitespace; case is kept because the encoder is cased"""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+def encode_queries(texts: List[str], encoder=None) -> np.ndarray:
+    """
+    Normalized query embeddings, served from the LRU cache where possible;
+    misses are encoded together in one call
+    """
+    encoder = encoder or model
+    keys = [normalize_query(text) for text in texts]
+    embeddings = [query_embedding_cache.get(encoder, key) for key in keys]
+    missing = sorted({key for key, embedding in zip(keys, embeddings) if embedding is None})
+    if missing:
+        with timed('encode', kind='query'):
+            encoded = dict(zip(missing, encoder.encode(missing, batch_size=64, show_progress_bar=False,
+                                                       normalize_embeddings=True)))
+        for key, embedding in encoded.items():
+            query_embedding_cache.put(encoder, key, embedding)
+        embeddings = [encoded[key] if embedding is None else embedding for key, embedding in zip(keys, embeddings)]
+    return np.stack(embeddings)
+
+def encode_query(text: str, encoder=None) -> np.ndarray:
+    return encode_queries([text], encoder)[0]
+
 def chunk_text(text: str, chunk_size: int = 1000) -> List[str]:
     """
     Split text into smaller chunks while preserving sentence boundaries
@@ -34,18 +121,33 @@ def chunk_text(text: str, chunk_size: int = 1000) -> List[str]:
         
     return chunks
 
-def embed_text(text_dict: Dict[str, str], input_language: str) -> Dict[str, List[Dict[str, Any]]]:
+@profiled('embed', lambda text_dict, *args, **kwargs: short_hash(text_dict))
+def embed_text(text_dict: Dict[str, str], input_language: str,
+               stats: Optional[Dict[str, Any]] = None,
+               page_languages: Optional[Dict[Any, str]] = None) -> Dict[str, List[Dict[str, Any]]]:
     """
     Embed text and return both embeddings and their corresponding text chunks
-    with language information preserved
+    with language information preserved: a page's language from
+    `page_languages` (as detected during OCR), else `input_language`. Headers,
+    footers and other lines repeated across pages are left out of the chunks;
+    `stats`, if given, gets the bytes and chunks that saved.
     """
     embedded_dict = {}
     
     # Set larger batch size for efficiency
     batch_size = 32
     
-    for page, text in text_dict.items():
-        chunks = chunk_text(text)
+    with timed('boilerplate'):
+        cleaned_dict, boilerplate_stats = strip_boilerplate(text_dict)
+    chunks_saved = 0
+    
+    for page, text in cleaned_dict.items():
+        with timed('chunk'):
+            chunks = chunk_text(text)
+            if boilerplate_stats['lines']:
+                chunks_saved += len(chunk_text(text_dict[page])) - len(chunks)
+        count('chunks', len(chunks), stage='chunk')
+        page_language = (page_languages or {}).get(page, input_language)
         page_chunks = []
         
         # Process chunks in batches
@@ -54,21 +156,27 @@ def embed_text(text_dict: Dict[str, str], input_language: str) -> Dict[str, List
             
             # Generate embeddings for the batch
             try:
-                embeddings = model.encode(batch_chunks, 
-                                       batch_size=batch_size,
-                                       show_progress_bar=False,
-                                       normalize_embeddings=True)  # Normalize for better cross-lingual matching
+                with timed('encode', kind='document'):
+                    embeddings = model.encode(batch_chunks, 
+                                           batch_size=batch_size,
+                                           show_progress_bar=False,
+                                           normalize_embeddings=True)  # Normalize for better cross-lingual matching
                 
                 for chunk, embedding in zip(batch_chunks, embeddings):
                     page_chunks.append({
                         'text': chunk,
                         'embedding': embedding,
-                        'language': input_language
+                        'language': page_language
                     })
             except Exception as e:
                 print(f"Error encoding batch: {str(e)}")
                 continue
             
         embedded_dict[page] = page_chunks
+    
+    count('boilerplate_bytes', boilerplate_stats['bytes_removed'], stage='chunk')
+    count('chunks_saved', chunks_saved, stage='chunk')
+    if stats is not None:
+        stats['boilerplate'] = dict(boilerplate_stats, chunks_saved=chunks_saved)
         
     return embedded_dict
\ No newline at end of file
@@ -2,18 +2,50 @@ import firebase_admin
 from firebase_admin import credentials, auth, firestore
 import streamlit as st
 import os
+import threading
+import time
+
+# Overridable so deployments (and the emulator) don't depend on a developer's path.
+CREDENTIALS_PATH = os.getenv('FIREBASE_CREDENTIALS', r'D:\mega project gemini\mega-project-gemini-46ed099384d9.json')
+# Seconds a session reuses the profile it read before asking Firestore again.
+USER_INFO_TTL = float(os.getenv('USER_INFO_TTL', '300'))
+
+_db = None
+_db_lock = threading.Lock()
+# Document reads and writes issued by this process, for load tests and operators.
+firestore_stats = {'reads': 0, 'writes': 0}
+_stats_lock = threading.Lock()
+
+def _count(kind):
+    # Sessions run on separate threads, so the counters are updated under a lock.
+    with _stats_lock:
+        firestore_stats[kind] += 1
 
 def initialize_firebase():
     """Initialize Firebase Admin SDK if not already initialized"""
     try:
         if not firebase_admin._apps:
-            cred = credentials.Certificate('D:\mega project gemini\mega-project-gemini-46ed099384d9.json')
-            firebase_admin.initialize_app(cred)
+            if os.getenv('FIRESTORE_EMULATOR_HOST'):
+                # The emulator accepts any project id and needs no service account.
+                firebase_admin.initialize_app(options={'projectId': os.getenv('FIREBASE_PROJECT_ID', 'demo-veda')})
+            else:
+                cred = credentials.Certificate(CREDENTIALS_PATH)
+                firebase_admin.initialize_app(cred)
         return True
     except Exception as e:
         st.error(f"Firebase initialization error: {e}")
         return False
 
+def get_db():
+    """One Firestore client for the whole process, shared by every session"""
+    global _db
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                initialize_firebase()
+                _db = firestore.client()
+    return _db
+
 def signup(email, password, name):
     """Create a new user account and store in Firestore"""
     try:
@@ -23,9 +55,7 @@ def signup(email, password, name):
             display_name=name
         )
         
-        db = firestore.client()
-        
-        users_ref = db.collection('user')
+        users_ref = get_db().collection('user')
         users_ref.document(user.uid).set({
             'name': name,
             'email': email,
@@ -33,7 +63,10 @@ def signup(email, password, name):
             'last_login': firestore.SERVER_TIMESTAMP,
             'password': password
         })
+        _count('writes')
         
+        # The new session starts with the profile it just wrote, so no read is needed.
+        _cache_user_info(user.uid, {'name': name, 'email': email})
         return user
     except Exception as e:
         st.error(f"Signup error: {str(e)}")
@@ -44,11 +77,12 @@ def login(email, password):
     try:
         user = auth.get_user_by_email(email)
         
-        db = firestore.client()
-        users_ref = db.collection('user').document(user.uid)
+        users_ref = get_db().collection('user').document(user.uid)
         users_ref.update({
             'last_login': firestore.SERVER_TIMESTAMP
         })
+        _count('writes')
+        invalidate_user_info()
         
         return user
     except ValueError as e:
@@ -64,14 +98,42 @@ def reset_password(email):
         st.error(f"Password reset error: {str(e)}")
         return None
 
+def _cache_user_info(uid, info):
+    st.session_state.user_info_cache = {'uid': uid, 'info': info, 'fetched_at': time.monotonic()}
+
+def invalidate_user_info():
+    """Drop this session's cached profile; the next get_user_info() reads Firestore"""
+    if 'user_info_cache' in st.session_state:
+        del st.session_state['user_info_cache']
+
+def update_user_info(fields):
+    """Update the logged-in user's profile and invalidate the cached copy"""
+    try:
+        get_db().collection('user').document(st.session_state.user.uid).update(fields)
+        _count('writes')
+        invalidate_user_info()
+        return True
+    except Exception as e:
+        st.error(f"Error updating user info: {str(e)}")
+        return False
+
 def get_user_info():
-    """Get current logged-in user's information from Firestore"""
+    """
+    Get current logged-in user's information. Cached per session for
+    USER_INFO_TTL seconds, so ordinary reruns don't read Firestore.
+    """
     try:
         if 'user' in st.session_state and st.session_state.user:
-            db = firestore.client()
-            user_doc = db.collection('user').document(st.session_state.user.uid).get()
-            return user_doc.to_dict() if user_doc.exists else None
+            uid = st.session_state.user.uid
+            cached = st.session_state.get('user_info_cache')
+            if cached and cached['uid'] == uid and time.monotonic() - cached['fetched_at'] < USER_INFO_TTL:
+                return cached['info']
+            user_doc = get_db().collection('user').document(uid).get()
+            _count('reads')
+            info = user_doc.to_dict() if user_doc.exists else None
+            _cache_user_info(uid, info)
+            return info
         return None
     except Exception as e:
         st.error(f"Error retrieving user info: {str(e)}")
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,290 @@
+# ingest.py
+"""
+Headless ingestion: extract text from many documents, embed it and add it to a
+persisted DocumentStore index that the Q&A path loads via DOCUMENT_INDEX_PATH.
+
+Extraction (OCR) runs in a pool of worker processes; embedding and indexing
+run in the main process so the model and the index are loaded once. The index
+is saved every --checkpoint-every documents together with the list of files it
+contains, so an interrupted run picks up where the last checkpoint left off.
+
+Usage:
+    python ingest.py run --input scans/ --language Marathi --index archive_index --workers 4
+    python ingest.py run --input manifest.jsonl --index archive_index
+    python ingest.py serve --index archive_index --port 8780
+    DOCUMENT_INDEX_PATH=archive_index streamlit run signup.py
+
+A manifest has one path per line, or JSONL with {"path": ..., "language": ...}.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.png', '.jpg', '.jpeg', '.docx')
+# extract_text reports failures as a single page starting with one of these.
+EXTRACTION_ERRORS = ('Error processing', 'Unsupported file type')
+
+def list_inputs(source: str, language: str) -> List[Dict[str, str]]:
+    """Files under a directory, or the entries of a manifest file"""
+    if os.path.isdir(source):
+        items = []
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS:
+                    items.append({'path': os.path.join(root, name), 'language': language})
+        return sorted(items, key=lambda item: item['path'])
+
+    items = []
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line) if line.startswith('{') else {'path': line}
+            path = record['path'] if os.path.isabs(record['path']) else os.path.join(base, record['path'])
+            items.append({'path': path, 'language': record.get('language', language)})
+    return items
+
+def _extract(path: str, language: str) -> Dict[str, Any]:
+    """Runs in a worker process"""
+    from text_extraction import extract_text
+    from utils import open_as_upload
+
+    start = time.perf_counter()
+    page_languages = {}
+    text_dict = extract_text(open_as_upload(path), language, page_languages=page_languages)
+    result = {'path': path, 'language': language, 'page_languages': page_languages,
+              'seconds': time.perf_counter() - start}
+    first_page = next(iter(text_dict.values()), '')
+    if len(text_dict) == 1 and first_page.startswith(EXTRACTION_ERRORS):
+        result['error'] = first_page
+    else:
+        result['text_dict'] = text_dict
+    return result
+
+class IngestStats:
+    def __init__(self, total: int, skipped: int):
+        self.total = total
+        self.skipped = skipped
+        self.documents = 0
+        self.pages = 0
+        self.chunks = 0
+        self.boilerplate_bytes = 0
+        self.chunks_saved = 0
+        self.failed: List[Dict[str, str]] = []
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        minutes = elapsed / 60 if elapsed else 0.0
+        return {
+            'total': self.total,
+            'skipped': self.skipped,
+            'documents': self.documents,
+            'failed': len(self.failed),
+            'pages': self.pages,
+            'chunks': self.chunks,
+            'boilerplate_bytes': self.boilerplate_bytes,
+            'chunks_saved': self.chunks_saved,
+            'seconds': round(elapsed, 1),
+            'docs_per_minute': round(self.documents / minutes, 1) if minutes else 0.0,
+            'pages_per_minute': round(self.pages / minutes, 1) if minutes else 0.0,
+            'done': self.finished is not None
+        }
+
+def ingest(inputs: List[Dict[str, str]], index_path: str, workers: int = 4, checkpoint_every: int = 50,
+           on_progress: Optional[Callable[[IngestStats], None]] = None) -> IngestStats:
+    """
+    Extract, embed and index `inputs` into the store persisted at `index_path`.
+    Files already in that index are skipped; failures are logged and retried
+    on the next run.
+    """
+    from database import DocumentStore, checkpoint_exists
+    from embedding import embed_text
+
+    document_store = DocumentStore(index_type=os.getenv('DOCUMENT_INDEX_TYPE', 'flat'))
+    metadata = {}
+    if checkpoint_exists(index_path):
+        metadata = document_store.load(index_path)
+    sources = metadata.get('sources', [])
+    done = set(sources)
+    remaining = [item for item in inputs if item['path'] not in done]
+    stats = IngestStats(len(inputs), len(inputs) - len(remaining))
+    logger.info(f"{len(inputs)} documents, {stats.skipped} already indexed, {len(remaining)} to go")
+
+    def checkpoint():
+        document_store.save(index_path, {'sources': sources})
+
+    since_checkpoint = 0
+    work = iter(remaining)
+    # Spawned, not forked: this process has torch and the embedding model loaded by now,
+    # and forking after torch can deadlock the OCR workers.
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        pending = {}
+
+        def submit_next() -> None:
+            item = next(work, None)
+            if item is not None:
+                pending[executor.submit(_extract, item['path'], item['language'])] = item['path']
+
+        # A bounded window keeps extracted text for at most a few documents in memory.
+        for _ in range(workers * 2):
+            submit_next()
+
+        while pending:
+            finished, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in finished:
+                path = pending.pop(future)
+                submit_next()
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'path': path, 'error': str(e)}
+                # OCR runs in the worker processes, so their stage timings stay there;
+                # record the per-document extraction time here.
+                metrics.observe('extract_document', result.get('seconds', 0.0))
+                if 'error' in result:
+                    logger.warning(f"Failed to extract {result['path']}: {result['error']}")
+                    stats.failed.append({'path': result['path'], 'error': result['error']})
+                    continue
+
+                embed_stats = {}
+                embedded = embed_text(result['text_dict'], result['language'], stats=embed_stats,
+                                      page_languages=result['page_languages'])
+                document_store.add_to_database(embedded)
+                sources.append(result['path'])
+                stats.documents += 1
+                stats.pages += len(result['text_dict'])
+                stats.chunks += sum(len(chunks) for chunks in embedded.values())
+                stats.boilerplate_bytes += embed_stats['boilerplate']['bytes_removed']
+                stats.chunks_saved += embed_stats['boilerplate']['chunks_saved']
+                since_checkpoint += 1
+                if since_checkpoint >= checkpoint_every:
+                    checkpoint()
+                    since_checkpoint = 0
+                    logger.info(f"Checkpoint: {stats.as_dict()}")
+                if on_progress is not None:
+                    on_progress(stats)
+
+    if since_checkpoint or not checkpoint_exists(index_path):
+        checkpoint()
+    stats.finished = time.perf_counter()
+    if on_progress is not None:
+        on_progress(stats)
+    return stats
+
+class IngestService:
+    """Runs submitted ingestion jobs one at a time against a single index"""
+    def __init__(self, index_path: str, workers: int, checkpoint_every: int):
+        self.index_path = index_path
+        self.workers = workers
+        self.checkpoint_every = checkpoint_every
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, source: str, language: str) -> str:
+        job_id = uuid.uuid4().hex
+        self.jobs[job_id] = {'id': job_id, 'source': source, 'status': 'queued'}
+        threading.Thread(target=self._run, args=(job_id, source, language), daemon=True).start()
+        return job_id
+
+    def _run(self, job_id: str, source: str, language: str) -> None:
+        job = self.jobs[job_id]
+        with self._lock:
+            job['status'] = 'running'
+            try:
+                stats = ingest(list_inputs(source, language), self.index_path, self.workers,
+                               self.checkpoint_every, on_progress=lambda s: job.update(progress=s.as_dict()))
+                job['failed'] = stats.failed
+                job['status'] = 'done'
+            except Exception as e:
+                logger.error(f"Ingestion job {job_id} failed: {str(e)}")
+                job['error'] = str(e)
+                job['status'] = 'failed'
+
+class IngestHandler(BaseHTTPRequestHandler):
+    service: IngestService = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload: Any, status: int = 200) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        # POST /jobs {"input": <directory or manifest>, "language": ...} -> {"id": ...}
+        if self.path != '/jobs':
+            self._send_json({'error': f'Unknown path {self.path}'}, status=404)
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        request = json.loads(self.rfile.read(length) or b'{}')
+        if not request.get('input') or not os.path.exists(request['input']):
+            self._send_json({'error': 'input must be an existing directory or manifest'}, status=400)
+            return
+        job_id = self.service.submit(request['input'], request.get('language', 'English'))
+        self._send_json({'id': job_id}, status=202)
+
+    def do_GET(self):
+        # GET /jobs lists every job; GET /jobs/<id> returns one with its progress.
+        if self.path == '/jobs':
+            self._send_json(list(self.service.jobs.values()))
+        elif self.path.startswith('/jobs/') and self.path[len('/jobs/'):] in self.service.jobs:
+            self._send_json(self.service.jobs[self.path[len('/jobs/'):]])
+        else:
+            self._send_json({'error': f'Unknown path {self.path}'}, status=404)
+
+def main():
+    parser = argparse.ArgumentParser(description='Batch document ingestion into a persisted index')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='ingest a directory or manifest and exit')
+    run_parser.add_argument('--input', required=True, help='directory of documents or manifest file')
+    run_parser.add_argument('--language', default='English', help='document language (manifest entries may override)')
+
+    serve_parser = subparsers.add_parser('serve', help='local HTTP API that accepts ingestion jobs')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8780)
+
+    for sub in (run_parser, serve_parser):
+        sub.add_argument('--index', default=os.getenv('DOCUMENT_INDEX_PATH', 'document_index'),
+                         help='directory the index is saved to and resumed from')
+        sub.add_argument('--workers', type=int, default=os.cpu_count() or 4, help='extraction processes')
+        sub.add_argument('--checkpoint-every', type=int, default=50, help='documents between index saves')
+    args = parser.parse_args()
+
+    metrics.start_metrics_server()
+    if args.command == 'run':
+        stats = ingest(list_inputs(args.input, args.language), args.index, args.workers, args.checkpoint_every)
+        print(json.dumps(stats.as_dict()))
+        if metrics.METRICS_ENABLED:
+            print(json.dumps(metrics.snapshot()))
+        for failure in stats.failed:
+            print(json.dumps(failure, ensure_ascii=False))
+    else:
+        IngestHandler.service = IngestService(args.index, args.workers, args.checkpoint_every)
+        server = ThreadingHTTPServer((args.host, args.port), IngestHandler)
+        logger.info(f"Ingestion API listening on http://{args.host}:{args.port}")
+        server.serve_forever()
+
+if __name__ == '__main__':
+    main()
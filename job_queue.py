@@ -0,0 +1,395 @@
+# job_queue.py
+"""
+Durable local job queue (SQLite) for document processing.
+
+The Streamlit app enqueues OCR ('extract') and embedding ('embed') jobs and
+polls them; worker processes claim jobs, run them and store the results. A
+claimed job holds a lease that its worker renews while it runs, so a job whose
+worker died (or whose app was restarted) is picked up again once the lease
+runs out. Extracted pages are stored as they finish, so the UI can show them
+before the whole document is done.
+
+Usage:
+    python job_queue.py worker --processes 2
+    JOB_WORKERS=0 streamlit run signup.py     # rely on separately started workers
+"""
+import argparse
+import atexit
+import json
+import logging
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import metrics
+import profiling
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+JOB_QUEUE_PATH = os.getenv('JOB_QUEUE_PATH', os.path.join('.cache', 'jobs.sqlite3'))
+JOB_FILES_DIR = os.getenv('JOB_FILES_DIR', os.path.join('.cache', 'jobs'))
+# Seconds a worker may go without renewing its lease before the job is retried.
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '60'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+# Worker processes the app starts for itself; 0 if workers are run separately.
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+
+class JobQueue:
+    def __init__(self, path: str = JOB_QUEUE_PATH, files_dir: str = JOB_FILES_DIR):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        os.makedirs(files_dir, exist_ok=True)
+        self.path = path
+        self.files_dir = files_dir
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                progress TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                lease_expires REAL,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            )''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS job_pages (
+                job_id TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                PRIMARY KEY (job_id, page)
+            )''')
+
+    def job_dir(self, job_id: str) -> str:
+        return os.path.join(self.files_dir, job_id)
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], files: Optional[Dict[str, bytes]] = None) -> str:
+        """Add a job; `files` are written to the job's directory before it becomes claimable"""
+        job_id = uuid.uuid4().hex
+        if files:
+            os.makedirs(self.job_dir(job_id), exist_ok=True)
+            for name, data in files.items():
+                with open(os.path.join(self.job_dir(job_id), name), 'wb') as f:
+                    f.write(data)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO jobs (id, kind, status, payload, created, updated) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, kind, QUEUED, json.dumps(payload, ensure_ascii=False), now, now))
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT id, kind, status, payload, progress, error, attempts FROM jobs WHERE id=?',
+                (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row[0],
+            'kind': row[1],
+            'status': row[2],
+            'payload': json.loads(row[3]),
+            'progress': json.loads(row[4]) if row[4] else {},
+            'error': row[5],
+            'attempts': row[6]
+        }
+
+    def claim(self, worker: str, kinds: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Take the oldest queued job, or a running one whose lease expired. Expired
+        jobs that have used up JOB_MAX_ATTEMPTS are marked failed instead.
+        """
+        now = time.time()
+        kind_filter = ''
+        params: List[Any] = [QUEUED, RUNNING, now]
+        if kinds:
+            kind_filter = f" AND kind IN ({','.join('?' * len(kinds))})"
+            params.extend(kinds)
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                # A job whose worker keeps dying (e.g. killed for memory) must not be retried forever.
+                self._conn.execute(
+                    'UPDATE jobs SET status=?, error=?, lease_expires=NULL, updated=? '
+                    'WHERE status=? AND lease_expires < ? AND attempts >= ?',
+                    (FAILED, f'Worker lost after {JOB_MAX_ATTEMPTS} attempts', now, RUNNING, now, JOB_MAX_ATTEMPTS))
+                row = self._conn.execute(
+                    f'''SELECT id FROM jobs WHERE (status=? OR (status=? AND lease_expires < ?)){kind_filter}
+                        ORDER BY created LIMIT 1''', params).fetchone()
+                if row is None:
+                    self._conn.execute('COMMIT')
+                    return None
+                self._conn.execute(
+                    'UPDATE jobs SET status=?, worker=?, lease_expires=?, attempts=attempts+1, updated=? WHERE id=?',
+                    (RUNNING, worker, now + JOB_LEASE_SECONDS, now, row[0]))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return self.get(row[0])
+
+    def renew(self, job_id: str, worker: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute('UPDATE jobs SET lease_expires=?, updated=? WHERE id=? AND worker=? AND status=?',
+                               (now + JOB_LEASE_SECONDS, now, job_id, worker, RUNNING))
+
+    def set_progress(self, job_id: str, progress: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute('UPDATE jobs SET progress=?, updated=? WHERE id=?',
+                               (json.dumps(progress), time.time(), job_id))
+
+    def add_page(self, job_id: str, page: int, text: str) -> None:
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO job_pages VALUES (?, ?, ?)', (job_id, page, text))
+
+    def clear_pages(self, job_id: str) -> None:
+        with self._lock:
+            self._conn.execute('DELETE FROM job_pages WHERE job_id=?', (job_id,))
+
+    def pages(self, job_id: str) -> Dict[int, str]:
+        """Pages stored so far, in page order"""
+        with self._lock:
+            rows = self._conn.execute('SELECT page, text FROM job_pages WHERE job_id=? ORDER BY page',
+                                      (job_id,)).fetchall()
+        return {page: text for page, text in rows}
+
+    def complete(self, job_id: str, worker: str) -> None:
+        """Mark the job done, unless another worker has taken it over since `worker` claimed it"""
+        with self._lock:
+            updated = self._conn.execute(
+                'UPDATE jobs SET status=?, error=NULL, lease_expires=NULL, updated=? WHERE id=? AND worker=?',
+                (DONE, time.time(), job_id, worker)).rowcount
+        if not updated:
+            logger.warning(f"Job {job_id} was taken over by another worker; not marking it done")
+
+    def fail(self, job_id: str, worker: str, error: str) -> None:
+        """Requeue the job, or mark it failed once it has used up JOB_MAX_ATTEMPTS"""
+        with self._lock:
+            row = self._conn.execute('SELECT attempts FROM jobs WHERE id=? AND worker=?', (job_id, worker)).fetchone()
+            if row is None:
+                logger.warning(f"Job {job_id} was taken over by another worker; not recording its failure")
+                return
+            status = FAILED if row[0] >= JOB_MAX_ATTEMPTS else QUEUED
+            self._conn.execute(
+                'UPDATE jobs SET status=?, error=?, lease_expires=NULL, updated=? WHERE id=? AND worker=?',
+                (status, error, time.time(), job_id, worker))
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        return dict(rows)
+
+def save_embeddings(path: str, embedded_dict: Dict[Any, List[Dict[str, Any]]]) -> None:
+    """Write embed_text output as chunks.json plus embeddings.npy in directory `path`"""
+    os.makedirs(path, exist_ok=True)
+    chunks = [{'page': page, 'text': chunk['text'], 'language': chunk['language']}
+              for page, page_chunks in embedded_dict.items() for chunk in page_chunks]
+    vectors = [chunk['embedding'] for page_chunks in embedded_dict.values() for chunk in page_chunks]
+    np.save(os.path.join(path, 'embeddings.npy'), np.asarray(vectors, dtype='float32'))
+    with open(os.path.join(path, 'chunks.json'), 'w', encoding='utf-8') as f:
+        json.dump(chunks, f, ensure_ascii=False)
+
+def load_embeddings(path: str) -> Dict[Any, List[Dict[str, Any]]]:
+    """Inverse of save_embeddings, in the format DocumentStore.add_to_database expects"""
+    with open(os.path.join(path, 'chunks.json'), encoding='utf-8') as f:
+        chunks = json.load(f)
+    vectors = np.load(os.path.join(path, 'embeddings.npy'))
+    embedded_dict: Dict[Any, List[Dict[str, Any]]] = {}
+    for chunk, vector in zip(chunks, vectors):
+        embedded_dict.setdefault(chunk['page'], []).append(
+            {'text': chunk['text'], 'embedding': vector, 'language': chunk['language']})
+    return embedded_dict
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_queue() -> JobQueue:
+    """The process-wide queue on JOB_QUEUE_PATH"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue()
+    return _queue
+
+def enqueue_extract(file_name: str, data: bytes, language: str) -> str:
+    payload = {'file_name': file_name, 'language': language, 'profile': profiling.current_mode()}
+    return get_queue().enqueue('extract', payload, files={file_name: data})
+
+def enqueue_embed(text_dict: Dict[int, str], language: str,
+                  page_languages: Optional[Dict[int, str]] = None) -> str:
+    payload = {'text_dict': text_dict, 'language': language, 'page_languages': page_languages or {},
+               'profile': profiling.current_mode()}
+    return get_queue().enqueue('embed', payload)
+
+def run_extract(queue: JobQueue, job: Dict[str, Any]) -> None:
+    from text_extraction import extract_text
+    from utils import open_as_upload
+
+    payload = job['payload']
+
+    pages_done = [0]
+
+    def on_page(page, text):
+        # Pages may finish out of order when they are grouped by OCR engine.
+        pages_done[0] += 1
+        queue.add_page(job['id'], page, text)
+        queue.set_progress(job['id'], {'pages_done': pages_done[0]})
+
+    page_languages = {}
+    with metrics.start_trace('extract') as trace:
+        text_dict = extract_text(open_as_upload(os.path.join(queue.job_dir(job['id']), payload['file_name'])),
+                                 payload['language'], on_page=on_page, page_languages=page_languages)
+    # Store the final result too: it may differ from the pages streamed so far
+    # (e.g. extraction failed after some pages and returned an error page).
+    queue.clear_pages(job['id'])
+    for page, text in text_dict.items():
+        queue.add_page(job['id'], page, text)
+    progress = {'pages_done': len(text_dict), 'page_languages': page_languages}
+    if trace is not None:
+        progress['trace'] = trace.summary()
+    queue.set_progress(job['id'], progress)
+
+def run_embed(queue: JobQueue, job: Dict[str, Any]) -> None:
+    from embedding import embed_text
+
+    payload = job['payload']
+    text_dict = {int(page): text for page, text in payload['text_dict'].items()}
+    page_languages = {int(page): language for page, language in payload.get('page_languages', {}).items()}
+    stats = {}
+    with metrics.start_trace('embed') as trace:
+        save_embeddings(queue.job_dir(job['id']),
+                        embed_text(text_dict, payload['language'], stats=stats, page_languages=page_languages))
+    if trace is not None:
+        stats['trace'] = trace.summary()
+    queue.set_progress(job['id'], stats)
+
+HANDLERS = {
+    'extract': run_extract,
+    'embed': run_embed
+}
+
+def work(poll_interval: float = 0.5, stop: Optional[threading.Event] = None) -> None:
+    """Claim and run jobs until `stop` is set (forever by default)"""
+    queue = get_queue()
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        job = queue.claim(worker)
+        if job is None:
+            stop.wait(poll_interval)
+            continue
+        logger.info(f"Worker {worker} running {job['kind']} job {job['id']} (attempt {job['attempts']})")
+        running = threading.Event()
+
+        def keep_lease(job_id=job['id'], running=running):
+            while not running.wait(JOB_LEASE_SECONDS / 3):
+                queue.renew(job_id, worker)
+
+        renewer = threading.Thread(target=keep_lease, daemon=True)
+        renewer.start()
+        try:
+            # The profiling flag of the request that queued the job, if any.
+            with profiling.profile_requests(job['payload'].get('profile')):
+                HANDLERS[job['kind']](queue, job)
+            queue.complete(job['id'], worker)
+        except Exception as e:
+            logger.error(f"{job['kind']} job {job['id']} failed: {str(e)}")
+            queue.fail(job['id'], worker, str(e))
+        finally:
+            running.set()
+            renewer.join()
+
+_workers: List[subprocess.Popen] = []
+
+def stop_workers(timeout: float = 5.0) -> None:
+    """Terminate the worker processes started by start_workers; runs at exit"""
+    for process in _workers:
+        if process.poll() is None:
+            process.terminate()
+    for process in _workers:
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    _workers.clear()
+
+atexit.register(stop_workers)
+
+def worker_peak_rss_mb() -> Dict[int, Optional[float]]:
+    """
+    High-water mark of resident memory (MB) of each running worker started by
+    start_workers, by pid; None where /proc is not available (non-Linux)
+    """
+    peaks = {}
+    for process in _workers:
+        if process.poll() is not None:
+            continue
+        peaks[process.pid] = None
+        try:
+            with open(f'/proc/{process.pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        peaks[process.pid] = round(int(line.split()[1]) / 2**10, 1)
+        except OSError:
+            pass
+    return peaks
+
+def start_workers(count: int = JOB_WORKERS) -> None:
+    """Start `count` worker processes for this app process, once; restarts any that exited"""
+    with _queue_lock:
+        alive = [process for process in _workers if process.poll() is None]
+        script = os.path.abspath(__file__)
+        for i in range(len(alive), count):
+            # Same working directory, so relative JOB_QUEUE_PATH/JOB_FILES_DIR match the app's;
+            # each worker gets its own metrics port after the app's.
+            env = dict(os.environ, METRICS_PORT=str(metrics.METRICS_PORT + 1 + i))
+            alive.append(subprocess.Popen([sys.executable, script, 'worker'], cwd=os.getcwd(), env=env))
+        _workers[:] = alive
+
+def main():
+    parser = argparse.ArgumentParser(description='Document processing job queue')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    worker_parser = subparsers.add_parser('worker', help='run worker processes until interrupted')
+    worker_parser.add_argument('--processes', type=int, default=1)
+    subparsers.add_parser('status', help='job counts by status')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'status':
+        print(json.dumps(get_queue().counts()))
+        return
+    children = [subprocess.Popen([sys.executable, os.path.abspath(__file__), 'worker'],
+                                 env=dict(os.environ, METRICS_PORT=str(metrics.METRICS_PORT + 1 + i)))
+                for i in range(args.processes - 1)]
+    metrics.start_metrics_server()
+    try:
+        work()
+    finally:
+        for child in children:
+            child.terminate()
+
+if __name__ == '__main__':
+    main()
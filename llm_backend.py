@@ -0,0 +1,115 @@
+# llm_backend.py
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Iterator, Optional
+import requests
+
+class LLMBackend(ABC):
+    """Interface qa_module uses to generate answers from a prompt"""
+    name = 'base'
+
+    @abstractmethod
+    def generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        """Return the whole answer to `prompt`"""
+
+    def stream(self, prompt: str, timeout: Optional[float] = None) -> Iterator[str]:
+        """Yield the answer text in pieces as it is generated"""
+        yield self.generate(prompt, timeout=timeout)
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini through the google-generativeai SDK, configured on first use"""
+    name = 'gemini'
+
+    def __init__(self, model_name: str = 'gemini-pro', api_key: Optional[str] = None):
+        self.model_name = model_name
+        self.api_key = api_key
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=self.api_key or os.getenv("GOOGLE_API_KEY"))
+                self._model = genai.GenerativeModel(self.model_name)
+            return self._model
+
+    @staticmethod
+    def _request_options(timeout: Optional[float]) -> dict:
+        return {'request_options': {'timeout': timeout}} if timeout else {}
+
+    def generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        response = self._get_model().generate_content(prompt, **self._request_options(timeout))
+        return response.text
+
+    def stream(self, prompt: str, timeout: Optional[float] = None) -> Iterator[str]:
+        response = self._get_model().generate_content(prompt, stream=True, **self._request_options(timeout))
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+class HTTPBackend(LLMBackend):
+    """
+    Any server speaking the Gemini REST API (generateContent / streamGenerateContent),
+    e.g. the local stub in stub_server.py
+    """
+    name = 'http'
+
+    def __init__(self, base_url: str, model_name: str = 'gemini-pro', api_key: Optional[str] = None):
+        self.base_url = base_url.rstrip('/')
+        self.model_name = model_name
+        self.api_key = api_key
+        self.session = requests.Session()
+
+    def _url(self, method: str) -> str:
+        return f"{self.base_url}/v1beta/models/{self.model_name}:{method}"
+
+    def _params(self, **extra) -> dict:
+        params = dict(extra)
+        if self.api_key:
+            params['key'] = self.api_key
+        return params
+
+    @staticmethod
+    def _body(prompt: str) -> dict:
+        return {'contents': [{'role': 'user', 'parts': [{'text': prompt}]}]}
+
+    @staticmethod
+    def _text(payload: dict) -> str:
+        candidates = payload.get('candidates') or []
+        if not candidates:
+            return ''
+        return ''.join(part.get('text', '') for part in candidates[0].get('content', {}).get('parts', []))
+
+    def generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        response = self.session.post(self._url('generateContent'), params=self._params(),
+                                     json=self._body(prompt), timeout=timeout)
+        response.raise_for_status()
+        return self._text(response.json())
+
+    def stream(self, prompt: str, timeout: Optional[float] = None) -> Iterator[str]:
+        response = self.session.post(self._url('streamGenerateContent'), params=self._params(alt='sse'),
+                                     json=self._body(prompt), timeout=timeout, stream=True)
+        response.raise_for_status()
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if line and line.startswith('data:'):
+                    text = self._text(json.loads(line[len('data:'):]))
+                    if text:
+                        yield text
+
+def create_backend(name: Optional[str] = None) -> LLMBackend:
+    """
+    Build the backend selected by LLM_BACKEND ('gemini' or 'http').
+    The http backend talks to LLM_BASE_URL (default: the local stub server).
+    """
+    name = (name or os.getenv('LLM_BACKEND', 'gemini')).lower()
+    model_name = os.getenv('LLM_MODEL', 'gemini-pro')
+    if name == 'gemini':
+        return GeminiBackend(model_name)
+    if name == 'http':
+        return HTTPBackend(os.getenv('LLM_BASE_URL', 'http://127.0.0.1:8765'), model_name,
+                           api_key=os.getenv('LLM_API_KEY'))
+    raise ValueError(f"Unknown LLM backend '{name}'")
@@ -0,0 +1,125 @@
+# llm_dispatch.py
+import hashlib
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from context_packing import estimate_tokens
+from llm_backend import LLMBackend
+from metrics import observe, propagate
+from utils import TokenBucket
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+class LLMDispatcher:
+    """
+    Shared front door for LLM calls from every session.
+
+    - at most `max_concurrency` generations run at once; the rest queue
+    - optional prompt-token rate limit (tokens_per_minute) shared by all callers
+    - identical (document, prompt) requests already in flight share one generation
+    - every request carries a deadline; queue wait and generation time are reported separately
+    """
+    def __init__(self, get_backend: Callable[[], LLMBackend], max_concurrency: int = 4,
+                 tokens_per_minute: Optional[float] = None):
+        self.get_backend = get_backend
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # Workers beyond the slot count just wait for a slot; they keep submit() non-blocking.
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency * 4, thread_name_prefix='llm')
+        self._token_bucket = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute) if tokens_per_minute else None
+        self._inflight: Dict[Tuple[str, str], Future] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    @staticmethod
+    def _remaining(deadline: Optional[float]) -> Optional[float]:
+        return None if deadline is None else deadline - time.monotonic()
+
+    def _acquire(self, prompt: str, deadline: Optional[float]) -> None:
+        """Wait for a concurrency slot and for rate-limit budget, or raise DeadlineExceeded"""
+        remaining = self._remaining(deadline)
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded("LLM request expired while queued")
+        if remaining is None:
+            self._slots.acquire()
+        elif not self._slots.acquire(timeout=remaining):
+            raise DeadlineExceeded("No LLM slot became free before the deadline")
+        if self._token_bucket is not None and not self._token_bucket.acquire(
+                estimate_tokens(prompt), timeout=self._remaining(deadline)):
+            self._slots.release()
+            raise DeadlineExceeded("LLM token-rate budget not available before the deadline")
+
+    def _run(self, prompt: str, submitted: float, deadline: Optional[float]) -> dict:
+        self._acquire(prompt, deadline)
+        try:
+            started = time.monotonic()
+            observe('llm_queue', started - submitted)
+            backend = self.get_backend()
+            text = backend.generate(prompt, timeout=self._remaining(deadline))
+            generation_time = time.monotonic() - started
+            observe('llm', generation_time, backend=type(backend).__name__, mode='generate')
+            return {'text': text, 'queue_wait': started - submitted, 'generation_time': generation_time}
+        finally:
+            self._slots.release()
+
+    def submit(self, document_id: str, prompt: str, timeout: Optional[float] = None) -> Tuple[Future, bool]:
+        """
+        Queue a generation. Returns the future and whether it was coalesced
+        onto an identical request already in flight.
+        """
+        key = (document_id, hashlib.sha1(prompt.encode('utf-8')).hexdigest())
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, True
+            deadline = None if timeout is None else time.monotonic() + timeout
+            future = self._executor.submit(propagate(self._run), prompt, time.monotonic(), deadline)
+            self._inflight[key] = future
+        future.add_done_callback(lambda _: self._forget(key, future))
+        return future, False
+
+    def _forget(self, key: Tuple[str, str], future: Future) -> None:
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def generate(self, document_id: str, prompt: str, timeout: Optional[float] = None) -> dict:
+        """
+        Blocking call returning {'text', 'queue_wait', 'generation_time', 'coalesced'}.
+        Raises DeadlineExceeded if no answer arrives within `timeout` seconds.
+        """
+        future, coalesced = self.submit(document_id, prompt, timeout)
+        try:
+            result = future.result(timeout=timeout)
+        except DeadlineExceeded:
+            # Raised inside the worker; on Python 3.11+ it is also a FutureTimeoutError.
+            raise
+        except FutureTimeoutError:
+            raise DeadlineExceeded(f"LLM request exceeded its {timeout}s deadline")
+        return dict(result, coalesced=coalesced)
+
+    def stream(self, prompt: str, timeout: Optional[float] = None, stats: Optional[dict] = None) -> Iterator[str]:
+        """
+        Streaming generation under the same concurrency and rate limits.
+        Streams are not coalesced; queue_wait and generation_time go into `stats`.
+        """
+        stats = stats if stats is not None else {}
+        submitted = time.monotonic()
+        deadline = None if timeout is None else submitted + timeout
+        self._acquire(prompt, deadline)
+        started = time.monotonic()
+        stats['queue_wait'] = started - submitted
+        observe('llm_queue', started - submitted)
+        backend = self.get_backend()
+        try:
+            for piece in backend.stream(prompt, timeout=self._remaining(deadline)):
+                if deadline is not None and time.monotonic() > deadline:
+                    raise DeadlineExceeded(f"LLM stream exceeded its {timeout}s deadline")
+                yield piece
+        finally:
+            stats['generation_time'] = time.monotonic() - started
+            observe('llm', stats['generation_time'], backend=type(backend).__name__, mode='stream')
+            self._slots.release()
@@ -0,0 +1,358 @@
+# loadtest.py
+"""
+Load tests for the Q&A pipeline. By default the LLM is the local stub server,
+so no Google calls are made.
+
+Usage:
+    python loadtest.py qa --document tamil.pdf --language Tamil --sessions 1,4,16 --questions 20
+    python loadtest.py qa --text-file notes.txt --sessions 8 --stream --llm-url http://127.0.0.1:8765
+    firebase emulators:start --only auth,firestore --project demo-veda
+    python loadtest.py app --document tamil.pdf --language Tamil --sessions 1,4,8 \
+        --firestore-emulator 127.0.0.1:8080 --auth-emulator 127.0.0.1:9099
+
+The app mode drives the whole Streamlit app (signup.py) with Streamlit's
+AppTest, one AppTest per simulated session, each on its own thread in this
+process. The sessions therefore share the embedding model and job workers just
+as real sessions in one pod do; each indexes into its own document store.
+Each session does login -> upload -> Q&A -> translate -> logout against the
+Firebase emulator, with the LLM and the translation provider served by the
+local stub.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import numpy as np
+from typing import Dict, Any, List
+
+def percentile_ms(samples: List[float], q: float) -> float:
+    return float(np.percentile(np.array(samples) * 1000, q)) if samples else 0.0
+
+def load_text_dict(args) -> Dict[int, str]:
+    if args.text_file:
+        with open(args.text_file, encoding='utf-8') as f:
+            pages = f.read().split('\f')
+        return {i + 1: page for i, page in enumerate(pages) if page.strip()}
+    from text_extraction import extract_text
+    from utils import open_as_upload
+    return extract_text(open_as_upload(args.document), args.language)
+
+def sample_questions(text_dict: Dict[int, str], count: int, seed: int) -> List[str]:
+    """Questions built from document sentences so retrieval has something to find"""
+    from context_packing import SENTENCE_SPLIT
+    sentences = [s for text in text_dict.values() for s in SENTENCE_SPLIT.split(text) if len(s.split()) >= 4]
+    rng = random.Random(seed)
+    return [f"What does the document say about: {rng.choice(sentences)[:200]}" for _ in range(count)]
+
+def run_sessions(sessions: int, questions_per_session: int, text_dict: Dict[int, str],
+                 language: str, stream: bool) -> Dict[str, Any]:
+    import qa_module
+
+    latencies: List[float] = []
+    first_tokens: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def session(session_id: int):
+        for question in sample_questions(text_dict, questions_per_session, seed=session_id):
+            start = time.perf_counter()
+            stats = {}
+            try:
+                if stream:
+                    answer = ''.join(qa_module.stream_answer(question, language, stats=stats))
+                else:
+                    answer = qa_module.get_answer(question, language, stats=stats)
+            except Exception:
+                answer = None
+            if not _is_answer(answer):
+                with lock:
+                    errors[0] += 1
+                continue
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if stats.get('time_to_first_token') is not None:
+                    first_tokens.append(stats['time_to_first_token'])
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    result = {
+        'sessions': sessions,
+        'requests': len(latencies),
+        'errors': errors[0],
+        'seconds': round(wall, 3),
+        'throughput_qps': round(len(latencies) / wall, 2) if wall else 0.0,
+        'latency_p50_ms': round(percentile_ms(latencies, 50), 1),
+        'latency_p99_ms': round(percentile_ms(latencies, 99), 1),
+    }
+    if first_tokens:
+        result['ttft_p50_ms'] = round(percentile_ms(first_tokens, 50), 1)
+        result['ttft_p99_ms'] = round(percentile_ms(first_tokens, 99), 1)
+    return result
+
+def loadtest_qa(args) -> List[Dict[str, Any]]:
+    import qa_module
+    from answer_cache import answer_cache
+    from database import document_store
+    from embedding import embed_text, query_embedding_cache
+    from llm_backend import HTTPBackend
+    from stub_server import start_stub_server, StubConfig
+
+    url = args.llm_url
+    if not url:
+        _, url = start_stub_server(config=StubConfig(args.latency, args.tokens_per_second, args.answer_tokens))
+    qa_module.set_backend(HTTPBackend(url))
+
+    if not args.answer_cache:
+        # Every question should reach the LLM.
+        answer_cache.max_entries = 0
+
+    text_dict = load_text_dict(args)
+    document_store.clear()
+    document_store.add_to_database(embed_text(text_dict, args.language))
+
+    results = [run_sessions(int(n), args.questions, text_dict, args.language, args.stream)
+               for n in args.sessions.split(',')]
+    results.append({'query_embedding_cache': query_embedding_cache.stats(), 'answer_cache': answer_cache.stats()})
+    return results
+
+# Generic questions for the app mode; every session asks them in turn.
+APP_QUESTIONS = (
+    "What is this document about?",
+    "Who issued this document?",
+    "What dates are mentioned in the document?",
+    "Summarize the main points of the document.",
+)
+
+def _widget(widgets, label):
+    for widget in widgets:
+        if widget.label == label:
+            return widget
+    raise LookupError(f"No widget labelled {label!r} on the page")
+
+def _state(at, key):
+    try:
+        return at.session_state[key]
+    except KeyError:
+        return None
+
+def _interact(at, step: str, timings: Dict[str, List[float]], timeout: float, action=None) -> None:
+    """Run one page interaction (a widget change or a plain rerun) and record how long the page took"""
+    start = time.perf_counter()
+    if action is not None:
+        action()
+    at.run(timeout=timeout)
+    timings.setdefault(step, []).append(time.perf_counter() - start)
+    if at.exception:
+        raise RuntimeError(f"{step}: {at.exception[0].message}")
+
+def _is_answer(text: str) -> bool:
+    """False for an empty answer or one of the app's no-result, timeout and error messages"""
+    from qa_module import get_language_error_message
+
+    text = (text or '').strip()
+    if not text:
+        return False
+    for language in ('English', 'Hindi', 'Marathi'):
+        for error_type in ('no_results', 'no_answer', 'general_error', 'timeout'):
+            message = get_language_error_message(language, error_type).split('{}')[0]
+            if text.startswith(message):
+                return False
+    return True
+
+def app_session(index: int, args, document: bytes, timings: Dict[str, List[float]]) -> None:
+    """One simulated user: login -> upload -> Q&A -> translate -> logout"""
+    from streamlit.testing.v1 import AppTest
+    from job_queue import enqueue_extract
+
+    at = AppTest.from_file('signup.py', default_timeout=args.timeout)
+    _interact(at, 'open', timings, args.timeout)
+
+    _interact(at, 'login', timings, args.timeout, lambda: (
+        at.text_input(key='login_email').input(f"loadtest{index}@example.com"),
+        at.text_input(key='login_password').input(args.password),
+        _widget(at.button, 'Login').click()))
+    if not _state(at, 'logged_in'):
+        raise RuntimeError('login: not logged in')
+
+    _interact(at, 'home', timings, args.timeout, lambda: at.radio(key='page_selector').set_value('Home'))
+    # AppTest cannot fill a file_uploader, so queue the document the way the
+    # "Process Document" button does; the next run polls the job to completion.
+    _interact(at, 'extract', timings, args.timeout, lambda: at.session_state.__setitem__(
+        'extract_job', enqueue_extract(os.path.basename(args.document), document, args.language)))
+    if not _state(at, 'document_processed'):
+        raise RuntimeError('extract: document not processed')
+
+    # Preparing Q&A waits for the embedding job, then each question streams an answer.
+    _interact(at, 'qa_prepare', timings, args.timeout, lambda: at.radio(key='page_selector').set_value('Q&A'))
+    for i in range(args.questions):
+        question = APP_QUESTIONS[(index + i) % len(APP_QUESTIONS)]
+        _interact(at, 'question', timings, args.timeout,
+                  lambda: _widget(at.text_input, 'Enter your question about the document:').input(question))
+        _interact(at, 'answer', timings, args.timeout, lambda: _widget(at.button, 'Get Answer').click())
+        # A "no results" reply is fast and would flatter the latencies; such a session counts as failed.
+        history = _state(at, 'chat_history') or []
+        if not history or history[-1][0] != question or not _is_answer(history[-1][1]):
+            raise RuntimeError(f"answer: no answer from the document to {question!r}")
+
+    _interact(at, 'translate_page', timings, args.timeout, lambda: at.radio(key='page_selector').set_value('Translate'))
+    _interact(at, 'translate', timings, args.timeout, lambda: (
+        _widget(at.selectbox, 'Select target language').set_value(args.target_language),
+        _widget(at.button, 'Translate').click()))
+    if not _state(at, 'translated_text'):
+        raise RuntimeError('translate: no translated text')
+
+    _interact(at, 'logout', timings, args.timeout, lambda: _widget(at.sidebar.button, 'Logout').click())
+
+def run_app_sessions(sessions: int, args, document: bytes) -> Dict[str, Any]:
+    import firebase
+    from benchmark import peak_rss_mb
+    from job_queue import worker_peak_rss_mb
+    from session_store import session_store
+
+    timings: Dict[str, List[float]] = {}
+    errors: List[str] = []
+    lock = threading.Lock()
+    firestore_before = dict(firebase.firestore_stats)
+
+    def session(index: int):
+        session_timings: Dict[str, List[float]] = {}
+        try:
+            app_session(index, args, document, session_timings)
+        except Exception as e:
+            with lock:
+                errors.append(f"session {index}: {str(e)}")
+            return
+        # Only sessions that completed every step (with real answers) count towards the latencies.
+        with lock:
+            for step, samples in session_timings.items():
+                timings.setdefault(step, []).extend(samples)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    interactions = [sample for samples in timings.values() for sample in samples]
+    completed = sessions - len(errors)
+    return {
+        'sessions': sessions,
+        'completed': completed,
+        'errors': errors,
+        'seconds': round(wall, 2),
+        'sessions_per_minute': round(completed / wall * 60, 2) if wall else 0.0,
+        'interactions_per_second': round(len(interactions) / wall, 2) if wall else 0.0,
+        'latency_p50_ms': round(percentile_ms(interactions, 50), 1),
+        'latency_p95_ms': round(percentile_ms(interactions, 95), 1),
+        'steps': {step: {'count': len(samples),
+                         'p50_ms': round(percentile_ms(samples, 50), 1),
+                         'p95_ms': round(percentile_ms(samples, 95), 1)} for step, samples in timings.items()},
+        # High-water marks of this process (the app sessions) and of each job worker
+        # process (OCR and embedding), which run outside it.
+        'peak_rss_mb': peak_rss_mb(),
+        'worker_peak_rss_mb': worker_peak_rss_mb(),
+        'session_store': {key: value for key, value in session_store.stats().items() if key != 'sessions'},
+        'firestore': {key: firebase.firestore_stats[key] - firestore_before[key] for key in firestore_before}
+    }
+
+def create_app_users(count: int, password: str) -> None:
+    """Accounts loadtest<i>@example.com in the Auth and Firestore emulators"""
+    import firebase
+    from firebase_admin import auth
+
+    firebase.initialize_firebase()
+    for i in range(count):
+        email = f"loadtest{i}@example.com"
+        try:
+            user = auth.create_user(email=email, password=password, display_name=f"Load test {i}")
+        except auth.EmailAlreadyExistsError:
+            continue
+        firebase.get_db().collection('user').document(user.uid).set({'name': f"Load test {i}", 'email': email})
+
+def loadtest_app(args) -> List[Dict[str, Any]]:
+    # Everything below reads its settings at import time, so the environment is set first.
+    if args.firestore_emulator:
+        os.environ['FIRESTORE_EMULATOR_HOST'] = args.firestore_emulator
+    if args.auth_emulator:
+        os.environ['FIREBASE_AUTH_EMULATOR_HOST'] = args.auth_emulator
+    if not os.getenv('FIRESTORE_EMULATOR_HOST') or not os.getenv('FIREBASE_AUTH_EMULATOR_HOST'):
+        raise SystemExit('The app load test needs the Firebase emulators: pass --firestore-emulator and '
+                         '--auth-emulator (or set FIRESTORE_EMULATOR_HOST and FIREBASE_AUTH_EMULATOR_HOST)')
+    os.environ.setdefault('JOB_QUEUE_PATH', os.path.join(tempfile.mkdtemp(prefix='loadtest-'), 'jobs.sqlite3'))
+    os.environ['JOB_WORKERS'] = str(args.workers)
+    os.environ['TRANSLATION_PROVIDERS'] = 'stub'
+
+    from stub_server import start_stub_server, StubConfig
+    _, url = start_stub_server(config=StubConfig(args.latency, args.tokens_per_second, args.answer_tokens,
+                                                 translate_latency=args.translate_latency))
+    os.environ['TRANSLATION_STUB_URL'] = url
+
+    import qa_module
+    from answer_cache import answer_cache
+    from llm_backend import HTTPBackend
+
+    qa_module.set_backend(HTTPBackend(url))
+    if not args.answer_cache:
+        answer_cache.max_entries = 0
+
+    levels = [int(n) for n in args.sessions.split(',')]
+    create_app_users(max(levels), args.password)
+    with open(args.document, 'rb') as f:
+        document = f.read()
+    return [run_app_sessions(n, args, document) for n in levels]
+
+def main():
+    parser = argparse.ArgumentParser(description='Veda VisionGPT load tests')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    qa_parser = subparsers.add_parser('qa', help='End-to-end Q&A throughput and latency at N concurrent sessions')
+    source = qa_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--document', help='PDF/image/DOCX to extract and index')
+    source.add_argument('--text-file', help='Plain text; pages separated by form feeds')
+    qa_parser.add_argument('--language', default='English')
+    qa_parser.add_argument('--sessions', default='1,4,16', help='comma-separated concurrency levels')
+    qa_parser.add_argument('--questions', type=int, default=20, help='questions per session')
+    qa_parser.add_argument('--stream', action='store_true', help='use stream_answer and report time to first token')
+    qa_parser.add_argument('--answer-cache', action='store_true', help='leave the answer cache enabled')
+    qa_parser.add_argument('--llm-url', help='existing Gemini-compatible server; default starts a local stub')
+    qa_parser.add_argument('--latency', type=float, default=0.3)
+    qa_parser.add_argument('--tokens-per-second', type=float, default=40.0)
+    qa_parser.add_argument('--answer-tokens', type=int, default=120)
+    qa_parser.set_defaults(func=loadtest_qa)
+
+    app_parser = subparsers.add_parser('app', help='Concurrent simulated users of the Streamlit app (AppTest)')
+    app_parser.add_argument('--document', default='tamil.pdf', help='document each session uploads')
+    app_parser.add_argument('--language', default='Tamil')
+    app_parser.add_argument('--target-language', default='English')
+    app_parser.add_argument('--sessions', default='1,4,8', help='comma-separated concurrency levels')
+    app_parser.add_argument('--questions', type=int, default=3, help='questions per session')
+    app_parser.add_argument('--workers', type=int, default=2, help='job worker processes for extraction/embedding')
+    app_parser.add_argument('--timeout', type=float, default=600.0, help='seconds one page interaction may take')
+    app_parser.add_argument('--password', default='loadtest-password')
+    app_parser.add_argument('--firestore-emulator', help='host:port of the Firestore emulator')
+    app_parser.add_argument('--auth-emulator', help='host:port of the Firebase Auth emulator')
+    app_parser.add_argument('--answer-cache', action='store_true', help='leave the answer cache enabled')
+    app_parser.add_argument('--latency', type=float, default=0.3)
+    app_parser.add_argument('--tokens-per-second', type=float, default=40.0)
+    app_parser.add_argument('--answer-tokens', type=int, default=120)
+    app_parser.add_argument('--translate-latency', type=float, default=0.2)
+    app_parser.set_defaults(func=loadtest_app)
+
+    args = parser.parse_args()
+    for result in args.func(args):
+        print(json.dumps(result, ensure_ascii=False))
+
+if __name__ == '__main__':
+    main()
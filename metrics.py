@@ -0,0 +1,281 @@
+# metrics.py
+"""
+Per-stage timing for extraction, embedding, indexing, translation and Q&A.
+
+    with timed('ocr', engine='tesseract', language='Tamil'):
+        ...
+    count('pages', 12, stage='ocr')
+
+Durations go into a histogram per (stage, labels) and are also added to the
+current request's trace (see start_trace). Everything is exported in the
+Prometheus text format by start_metrics_server(). With METRICS_ENABLED unset
+timed() returns a shared no-op context manager, so instrumented code pays one
+function call per stage.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9464'))
+# Histogram bucket upper bounds, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+_lock = threading.Lock()
+_histograms: Dict[LabelKey, list] = {}
+_counters: Dict[LabelKey, float] = {}
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('metrics_trace', default=None)
+_collectors: list = []
+
+def _key(name: str, labels: Dict[str, Any]) -> LabelKey:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+class Trace:
+    """Time spent per stage within one request (or one document job)"""
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.stages: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            entry = self.stages.setdefault(stage, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'name': self.name,
+                'total_seconds': round(time.perf_counter() - self.started, 4),
+                'stages': {stage: {'count': calls, 'seconds': round(seconds, 4)}
+                           for stage, (calls, seconds) in self.stages.items()}
+            }
+
+def observe(stage: str, seconds: float, **labels) -> None:
+    """Record one duration for `stage`"""
+    if not METRICS_ENABLED:
+        return
+    key = _key(stage, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0, 0.0] + [0] * len(BUCKETS)
+        histogram[0] += 1
+        histogram[1] += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[2 + i] += 1
+                break
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+def count(name: str, amount: float = 1, **labels) -> None:
+    """Add to a counter, e.g. pages OCR'd or characters translated"""
+    if not METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+class _Timer:
+    __slots__ = ('stage', 'labels', 'started')
+
+    def __init__(self, stage: str, labels: Dict[str, Any]):
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.labels['outcome'] = 'error'
+        observe(self.stage, time.perf_counter() - self.started, **self.labels)
+        return False
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP = _NoopTimer()
+
+def timed(stage: str, **labels):
+    """Context manager timing one stage; failures get the label outcome="error" """
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _Timer(stage, labels)
+
+@contextmanager
+def start_trace(name: str) -> Iterator[Optional[Trace]]:
+    """Collect the stages timed in this context into a Trace (None when disabled)"""
+    if not METRICS_ENABLED:
+        yield None
+        return
+    trace = Trace(name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # A generator finalized from another context (e.g. by the garbage collector).
+            _current_trace.set(None)
+
+def new_trace(name: str) -> Optional[Trace]:
+    """A Trace to pass to traced() (None when disabled)"""
+    return Trace(name) if METRICS_ENABLED else None
+
+def traced(trace: Optional[Trace], iterator: Iterator) -> Iterator:
+    """
+    Iterate `iterator` with `trace` current only while it produces each item.
+    A generator must not hold start_trace() across a yield: the trace would stay
+    set in the consumer's context, which could then be suspended and resumed
+    elsewhere while it is still set.
+    """
+    if trace is None:
+        yield from iterator
+        return
+    try:
+        while True:
+            token = _current_trace.set(trace)
+            try:
+                value = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _current_trace.reset(token)
+            yield value
+    finally:
+        token = _current_trace.set(trace)
+        try:
+            iterator.close()
+        finally:
+            _current_trace.reset(token)
+
+def propagate(fn: Callable) -> Callable:
+    """Wrap `fn` to run in a copy of the caller's context, so work handed to a thread pool stays in the trace"""
+    if not METRICS_ENABLED or _current_trace.get() is None:
+        return fn
+    context = contextvars.copy_context()
+    # A Context can only be entered by one thread at a time, so each call runs in its own copy.
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+def register_collector(collect: Callable[[], Iterator[Tuple[str, str, str, Dict[str, Any], float]]]) -> None:
+    """
+    Export state owned by another module. collect() runs at every scrape and
+    yields (name, type, help, labels, value) samples, type being 'gauge' or
+    'counter'; samples of one name share the first sample's type and help.
+    """
+    with _lock:
+        _collectors.append(collect)
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def render_prometheus() -> str:
+    """All histograms and counters in the Prometheus text exposition format"""
+    with _lock:
+        histograms = {key: list(value) for key, value in _histograms.items()}
+        counters = dict(_counters)
+    lines = ['# HELP veda_stage_seconds Time spent per pipeline stage',
+             '# TYPE veda_stage_seconds histogram']
+    for (stage, labels), histogram in sorted(histograms.items()):
+        labels = (('stage', stage),) + labels
+        cumulative = 0
+        for bound, bucket in zip(BUCKETS, histogram[2:]):
+            cumulative += bucket
+            lines.append(f'veda_stage_seconds_bucket{_format_labels(labels, (("le", str(bound)),))} {cumulative}')
+        lines.append(f'veda_stage_seconds_bucket{_format_labels(labels, (("le", "+Inf"),))} {histogram[0]}')
+        lines.append(f'veda_stage_seconds_sum{_format_labels(labels)} {histogram[1]}')
+        lines.append(f'veda_stage_seconds_count{_format_labels(labels)} {histogram[0]}')
+    lines.extend(['# HELP veda_items_total Items processed per pipeline stage',
+                  '# TYPE veda_items_total counter'])
+    for (name, labels), value in sorted(counters.items()):
+        lines.append(f'veda_items_total{_format_labels((("item", name),) + labels)} {value}')
+    with _lock:
+        collectors = list(_collectors)
+    families: Dict[str, list] = {}
+    for collect in collectors:
+        try:
+            for name, kind, description, labels, value in collect():
+                family = families.setdefault(name, [kind, description, []])
+                family[2].append((_key(name, labels)[1], value))
+        except Exception as e:
+            logger.warning(f"Metrics collector failed: {e}")
+    for name, (kind, description, samples) in families.items():
+        lines.extend([f'# HELP {name} {description}', f'# TYPE {name} {kind}'])
+        lines.extend(f'{name}{_format_labels(labels)} {value}' for labels, value in samples)
+    return '\n'.join(lines) + '\n'
+
+def snapshot() -> Dict[str, Any]:
+    """count, total and mean seconds per stage/label set, for logs and benchmarks"""
+    with _lock:
+        return {
+            'stages': {f'{stage}{_format_labels(labels)}': {
+                'count': histogram[0],
+                'seconds': round(histogram[1], 4),
+                'mean_ms': round(histogram[1] / histogram[0] * 1000, 2) if histogram[0] else 0.0
+            } for (stage, labels), histogram in sorted(_histograms.items())},
+            'counters': {f'{name}{_format_labels(labels)}': value for (name, labels), value in sorted(_counters.items())}
+        }
+
+def reset() -> None:
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+_server = None
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = '127.0.0.1'):
+    """Serve /metrics on a daemon thread, once per process; no-op when disabled or the port is taken"""
+    global _server
+    if not METRICS_ENABLED:
+        return None
+    with _lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                logger.warning(f"Metrics endpoint not started on port {port}: {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+            logger.info(f"Metrics at http://{host}:{port}/metrics")
+    return _server
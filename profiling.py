@@ -0,0 +1,187 @@
+# profiling.py
+"""
+Opt-in profiling of the hot paths (extract_text, embed_text, translate_text,
+get_answer / stream_answer).
+
+VEDA_PROFILE=cprofile   deterministic profile, saved as .pstats
+VEDA_PROFILE=sample     sampling profiler, saved as collapsed stacks (.collapsed),
+                        ready for flamegraph.pl or speedscope
+
+A single request can be profiled without the env var by running it inside
+profile_requests('sample') (the app does this for admins who tick the sidebar
+box, and job payloads carry the flag to the workers). Output goes to
+VEDA_PROFILE_DIR as <stage>-<tag>-<timestamp>.<ext>, where the tag is a short
+hash of the document (and question), so slow cases can be matched up later.
+
+Both profilers follow the calling thread only; work that translate_text hands
+to its thread pool shows up as time waiting on futures.
+"""
+import contextvars
+import cProfile
+import functools
+import hashlib
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from collections.abc import Mapping
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ('cprofile', 'sample')
+PROFILE_MODE = os.getenv('VEDA_PROFILE', '').lower()
+PROFILE_DIR = os.getenv('VEDA_PROFILE_DIR', os.path.join('.cache', 'profiles'))
+SAMPLE_INTERVAL = float(os.getenv('VEDA_PROFILE_INTERVAL', '0.005'))
+
+_request_mode: contextvars.ContextVar = contextvars.ContextVar('profile_mode', default=None)
+
+def current_mode() -> Optional[str]:
+    mode = _request_mode.get() or PROFILE_MODE
+    return mode if mode in PROFILE_MODES else None
+
+@contextmanager
+def profile_requests(mode: Optional[str]):
+    """Profile the instrumented calls made in this context with `mode` (None leaves the env setting)"""
+    token = _request_mode.set(mode)
+    try:
+        yield
+    finally:
+        _request_mode.reset(token)
+
+def short_hash(*parts) -> str:
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, Mapping):
+            for key, value in part.items():
+                digest.update(str(key).encode('utf-8'))
+                digest.update(value if isinstance(value, bytes) else str(value).encode('utf-8'))
+        elif hasattr(part, 'getvalue'):
+            digest.update(part.getvalue())
+        else:
+            digest.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+class _Sampler:
+    """Samples one thread's stack every `interval` seconds while active"""
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.active = threading.Event()
+        self._finished = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._finished.is_set():
+            if not self.active.wait(0.05):
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def stop(self):
+        self._finished.set()
+        self._thread.join()
+
+class ProfileSession:
+    """One profile of one call; resume()/pause() bracket the time actually spent in it"""
+    def __init__(self, mode: str, stage: str, tag: str):
+        self.mode = mode
+        self.stage = stage
+        self.tag = tag
+        self.started = time.strftime('%Y%m%d-%H%M%S')
+        if mode == 'cprofile':
+            self._profiler = cProfile.Profile()
+        else:
+            self._sampler = _Sampler(threading.get_ident(), SAMPLE_INTERVAL)
+
+    def resume(self):
+        if self.mode == 'cprofile':
+            self._profiler.enable()
+        else:
+            self._sampler.thread_id = threading.get_ident()
+            self._sampler.active.set()
+
+    def pause(self):
+        if self.mode == 'cprofile':
+            self._profiler.disable()
+        else:
+            self._sampler.active.clear()
+
+    def save(self) -> Optional[str]:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, f"{self.stage}-{self.tag}-{self.started}")
+        try:
+            if self.mode == 'cprofile':
+                path = base + '.pstats'
+                self._profiler.dump_stats(path)
+            else:
+                self._sampler.stop()
+                path = base + '.collapsed'
+                with open(path, 'w', encoding='utf-8') as f:
+                    for stack, samples in self._sampler.stacks.most_common():
+                        f.write(f"{stack} {samples}\n")
+            logger.info(f"Saved {self.stage} profile to {path}")
+            return path
+        except Exception as e:
+            logger.warning(f"Could not save {self.stage} profile: {str(e)}")
+            return None
+
+def profiled(stage: str, tag: Callable[..., str]):
+    """
+    Decorator profiling each call of the wrapped function when a profile mode
+    is active. `tag` gets the call's arguments and returns the file tag; it is
+    only evaluated when profiling. Generator functions are profiled across
+    their whole iteration.
+    """
+    def decorate(fn):
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator_wrapper(*args, **kwargs):
+                mode = current_mode()
+                if mode is None:
+                    yield from fn(*args, **kwargs)
+                    return
+                session = ProfileSession(mode, stage, tag(*args, **kwargs))
+                generator = fn(*args, **kwargs)
+                try:
+                    while True:
+                        session.resume()
+                        try:
+                            value = next(generator)
+                        except StopIteration:
+                            return
+                        finally:
+                            session.pause()
+                        yield value
+                finally:
+                    generator.close()
+                    session.save()
+            return generator_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            mode = current_mode()
+            if mode is None:
+                return fn(*args, **kwargs)
+            session = ProfileSession(mode, stage, tag(*args, **kwargs))
+            session.resume()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                session.pause()
+                session.save()
+        return wrapper
+    return decorate
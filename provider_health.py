@@ -0,0 +1,135 @@
+# provider_health.py
+import random
+import threading
+import time
+from collections import deque
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+def backoff_delay(attempt, base=0.5, cap=8.0):
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds. Then one trial call is let through (half-open):
+    success closes the breaker, failure opens it again. A trial that never
+    reports back is replaced by another after `reset_timeout`.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == OPEN and now - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probe_started = None
+            if self.state == HALF_OPEN and (self._probe_started is None or
+                                            now - self._probe_started >= self.reset_timeout):
+                self._probe_started = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self._probe_started = None
+
+    def record_failure(self):
+        """Returns True if this failure opened the breaker"""
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_started = None
+            if self.state == HALF_OPEN or (self.state == CLOSED and
+                                           self.consecutive_failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+class ProviderHealth:
+    """Circuit breaker plus success, failure and latency counters for each provider"""
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, latency_window=500):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.latency_window = latency_window
+        self._providers = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, provider):
+        with self._lock:
+            entry = self._providers.get(provider)
+            if entry is None:
+                entry = self._providers[provider] = {
+                    'breaker': CircuitBreaker(self.failure_threshold, self.reset_timeout),
+                    'successes': 0,
+                    'failures': 0,
+                    'rejected': 0,
+                    'trips': 0,
+                    'latencies': deque(maxlen=self.latency_window)
+                }
+            return entry
+
+    def allow(self, provider):
+        entry = self._entry(provider)
+        allowed = entry['breaker'].allow()
+        if not allowed:
+            with self._lock:
+                entry['rejected'] += 1
+        return allowed
+
+    def record_success(self, provider, latency):
+        entry = self._entry(provider)
+        entry['breaker'].record_success()
+        with self._lock:
+            entry['successes'] += 1
+            entry['latencies'].append(latency)
+
+    def record_failure(self, provider, latency):
+        entry = self._entry(provider)
+        tripped = entry['breaker'].record_failure()
+        with self._lock:
+            entry['failures'] += 1
+            entry['latencies'].append(latency)
+            if tripped:
+                entry['trips'] += 1
+        return tripped
+
+    def reset(self):
+        with self._lock:
+            self._providers.clear()
+
+    def metrics(self):
+        """Per-provider counters, breaker state and recent latency percentiles (ms)"""
+        with self._lock:
+            snapshot = {name: dict(entry, latencies=sorted(entry['latencies']))
+                        for name, entry in self._providers.items()}
+        metrics = {}
+        for name, entry in snapshot.items():
+            latencies = entry['latencies']
+            calls = entry['successes'] + entry['failures']
+            metrics[name] = {
+                'state': entry['breaker'].state,
+                'successes': entry['successes'],
+                'failures': entry['failures'],
+                'rejected': entry['rejected'],
+                'trips': entry['trips'],
+                'success_rate': entry['successes'] / calls if calls else 0.0,
+                'latency_p50_ms': round(latencies[len(latencies) // 2] * 1000, 1) if latencies else 0.0,
+                'latency_p99_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 1)
+                if latencies else 0.0
+            }
+        return metrics
@@ -1,31 +1,55 @@
 # qa_module.py
-import google.generativeai as genai
-from embedding import embed_text, model as embedding_model
-from database import document_store
+from embedding import embed_text, encode_query, model as embedding_model
+from database import DocumentStore, archive_store, document_store, indexed_document_id, search_stores
+from answer_cache import answer_cache
 import os
 from dotenv import load_dotenv
-from langdetect import detect, LangDetectException
 import sys
+import time
+import logging
+import threading
+from typing import Iterator
 from text_extraction import LANGUAGE_MAP
+import script_detection
+from context_packing import pack_context, estimate_tokens
+from llm_backend import LLMBackend, create_backend
+from llm_dispatch import LLMDispatcher, DeadlineExceeded
+from metrics import new_trace, start_trace, timed, traced
+from profiling import profiled, short_hash
 
 load_dotenv()
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
-model = genai.GenerativeModel('gemini-pro')
+backend = create_backend()
 
-def detect_language(text: str) -> str:
+# LLM dispatch limits shared by every session in this process
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '4'))
+LLM_TOKENS_PER_MINUTE = float(os.getenv('LLM_TOKENS_PER_MINUTE', '0')) or None
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '60'))
+
+dispatcher = LLMDispatcher(lambda: backend, max_concurrency=LLM_MAX_CONCURRENCY,
+                           tokens_per_minute=LLM_TOKENS_PER_MINUTE)
+
+logger = logging.getLogger(__name__)
+
+# Retrieval and context-packing knobs
+RETRIEVAL_K = int(os.getenv('RETRIEVAL_K', '10'))
+CONTEXT_MAX_CHUNKS = int(os.getenv('CONTEXT_MAX_CHUNKS', '5'))
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '1500'))
+CONTEXT_MMR_LAMBDA = float(os.getenv('CONTEXT_MMR_LAMBDA', '0.7'))
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv('CONTEXT_DUPLICATE_THRESHOLD', '0.95'))
+CONTEXT_SENTENCE_THRESHOLD = float(os.getenv('CONTEXT_SENTENCE_THRESHOLD', '0.2'))
+
+def set_backend(new_backend: LLMBackend) -> None:
+    """Swap the LLM backend used by get_answer and stream_answer"""
+    global backend
+    backend = new_backend
+
+def detect_language(text: str, preferred: tuple = ()) -> str:
     """
     Detect the language of the text
     Returns language name or 'English' if detection fails
     """
-    try:
-        detected_code = detect(text)
-        for lang, code in LANGUAGE_MAP.items():
-            if code == detected_code:
-                return lang
-        return 'English'
-    except LangDetectException:
-        return 'English'
+    return script_detection.detect_language(text.strip(), tuple(preferred))
 
 def get_supported_languages(input_language: str, translation_language: str = None) -> list:
     """
@@ -38,28 +62,16 @@ def get_supported_languages(input_language: str, translation_language: str = Non
         supported_languages.append(translation_language)
     return supported_languages
 
-def get_answer(question: str, input_language: str = None, translation_language: str = None) -> str:
-    try:
-        question_language = detect_language(question)
-        
-        supported_languages = get_supported_languages(input_language, translation_language)
-        
-        if question_language not in supported_languages:
-            question_language = 'English'
-        
-        question_embedding = embedding_model.encode(question, normalize_embeddings=True)
-        
-        relevant_chunks = document_store.search_database(question_embedding, k=5)  
-        
-        if not relevant_chunks:
-            return get_language_error_message(question_language, 'no_results')
-        
-        context = "\n\n".join([chunk['text'] for chunk in relevant_chunks])
-        
-        chunk_languages = [chunk['language'] for chunk in relevant_chunks]
-        predominant_language = max(set(chunk_languages), key=chunk_languages.count)
-        
-        prompt = f"""You are an expert multilingual assistant.
+def build_prompt(question: str, question_language: str, relevant_chunks: list) -> str:
+    """
+    Build the Gemini prompt from the question and the retrieved chunks
+    """
+    context = "\n\n".join([chunk['text'] for chunk in relevant_chunks])
+    
+    chunk_languages = [chunk['language'] for chunk in relevant_chunks]
+    predominant_language = max(set(chunk_languages), key=chunk_languages.count)
+    
+    return f"""You are an expert multilingual assistant.
         Answer the following question based on the provided context.
         
         Important instructions:
@@ -76,35 +88,210 @@ def get_answer(question: str, input_language: str = None, translation_language:
         Question: {question}
         
         Answer in {question_language}:"""
+
+def resolve_question_language(question: str, input_language: str = None, translation_language: str = None) -> str:
+    """
+    Detect the question language, falling back to English when the session does not support it
+    """
+    supported_languages = get_supported_languages(input_language, translation_language)
+    
+    question_language = detect_language(question, tuple(supported_languages))
+    
+    if question_language not in supported_languages:
+        question_language = 'English'
+    return question_language
+
+def pack_candidates(question_embedding, candidates: list, stats: dict = None) -> list:
+    """
+    Pack retrieved chunks into a de-duplicated, token-budgeted context
+    """
+    with timed('context_pack'):
+        packed_chunks, report = pack_context(
+            question_embedding,
+            candidates,
+            token_budget=CONTEXT_TOKEN_BUDGET,
+            max_chunks=CONTEXT_MAX_CHUNKS,
+            lambda_mult=CONTEXT_MMR_LAMBDA,
+            duplicate_threshold=CONTEXT_DUPLICATE_THRESHOLD,
+            sentence_threshold=CONTEXT_SENTENCE_THRESHOLD,
+            encode=lambda sentences: embedding_model.encode(sentences, normalize_embeddings=True,
+                                                            show_progress_bar=False)
+        )
+    if stats is not None:
+        stats['context'] = report
+    return packed_chunks
+
+def retrieve_context(question_embedding, stats: dict = None, store: DocumentStore = None) -> list:
+    """
+    Search `store` (default: the process's document_store) and the archive and
+    pack the hits into the prompt context
+    """
+    store = store if store is not None else document_store
+    candidates = search_stores([store, archive_store], [question_embedding], k=RETRIEVAL_K,
+                               return_embeddings=True)[0]
+    return pack_candidates(question_embedding, candidates, stats)
+
+def record_prompt_tokens(prompt: str, stats: dict = None) -> None:
+    prompt_tokens = estimate_tokens(prompt)
+    if stats is not None:
+        stats['prompt_tokens'] = prompt_tokens
+    logger.info(f"Prompt tokens (estimated): {prompt_tokens}")
+
+@profiled('answer', lambda question, *args, **kwargs: short_hash(indexed_document_id(kwargs.get('store')), question))
+def get_answer(question: str, input_language: str = None, translation_language: str = None,
+               stats: dict = None, store: DocumentStore = None) -> str:
+    """
+    Answer a question from `store` (default: the process's document_store) and
+    the archive. If a stats dict is passed it
+    receives the context-packing report, the estimated prompt token count, the
+    LLM queue wait and generation time (seconds) and, with metrics enabled, a
+    per-stage 'trace'.
+    """
+    with start_trace('get_answer') as trace:
+        answer = _get_answer(question, input_language, translation_language, stats, store)
+    if trace is not None and stats is not None:
+        stats['trace'] = trace.summary()
+    return answer
+
+def _get_answer(question: str, input_language: str, translation_language: str, stats: dict,
+                store: DocumentStore) -> str:
+    question_language = 'English'
+    try:
+        question_language = resolve_question_language(question, input_language, translation_language)
+        
+        question_embedding = encode_query(question)
         
-        response = model.generate_content(prompt)
+        document_id = indexed_document_id(store)
+        cached_answer = answer_cache.get(document_id, question_language, question, question_embedding)
+        if cached_answer is not None:
+            return cached_answer
         
-        if response.text:
-            return response.text.strip()
+        relevant_chunks = retrieve_context(question_embedding, stats, store)
+        
+        if not relevant_chunks:
+            return get_language_error_message(question_language, 'no_results')
+        
+        prompt = build_prompt(question, question_language, relevant_chunks)
+        record_prompt_tokens(prompt, stats)
+        
+        result = dispatcher.generate(document_id, prompt, timeout=LLM_TIMEOUT)
+        if stats is not None:
+            stats.update(queue_wait=result['queue_wait'], generation_time=result['generation_time'],
+                         coalesced=result['coalesced'])
+        
+        if result['text']:
+            answer = result['text'].strip()
+            answer_cache.put(document_id, question_language, question, question_embedding, answer)
+            return answer
         else:
             return get_language_error_message(question_language, 'no_answer')
             
+    except DeadlineExceeded as e:
+        print(f"Timeout in get_answer: {str(e)}", file=sys.stderr)
+        return get_language_error_message(question_language, 'timeout')
     except Exception as e:
         print(f"Error in get_answer: {str(e)}", file=sys.stderr)
         return get_language_error_message(question_language, 'general_error')
 
+@profiled('answer', lambda question, *args, **kwargs: short_hash(indexed_document_id(kwargs.get('store')), question))
+def stream_answer(question: str, input_language: str = None, translation_language: str = None,
+                  cancel_event: threading.Event = None, stats: dict = None,
+                  store: DocumentStore = None) -> Iterator[str]:
+    """
+    Streaming variant of get_answer that yields the answer text as the backend produces it.
+
+    Setting cancel_event (or closing the generator) stops generation; a cancelled
+    answer is not cached. If a stats dict is passed it receives 'cached', 'cancelled',
+    'time_to_first_token' and 'total_latency' (seconds), plus the context report,
+    'prompt_tokens', 'queue_wait' and 'generation_time' when the model is called,
+    and a per-stage 'trace' when metrics are enabled.
+    """
+    stats = stats if stats is not None else {}
+    trace = new_trace('stream_answer')
+    yield from traced(trace, _stream_answer(question, input_language, translation_language, cancel_event, stats,
+                                            store, trace))
+
+def _stream_answer(question: str, input_language: str, translation_language: str,
+                   cancel_event: threading.Event, stats: dict, store: DocumentStore, trace) -> Iterator[str]:
+    stats.update({'cached': False, 'cancelled': False, 'time_to_first_token': None, 'total_latency': None})
+    start = time.perf_counter()
+    question_language = 'English'
+    try:
+        question_language = resolve_question_language(question, input_language, translation_language)
+    
+        question_embedding = encode_query(question)
+    
+        document_id = indexed_document_id(store)
+        cached_answer = answer_cache.get(document_id, question_language, question, question_embedding)
+        if cached_answer is not None:
+            stats['cached'] = True
+            stats['time_to_first_token'] = time.perf_counter() - start
+            yield cached_answer
+            return
+    
+        relevant_chunks = retrieve_context(question_embedding, stats, store)
+    
+        if not relevant_chunks:
+            yield get_language_error_message(question_language, 'no_results')
+            return
+    
+        prompt = build_prompt(question, question_language, relevant_chunks)
+        record_prompt_tokens(prompt, stats)
+    
+        parts = []
+        for text in dispatcher.stream(prompt, timeout=LLM_TIMEOUT, stats=stats):
+            if cancel_event is not None and cancel_event.is_set():
+                stats['cancelled'] = True
+                break
+            if stats['time_to_first_token'] is None:
+                stats['time_to_first_token'] = time.perf_counter() - start
+            parts.append(text)
+            yield text
+    
+        answer = ''.join(parts).strip()
+        if stats['cancelled']:
+            return
+        if answer:
+            answer_cache.put(document_id, question_language, question, question_embedding, answer)
+        else:
+            yield get_language_error_message(question_language, 'no_answer')
+
+    except GeneratorExit:
+        stats['cancelled'] = True
+        raise
+    except DeadlineExceeded as e:
+        print(f"Timeout in stream_answer: {str(e)}", file=sys.stderr)
+        yield get_language_error_message(question_language, 'timeout')
+    except Exception as e:
+        print(f"Error in stream_answer: {str(e)}", file=sys.stderr)
+        yield get_language_error_message(question_language, 'general_error')
+    finally:
+        stats['total_latency'] = time.perf_counter() - start
+        if trace is not None:
+            stats['trace'] = trace.summary()
+        logger.info(f"Answer stream finished: ttft={stats['time_to_first_token']} "
+                    f"total={stats['total_latency']:.3f}s cached={stats['cached']} cancelled={stats['cancelled']}")
+
 def get_language_error_message(language: str, error_type: str) -> str:
 
     messages = {
         'Marathi': {
             'no_results': 'माफ करा, या प्रश्नासंबंधी कोणतेही उपयुक्त संदर्भ मिळाले नाहीत.',
             'no_answer': 'माफ करा, या प्रश्नाचे उत्तर देण्यासाठी प्रासंगिक माहिती सापडली नाही.',
-            'general_error': 'त्रुटी आली: {}'
+            'general_error': 'त्रुटी आली: {}',
+            'timeout': 'माफ करा, उत्तर तयार होण्यास खूप वेळ लागला. कृपया पुन्हा प्रयत्न करा.'
         },
         'Hindi': {
             'no_results': 'क्षमा करें, इस प्रश्न के लिए कोई प्रासंगिक संदर्भ नहीं मिला।',
             'no_answer': 'क्षमा करें, इस प्रश्न का उत्तर देने के लिए प्रासंगिक जानकारी नहीं मिली।',
-            'general_error': 'त्रुटि आई: {}'
+            'general_error': 'त्रुटि आई: {}',
+            'timeout': 'क्षमा करें, उत्तर तैयार होने में बहुत समय लगा। कृपया पुनः प्रयास करें।'
         },
         'English': {
             'no_results': 'I\'m sorry, I could not find any relevant context to answer your question.',
             'no_answer': 'I apologize, I could not find any information to provide an answer to your question.',
-            'general_error': 'An error occurred: {}'
+            'general_error': 'An error occurred: {}',
+            'timeout': 'I\'m sorry, generating the answer took too long. Please try again.'
         }
     }
     
@@ -0,0 +1,157 @@
+# script_detection.py
+import bisect
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from typing import Optional, Tuple, List
+
+# (first code point, last code point, script)
+SCRIPT_RANGES = sorted([
+    (0x0041, 0x005A, 'Latin'),
+    (0x0061, 0x007A, 'Latin'),
+    (0x00C0, 0x024F, 'Latin'),
+    (0x0600, 0x06FF, 'Arabic'),
+    (0x0750, 0x077F, 'Arabic'),
+    (0x0900, 0x097F, 'Devanagari'),
+    (0x0980, 0x09FF, 'Bengali'),
+    (0x0A00, 0x0A7F, 'Gurmukhi'),
+    (0x0A80, 0x0AFF, 'Gujarati'),
+    (0x0B00, 0x0B7F, 'Oriya'),
+    (0x0B80, 0x0BFF, 'Tamil'),
+    (0x0C00, 0x0C7F, 'Telugu'),
+    (0x0C80, 0x0CFF, 'Kannada'),
+    (0x0D00, 0x0D7F, 'Malayalam'),
+    (0x1C50, 0x1C7F, 'Ol Chiki'),
+    (0xA8E0, 0xA8FF, 'Devanagari'),
+    (0xABC0, 0xABFF, 'Meetei Mayek'),
+    (0xFB50, 0xFDFF, 'Arabic'),
+    (0xFE70, 0xFEFF, 'Arabic'),
+])
+_RANGE_STARTS = [start for start, _, _ in SCRIPT_RANGES]
+
+# Languages from LANGUAGE_MAP written in each script; the first one is the default.
+# Bihari and Pali have no markers of their own, so they are only returned when the
+# caller prefers them (e.g. the document's input language); otherwise Bihari text
+# comes back as Bhojpuri or Maithili and Pali as the Devanagari default, Hindi.
+SCRIPT_LANGUAGES = {
+    'Latin': ['English'],
+    'Devanagari': ['Hindi', 'Marathi', 'Nepali', 'Maithili', 'Bhojpuri', 'Goan', 'Bihari', 'Pali'],
+    'Bengali': ['Bengali', 'Assamese', 'Meetei'],
+    'Gurmukhi': ['Punjabi'],
+    'Gujarati': ['Gujarati'],
+    'Oriya': ['Oriya'],
+    'Tamil': ['Tamil'],
+    'Telugu': ['Telugu'],
+    'Kannada': ['Kannada'],
+    'Malayalam': ['Malayalam'],
+    'Arabic': ['Urdu'],
+    'Ol Chiki': ['Santali'],
+    'Meetei Mayek': ['Meetei'],
+}
+
+# Cheap lexical evidence for languages that share a script.
+MARKER_CHARACTERS = {
+    'Assamese': set('ৰৱ'),
+    'Marathi': set('ळ'),
+}
+MARKER_WORDS = {
+    'Hindi': {'है', 'हैं', 'और', 'क्या', 'में', 'का', 'की', 'के', 'नहीं', 'यह', 'था'},
+    'Marathi': {'आहे', 'आहेत', 'आणि', 'काय', 'नाही', 'या', 'हे', 'होते', 'मध्ये', 'च्या'},
+    'Nepali': {'छ', 'छन्', 'हो', 'यो', 'को', 'मा', 'गर्नु', 'हुन्छ', 'भएको', 'के'},
+    'Maithili': {'अछि', 'एहि', 'सभ', 'छथि', 'हमर', 'अहाँ'},
+    'Bhojpuri': {'बा', 'बाटे', 'ई', 'रहल', 'हवे', 'बानी'},
+    'Goan': {'आसा', 'कितें', 'ह्या', 'जाल्यार', 'आनी'},
+}
+
+# Umbrella languages and the marker languages that belong to them: a preferred
+# Bihari wins over a Bhojpuri or Maithili marker match.
+LANGUAGE_GROUPS = {
+    'Bihari': ('Bhojpuri', 'Maithili'),
+}
+
+# langdetect codes for the languages it can tell apart within a script.
+LANGDETECT_CODES = {
+    'English': 'en', 'Hindi': 'hi', 'Marathi': 'mr', 'Nepali': 'ne', 'Bengali': 'bn',
+    'Punjabi': 'pa', 'Gujarati': 'gu', 'Tamil': 'ta', 'Telugu': 'te', 'Kannada': 'kn',
+    'Malayalam': 'ml', 'Urdu': 'ur'
+}
+
+def char_script(ch: str) -> Optional[str]:
+    code_point = ord(ch)
+    i = bisect.bisect_right(_RANGE_STARTS, code_point) - 1
+    if i >= 0 and SCRIPT_RANGES[i][0] <= code_point <= SCRIPT_RANGES[i][1]:
+        return SCRIPT_RANGES[i][2]
+    return None
+
+def detect_script(text: str) -> Optional[str]:
+    """
+    Return the script used by most letters in the text, or None if it has no letters
+    """
+    counts = Counter()
+    for ch in text:
+        script = char_script(ch)
+        if script is not None:
+            counts[script] += 1
+    if not counts:
+        return None
+    return counts.most_common(1)[0][0]
+
+def _marker_scores(text: str, candidates: List[str]) -> Counter:
+    scores = Counter()
+    words = [word.strip('?!.,।॥"\'()') for word in text.split()]
+    for language in candidates:
+        scores[language] += sum(1 for ch in text if ch in MARKER_CHARACTERS.get(language, ()))
+        scores[language] += sum(1 for word in words if word in MARKER_WORDS.get(language, ()))
+    return scores
+
+def _statistical_guess(text: str, candidates: List[str]) -> Optional[str]:
+    """Ask langdetect, but only accept languages from the script's candidate list"""
+    codes = {LANGDETECT_CODES[lang]: lang for lang in candidates if lang in LANGDETECT_CODES}
+    if len(codes) < 2:
+        return None
+    try:
+        from langdetect import DetectorFactory, detect_langs, LangDetectException
+    except ImportError:
+        return None
+    DetectorFactory.seed = 0
+    try:
+        for guess in detect_langs(text):
+            if guess.lang in codes:
+                return codes[guess.lang]
+    except LangDetectException:
+        pass
+    return None
+
+@lru_cache(maxsize=4096)
+def detect_language(text: str, preferred: Tuple[str, ...] = ()) -> str:
+    """
+    Detect the language of the text from its Unicode script.
+
+    Scripts used by a single language are answered directly. Within a shared script
+    (e.g. Devanagari) the order is: marker characters/words (a preferred umbrella
+    language from LANGUAGE_GROUPS wins over its members), then a language from
+    `preferred` written in that script, then langdetect limited to that script's
+    languages, then the script's default language. Returns 'English' if no script
+    is recognised.
+    """
+    text = unicodedata.normalize('NFC', text)
+    script = detect_script(text)
+    if script is None:
+        return 'English'
+    candidates = SCRIPT_LANGUAGES[script]
+    if len(candidates) == 1:
+        return candidates[0]
+
+    scores = _marker_scores(text, candidates)
+    ranked = scores.most_common(2)
+    if ranked and ranked[0][1] > 0 and (len(ranked) == 1 or ranked[0][1] > ranked[1][1]):
+        for language in preferred:
+            if ranked[0][0] in LANGUAGE_GROUPS.get(language, ()):
+                return language
+        return ranked[0][0]
+
+    for language in preferred:
+        if language in candidates:
+            return language
+
+    return _statistical_guess(text, candidates) or candidates[0]
@@ -0,0 +1,229 @@
+# session_store.py
+"""
+Memory-bounded storage for per-session page text (extracted and translated
+documents).
+
+    st.session_state.text_dict = session_store.pages(session_id, 'text', pages)
+
+returns a PageStore, a read-only mapping of page -> text that keeps pages in
+process memory while the session and the whole process are within their
+budgets, and writes the rest to a file under SESSION_STORE_DIR. Pages on disk
+are read back one at a time when they are looked up, so a 500-page document
+costs one page of memory per rerun of the page selector.
+
+When the global budget runs out, the least recently used stores of other
+sessions are moved to disk to make room. Stores delete their file when they
+are replaced, released on logout, or garbage collected with their session.
+session_store.stats() reports the accounting per session.
+"""
+import atexit
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+SESSION_STORE_DIR = os.getenv('SESSION_STORE_DIR', os.path.join('.cache', 'sessions'))
+# Bytes of page text one session may keep in memory.
+SESSION_MEMORY_BUDGET = int(os.getenv('SESSION_MEMORY_BUDGET', str(16 * 1024 * 1024)))
+# Bytes of page text all sessions of this process may keep in memory.
+GLOBAL_MEMORY_BUDGET = int(os.getenv('GLOBAL_MEMORY_BUDGET', str(256 * 1024 * 1024)))
+
+class PageStore(Mapping):
+    """Pages of one document; each page is held in memory or at an offset in the store's file"""
+    def __init__(self, owner: 'SessionStore', session_id: str, name: str, path: str):
+        self.session_id = session_id
+        self.name = name
+        self.path = path
+        self.last_used = time.monotonic()
+        self._owner = owner
+        self._order = []
+        self._memory: Dict[Any, str] = {}
+        self._offsets: Dict[Any, tuple] = {}
+        self._lock = threading.Lock()
+        # [bytes in memory, bytes on disk], shared with the finalizer so accounting
+        # is released even if the session disappears without logging out.
+        self._usage = [0, 0]
+        self._finalizer = weakref.finalize(self, owner._discard, session_id, self._usage, path)
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._usage[0]
+
+    @property
+    def disk_bytes(self) -> int:
+        return self._usage[1]
+
+    def _write(self, page, text: str) -> None:
+        data = text.encode('utf-8')
+        with open(self.path, 'ab') as f:
+            offset = f.tell()
+            f.write(data)
+        self._offsets[page] = (offset, len(data))
+        self._usage[1] += len(data)
+
+    def put(self, page, text: str) -> None:
+        """Add one page, in memory if the budgets allow it, otherwise on disk"""
+        size = sys.getsizeof(text)
+        in_memory = self._owner._reserve(self, size)
+        with self._lock:
+            if page not in self._memory and page not in self._offsets:
+                self._order.append(page)
+            if in_memory:
+                self._memory[page] = text
+            else:
+                self._write(page, text)
+
+    def spill(self) -> int:
+        """Move every in-memory page to disk; returns the bytes freed"""
+        with self._lock:
+            freed = 0
+            for page, text in list(self._memory.items()):
+                self._write(page, text)
+                freed += sys.getsizeof(text)
+                del self._memory[page]
+            self._usage[0] -= freed
+            return freed
+
+    @property
+    def alive(self) -> bool:
+        return self._finalizer.alive
+
+    def close(self) -> None:
+        """Drop the pages, delete the file and release the accounting"""
+        self._finalizer()
+        with self._lock:
+            self._order = []
+            self._memory.clear()
+            self._offsets.clear()
+
+    def __getitem__(self, page) -> str:
+        self.last_used = time.monotonic()
+        with self._lock:
+            text = self._memory.get(page)
+            if text is not None:
+                return text
+            offset, length = self._offsets[page]
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                return f.read(length).decode('utf-8')
+
+    def __iter__(self) -> Iterator:
+        return iter(list(self._order))
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __contains__(self, page) -> bool:
+        return page in self._memory or page in self._offsets
+
+class SessionStore:
+    """Creates PageStores and enforces the per-session and global memory budgets"""
+    def __init__(self, directory: str = SESSION_STORE_DIR, session_budget: int = SESSION_MEMORY_BUDGET,
+                 global_budget: int = GLOBAL_MEMORY_BUDGET):
+        self.directory = directory
+        self.session_budget = session_budget
+        self.global_budget = global_budget
+        self._root: Optional[str] = None
+        self._stores: 'weakref.WeakValueDictionary[tuple, PageStore]' = weakref.WeakValueDictionary()
+        self._session_memory: Dict[str, int] = {}
+        self._memory_total = 0
+        self._spills = 0
+        # Reentrant because a PageStore finalizer may run (from the garbage collector) while it is held.
+        self._lock = threading.RLock()
+
+    def _file_path(self, session_id: str, name: str) -> str:
+        with self._lock:
+            if self._root is None:
+                # One directory per process, so several app processes can share SESSION_STORE_DIR.
+                os.makedirs(self.directory, exist_ok=True)
+                self._root = tempfile.mkdtemp(prefix='pages-', dir=self.directory)
+                atexit.register(shutil.rmtree, self._root, True)
+        return os.path.join(self._root, f"{session_id}-{name}-{uuid.uuid4().hex[:8]}.pages")
+
+    def pages(self, session_id: str, name: str, text_dict: Mapping) -> PageStore:
+        """Store `text_dict` as this session's `name` document, replacing any previous one"""
+        previous = self._stores.get((session_id, name))
+        if previous is not None:
+            previous.close()
+        store = PageStore(self, session_id, name, self._file_path(session_id, name))
+        with self._lock:
+            self._stores[(session_id, name)] = store
+        for page, text in text_dict.items():
+            store.put(page, text)
+        logger.debug(f"Session {session_id} {name}: {len(store)} pages, "
+                     f"{store.memory_bytes} bytes in memory, {store.disk_bytes} on disk")
+        return store
+
+    def _reserve(self, store: PageStore, size: int) -> bool:
+        """Account `size` bytes of memory to `store` if the budgets allow it"""
+        with self._lock:
+            session_memory = self._session_memory.get(store.session_id, 0)
+            if session_memory + size > self.session_budget:
+                return False
+            if self._memory_total + size > self.global_budget:
+                others = sorted((s for s in list(self._stores.values())
+                                 if s.alive and s.session_id != store.session_id and s.memory_bytes),
+                                key=lambda s: s.last_used)
+                for other in others:
+                    freed = other.spill()
+                    self._memory_total -= freed
+                    self._session_memory[other.session_id] -= freed
+                    self._spills += 1
+                    logger.info(f"Moved {freed} bytes of session {other.session_id} {other.name} to disk")
+                    if self._memory_total + size <= self.global_budget:
+                        break
+                else:
+                    return False
+            self._memory_total += size
+            self._session_memory[store.session_id] = session_memory + size
+            store._usage[0] += size
+            return True
+
+    def _discard(self, session_id: str, usage: list, path: str) -> None:
+        with self._lock:
+            self._memory_total -= usage[0]
+            remaining = self._session_memory.get(session_id, 0) - usage[0]
+            if remaining > 0:
+                self._session_memory[session_id] = remaining
+            else:
+                self._session_memory.pop(session_id, None)
+            usage[0] = usage[1] = 0
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not delete {path}: {str(e)}")
+
+    def release(self, session_id: str) -> None:
+        """Close every store of a session, e.g. on logout"""
+        for store in [s for s in list(self._stores.values()) if s.alive and s.session_id == session_id]:
+            store.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Memory and disk use per session and in total, for operators"""
+        sessions: Dict[str, Dict[str, int]] = {}
+        for store in [s for s in list(self._stores.values()) if s.alive]:
+            entry = sessions.setdefault(store.session_id, {'memory_bytes': 0, 'disk_bytes': 0, 'pages': 0})
+            entry['memory_bytes'] += store.memory_bytes
+            entry['disk_bytes'] += store.disk_bytes
+            entry['pages'] += len(store)
+        return {
+            'memory_bytes': self._memory_total,
+            'disk_bytes': sum(entry['disk_bytes'] for entry in sessions.values()),
+            'session_budget': self.session_budget,
+            'global_budget': self.global_budget,
+            'spills': self._spills,
+            'sessions': sessions
+        }
+
+session_store = SessionStore()
@@ -0,0 +1,144 @@
+# stub_server.py
+"""
+Local stand-in for the Gemini API (and OpenAI chat completions) with configurable
+latency and token rate, plus a LibreTranslate-style /translate endpoint, for
+benchmarking and load-testing without live calls.
+
+Usage:
+    python stub_server.py --port 8765 --latency 0.3 --tokens-per-second 40 --answer-tokens 120
+    LLM_BACKEND=http LLM_BASE_URL=http://127.0.0.1:8765 streamlit run signup.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+class StubConfig:
+    def __init__(self, latency: float = 0.3, tokens_per_second: float = 40.0, answer_tokens: int = 120,
+                 translate_latency: float = 0.2, translate_error_rate: float = 0.0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.translate_latency = translate_latency
+        self.translate_error_rate = translate_error_rate
+
+def _answer_tokens(prompt: str, count: int):
+    words = prompt.split()[-20:] or ['answer']
+    return [f"{words[i % len(words)]} " for i in range(count)]
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    config = StubConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _send_json(self, payload: dict, status: int = 200) -> None:
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @staticmethod
+    def _gemini_payload(text: str) -> dict:
+        return {'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}, 'finishReason': 'STOP'}]}
+
+    def do_POST(self):
+        path = self.path.split('?', 1)[0]
+        request = self._read_json()
+        if path.endswith(':generateContent') or path.endswith(':streamGenerateContent'):
+            prompt = ''.join(part.get('text', '') for content in request.get('contents', [])
+                             for part in content.get('parts', []))
+            self._generate(prompt, stream=path.endswith(':streamGenerateContent'), openai=False)
+        elif path == '/translate':
+            # LibreTranslate-style: {"q", "source", "target"} -> {"translatedText"}
+            # A list in "q" is a batch request and gets a list back.
+            time.sleep(self.config.translate_latency)
+            if random.random() < self.config.translate_error_rate:
+                self._send_json({'error': 'stub translation failure'}, status=503)
+                return
+            texts = request.get('q', '')
+            target = request.get('target')
+            if isinstance(texts, list):
+                self._send_json({'translatedText': [f"[{target}] {text}" for text in texts]})
+            else:
+                self._send_json({'translatedText': f"[{target}] {texts}"})
+        elif path == '/v1/chat/completions':
+            prompt = ''.join(message.get('content', '') for message in request.get('messages', []))
+            self._generate(prompt, stream=bool(request.get('stream')), openai=True)
+        else:
+            self._send_json({'error': {'message': f'Unknown path {path}'}}, status=404)
+
+    def _generate(self, prompt: str, stream: bool, openai: bool) -> None:
+        config = self.config
+        tokens = _answer_tokens(prompt, config.answer_tokens)
+        time.sleep(config.latency)
+
+        if not stream:
+            time.sleep(len(tokens) / config.tokens_per_second)
+            text = ''.join(tokens)
+            if openai:
+                self._send_json({'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}}]})
+            else:
+                self._send_json(self._gemini_payload(text))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        step = max(1, int(config.tokens_per_second / 10))
+        for i in range(0, len(tokens), step):
+            time.sleep(step / config.tokens_per_second)
+            piece = ''.join(tokens[i:i + step])
+            if openai:
+                event = {'choices': [{'index': 0, 'delta': {'content': piece}}]}
+            else:
+                event = self._gemini_payload(piece)
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+        if openai:
+            self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+def make_stub_server(host: str = '127.0.0.1', port: int = 0, config: StubConfig = None) -> ThreadingHTTPServer:
+    handler = type('ConfiguredStubHandler', (StubHandler,), {'config': config or StubConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def start_stub_server(host: str = '127.0.0.1', port: int = 0,
+                      config: StubConfig = None) -> Tuple[ThreadingHTTPServer, str]:
+    """Run the stub in a daemon thread; returns the server and its base URL"""
+    server = make_stub_server(host, port, config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Gemini/OpenAI-compatible stub server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.3, help='seconds before the first token')
+    parser.add_argument('--tokens-per-second', type=float, default=40.0)
+    parser.add_argument('--answer-tokens', type=int, default=120)
+    parser.add_argument('--translate-latency', type=float, default=0.2, help='seconds per /translate call')
+    parser.add_argument('--translate-error-rate', type=float, default=0.0, help='fraction of /translate calls failing')
+    args = parser.parse_args()
+
+    server = make_stub_server(args.host, args.port,
+                              StubConfig(args.latency, args.tokens_per_second, args.answer_tokens,
+                                         args.translate_latency, args.translate_error_rate))
+    print(f"Stub server listening on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# test_database.py
+import os
+
+import numpy as np
+import pytest
+
+from database import CHECKPOINT_FILE, DocumentStore, search_stores
+
+DIMENSION = 8
+
+def embedded(start, count, seed=0):
+    rng = np.random.default_rng(seed + start)
+    return {start: [{'text': f'chunk {start + i}', 'embedding': rng.random(DIMENSION, dtype='float32'),
+                     'language': 'english'} for i in range(count)]}
+
+@pytest.mark.parametrize('index_type', ['flat', 'fp16'])
+def test_checkpoints_append_and_load_back(tmp_path, index_type):
+    store = DocumentStore(index_type=index_type)
+    store.add_to_database(embedded(0, 5))
+    store.save(str(tmp_path), {'sources': ['a.pdf']})
+    files = {name: os.path.getmtime(tmp_path / name) for name in os.listdir(tmp_path) if name.startswith('chunks-')}
+    store.add_to_database(embedded(5, 3))
+    store.save(str(tmp_path), {'sources': ['a.pdf', 'b.pdf']})
+    # The second checkpoint appends to the same chunk file instead of starting a new one.
+    assert [name for name in os.listdir(tmp_path) if name.startswith('chunks-')] == list(files)
+
+    loaded = DocumentStore()
+    assert loaded.load(str(tmp_path)) == {'sources': ['a.pdf', 'b.pdf']}
+    assert loaded.index_type == index_type
+    assert loaded.current_id == 8
+    assert loaded.document_id == store.document_id
+    query = embedded(5, 1)[5][0]['embedding']
+    assert loaded.search_database(query, k=1)[0]['text'] == 'chunk 5'
+
+def test_rows_written_after_the_checkpoint_are_dropped(tmp_path):
+    store = DocumentStore()
+    store.add_to_database(embedded(0, 4))
+    store.save(str(tmp_path))
+    for name in os.listdir(tmp_path):
+        if name != CHECKPOINT_FILE:
+            with open(tmp_path / name, 'ab') as f:
+                f.write(b'\x00' * 37)
+
+    loaded = DocumentStore()
+    loaded.load(str(tmp_path))
+    assert loaded.current_id == 4
+    assert loaded.index.ntotal == 4
+
+def test_load_rejects_files_shorter_than_the_checkpoint(tmp_path):
+    store = DocumentStore()
+    store.add_to_database(embedded(0, 4))
+    store.save(str(tmp_path))
+    vectors_file = next(name for name in os.listdir(tmp_path) if name.startswith('vectors-'))
+    os.truncate(tmp_path / vectors_file, 4 * DIMENSION)
+    with pytest.raises(ValueError, match='checkpoint expects'):
+        DocumentStore().load(str(tmp_path))
+
+def test_search_stores_merges_by_distance():
+    session, archive = DocumentStore(), DocumentStore()
+    session.add_to_database(embedded(0, 3))
+    archive.add_to_database(embedded(10, 3))
+    query = embedded(10, 1)[10][0]['embedding']
+    hits = search_stores([session, archive], [query], k=4)[0]
+    assert len(hits) == 4
+    assert hits[0]['text'] == 'chunk 10'
+    assert 'embedding' not in hits[0]
+    session.clear()
+    assert [hit['text'] for hit in search_stores([session, archive], [query], k=1)[0]] == ['chunk 10']
+
+def test_loading_a_directory_that_is_still_being_written(tmp_path):
+    writer = DocumentStore(index_type='fp16')
+    writer.add_to_database(embedded(0, 5))
+    writer.save(str(tmp_path))
+    writer.add_to_database(embedded(5, 5))
+    # A reader (the app, batch_qa) loads while the writer has unsaved rows on disk.
+    reader = DocumentStore()
+    reader.load(str(tmp_path))
+    assert reader.current_id == 5
+    writer.save(str(tmp_path))
+
+    loaded = DocumentStore()
+    loaded.load(str(tmp_path))
+    assert loaded.current_id == 10
+    query = embedded(5, 1)[5][0]['embedding']
+    assert loaded.search_database(query, k=1)[0]['text'] == 'chunk 5'
@@ -0,0 +1,91 @@
+# test_firebase.py
+"""
+get_user_info() against a fake Firestore client: after the first read, reruns
+of the same session are served from the session's cache.
+"""
+import sys
+import types
+
+import pytest
+
+def _stand_in(name, **attributes):
+    """Minimal module for a dependency this environment lacks; the tests replace what they use"""
+    try:
+        __import__(name)
+    except ImportError:
+        sys.modules[name] = types.SimpleNamespace(**attributes)
+
+_stand_in('firebase_admin', _apps={}, credentials=None, auth=None,
+          firestore=types.SimpleNamespace(SERVER_TIMESTAMP=object()))
+_stand_in('streamlit')
+
+import firebase
+
+class FakeSessionState(dict):
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+class FakeDocument:
+    def __init__(self, client, uid):
+        self.client = client
+        self.uid = uid
+
+    def get(self):
+        self.client.reads += 1
+        data = self.client.users.get(self.uid)
+        return types.SimpleNamespace(exists=data is not None, to_dict=lambda: dict(data))
+
+    def update(self, fields):
+        self.client.writes += 1
+        self.client.users[self.uid].update(fields)
+
+class FakeClient:
+    def __init__(self, users):
+        self.users = users
+        self.reads = 0
+        self.writes = 0
+
+    def collection(self, name):
+        assert name == 'user'
+        return types.SimpleNamespace(document=lambda uid: FakeDocument(self, uid))
+
+@pytest.fixture
+def session(monkeypatch):
+    client = FakeClient({'u1': {'name': 'Asha', 'email': 'asha@example.com'}})
+    state = FakeSessionState(user=types.SimpleNamespace(uid='u1'))
+    monkeypatch.setattr(firebase, '_db', client)
+    monkeypatch.setattr(firebase, 'st', types.SimpleNamespace(session_state=state, error=pytest.fail))
+    monkeypatch.setattr(firebase, 'firestore_stats', {'reads': 0, 'writes': 0})
+    return client, state
+
+def test_reruns_read_no_documents_after_the_first(session):
+    client, _ = session
+    assert firebase.get_user_info()['name'] == 'Asha'
+    assert firebase.firestore_stats['reads'] == 1
+
+    firebase.firestore_stats['reads'] = 0
+    for _ in range(20):
+        assert firebase.get_user_info()['name'] == 'Asha'
+    assert firebase.firestore_stats['reads'] == 0
+    assert client.reads == 1
+
+def test_update_invalidates_the_cached_profile(session):
+    client, _ = session
+    firebase.get_user_info()
+    assert firebase.update_user_info({'name': 'Asha K'})
+    assert firebase.get_user_info()['name'] == 'Asha K'
+    assert client.reads == 2
+    assert firebase.firestore_stats == {'reads': 2, 'writes': 1}
+
+def test_expired_cache_is_read_again(session, monkeypatch):
+    client, _ = session
+    firebase.get_user_info()
+    monkeypatch.setattr(firebase, 'USER_INFO_TTL', 0)
+    firebase.get_user_info()
+    assert client.reads == 2
@@ -0,0 +1,38 @@
+# test_job_queue.py
+import pytest
+
+import job_queue
+from job_queue import DONE, FAILED, RUNNING, JobQueue
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    # Leases that expire as soon as they are granted, as if every worker died.
+    monkeypatch.setattr(job_queue, 'JOB_LEASE_SECONDS', -1)
+    monkeypatch.setattr(job_queue, 'JOB_MAX_ATTEMPTS', 2)
+    return JobQueue(str(tmp_path / 'jobs.sqlite3'), str(tmp_path / 'files'))
+
+def test_expired_job_fails_after_max_attempts(queue):
+    job_id = queue.enqueue('extract', {})
+    assert queue.claim('worker-1')['attempts'] == 1
+    assert queue.claim('worker-2')['attempts'] == 2
+    assert queue.claim('worker-3') is None
+    job = queue.get(job_id)
+    assert job['status'] == FAILED
+    assert 'attempts' in job['error']
+
+def test_only_the_current_worker_finishes_a_job(queue):
+    job_id = queue.enqueue('extract', {})
+    queue.claim('worker-1')
+    queue.claim('worker-2')
+    queue.complete(job_id, 'worker-1')
+    queue.fail(job_id, 'worker-1', 'stale')
+    assert queue.get(job_id)['status'] == RUNNING
+    queue.fail(job_id, 'worker-2', 'boom')
+    assert queue.get(job_id)['status'] == FAILED
+
+def test_complete(queue):
+    job_id = queue.enqueue('embed', {})
+    queue.claim('worker-1')
+    queue.complete(job_id, 'worker-1')
+    assert queue.get(job_id)['status'] == DONE
+    assert queue.counts() == {DONE: 1}
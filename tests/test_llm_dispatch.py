@@ -0,0 +1,39 @@
+# test_llm_dispatch.py
+import threading
+import time
+
+import pytest
+
+from llm_backend import LLMBackend
+from llm_dispatch import DeadlineExceeded, LLMDispatcher
+
+class SlowBackend(LLMBackend):
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def generate(self, prompt, timeout=None):
+        time.sleep(self.seconds)
+        return prompt
+
+def test_calls_without_deadline_queue_for_a_slot():
+    dispatcher = LLMDispatcher(lambda: SlowBackend(0.1), max_concurrency=1)
+    results = []
+    threads = [threading.Thread(target=lambda i=i: results.append(dispatcher.generate('doc', f'prompt {i}')['text']))
+               for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == ['prompt 0', 'prompt 1', 'prompt 2']
+
+def test_deadline_from_the_worker_is_raised_unchanged():
+    dispatcher = LLMDispatcher(lambda: SlowBackend(0.3), max_concurrency=1)
+    busy = threading.Thread(target=dispatcher.generate, args=('doc', 'first'))
+    busy.start()
+    time.sleep(0.05)
+    # A request with a short deadline gives up waiting for the busy slot; a caller
+    # coalesced onto it with a longer timeout must see that error, not its own.
+    dispatcher.submit('doc', 'second', timeout=0.05)
+    with pytest.raises(DeadlineExceeded, match='No LLM slot'):
+        dispatcher.generate('doc', 'second', timeout=1.0)
+    busy.join()
@@ -0,0 +1,40 @@
+# test_metrics.py
+import metrics
+
+def test_traced_generator_does_not_leave_its_trace_set(monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_ENABLED', True)
+    seen = []
+
+    def produce():
+        try:
+            for stage in ('first', 'second'):
+                seen.append(metrics._current_trace.get())
+                metrics.observe(stage, 0.01)
+                yield stage
+        finally:
+            metrics.observe('cleanup', 0.01)
+
+    trace = metrics.new_trace('stream')
+    stream = metrics.traced(trace, produce())
+    assert next(stream) == 'first'
+    # Between items the consumer's context has no trace, so its own stages stay out of it.
+    assert metrics._current_trace.get() is None
+    metrics.observe('consumer', 0.01)
+    stream.close()
+    assert seen == [trace]
+    assert set(trace.summary()['stages']) == {'first', 'cleanup'}
+
+def test_provider_health_is_exported(monkeypatch):
+    # No translation memory file in the working directory.
+    monkeypatch.setenv('TRANSLATION_MEMORY_PATH', '')
+    import translation
+
+    monkeypatch.setattr(translation, 'provider_health', translation.ProviderHealth(failure_threshold=1))
+    translation.provider_health.record_success('stub', 0.1)
+    translation.provider_health.record_failure('stub', 0.1)
+    text = metrics.render_prometheus()
+    assert '# TYPE veda_translation_breaker_state gauge' in text
+    assert 'veda_translation_breaker_state{provider="stub"} 2' in text
+    assert 'veda_translation_breaker_trips_total{provider="stub"} 1' in text
+    assert 'veda_translation_provider_calls_total{outcome="failures",provider="stub"} 1' in text
+    assert 'veda_translation_provider_success_ratio{provider="stub"} 0.5' in text
@@ -0,0 +1,59 @@
+# test_script_detection.py
+"""
+Language detection on held-out sentences: none of them contains a word from
+MARKER_WORDS, so they check the script ranges, marker characters and the
+fallbacks rather than the word lists the detector was written from.
+"""
+import pytest
+
+from script_detection import MARKER_WORDS, detect_language
+
+SINGLE_SCRIPT_SAMPLES = {
+    'English': "The office will remain closed tomorrow",
+    'Tamil': "நாளை பள்ளிக்கு விடுமுறை",
+    'Telugu': "రేపు పాఠశాలకు సెలవు",
+    'Kannada': "ನಾಳೆ ಶಾಲೆಗೆ ರಜೆ",
+    'Malayalam': "നാളെ സ്കൂളിന് അവധിയാണ്",
+    'Gujarati': "કાલે શાળામાં રજા છે",
+    'Punjabi': "ਕੱਲ੍ਹ ਸਕੂਲ ਵਿੱਚ ਛੁੱਟੀ ਹੈ",
+    'Oriya': "କାଲି ସ୍କୁଲ ଛୁଟି ଅଛି",
+    'Urdu': "کل اسکول میں چھٹی ہے",
+    'Santali': "ᱟᱭᱩᱵ ᱨᱮ ᱥᱠᱩᱞ ᱵᱚᱸᱫᱚ",
+}
+
+SHARED_SCRIPT_SAMPLES = {
+    # Marker characters (ळ, ৱ/ৰ) occur naturally in these languages.
+    'Marathi': "उद्या शाळेला सुट्टी असेल",
+    'Assamese': "আমি কাইলৈ গুৱাহাটীলৈ যাম",
+    # No markers: the script's default language.
+    'Hindi': "सरकार ने नई योजना घोषित कर दी",
+    'Bengali': "আমরা আগামীকাল কলকাতায় যাব",
+}
+
+def _words(text):
+    return {word.strip('?!.,।॥') for word in text.split()}
+
+@pytest.mark.parametrize('samples', [SINGLE_SCRIPT_SAMPLES, SHARED_SCRIPT_SAMPLES])
+def test_samples_are_held_out(samples):
+    markers = set().union(*MARKER_WORDS.values())
+    for language, text in samples.items():
+        assert not _words(text) & markers, language
+
+@pytest.mark.parametrize('language, text', list(SINGLE_SCRIPT_SAMPLES.items()) + list(SHARED_SCRIPT_SAMPLES.items()))
+def test_detects_held_out_sample(language, text):
+    assert detect_language(text) == language
+
+def test_preferred_language_breaks_ties_within_script():
+    # Pali has no markers and is only returned when the caller prefers it.
+    text = "सब्बे सत्ता भवन्तु सुखितत्ता"
+    assert detect_language(text) != 'Pali'
+    assert detect_language(text, ('Pali',)) == 'Pali'
+
+def test_preferred_bihari_covers_bhojpuri_and_maithili_markers():
+    bhojpuri = "हमनी काल्ह पटना जात बानी"
+    assert detect_language(bhojpuri) == 'Bhojpuri'
+    assert detect_language(bhojpuri, ('Bihari',)) == 'Bihari'
+    assert detect_language("ओ काल्हि गाम जाइत अछि", ('Bihari',)) == 'Bihari'
+
+def test_markers_beat_an_unrelated_preferred_language():
+    assert detect_language("उद्या शाळेला सुट्टी असेल", ('Hindi',)) == 'Marathi'
@@ -0,0 +1,58 @@
+# test_text_extraction.py
+"""
+EasyOCR output is joined into lines, so running headers and footers on
+EasyOCR-routed pages are found by boilerplate.py like Tesseract's.
+"""
+import sys
+import types
+
+def _stand_in(name, **attributes):
+    """Minimal module for a dependency this environment lacks; the tests replace what they use"""
+    try:
+        __import__(name)
+    except ImportError:
+        sys.modules[name] = types.SimpleNamespace(**attributes)
+
+for _name in ('pytesseract', 'easyocr', 'PyPDF2', 'docx'):
+    _stand_in(_name)
+_stand_in('PIL', Image=None)
+_stand_in('pdf2image', convert_from_bytes=None)
+
+from boilerplate import strip_boilerplate
+from text_extraction import extract_text_with_easyocr, join_detections
+
+BODY = {
+    1: 'The committee met on Monday and reviewed the water supply accounts.',
+    2: 'Road repairs in the northern wards were delayed by the monsoon rains.',
+    3: 'School enrolment rose in every block except the two hill talukas.',
+    4: 'The health camp screened three hundred children for anaemia.',
+    5: 'Grain procurement closed early after the target was reached.',
+}
+
+def box(left, top, width=80, height=20):
+    return [[left, top], [left + width, top], [left + width, top + height], [left, top + height]]
+
+class FakeReader:
+    lang_list = ['hi']
+
+    def __init__(self, page):
+        self.page = page
+
+    def readtext(self, image):
+        # Detections come in no particular order; the header is split into two boxes.
+        return [
+            (box(10, 200), BODY[self.page], 0.9),
+            (box(120, 12), 'Annual Report', 0.9),
+            (box(10, 10), 'District Office', 0.9),
+            (box(10, 500), f'Page {self.page} of 5', 0.9),
+        ]
+
+def test_join_detections_builds_lines():
+    assert join_detections(FakeReader(1).readtext(None)) == (
+        f'District Office Annual Report\n{BODY[1]}\nPage 1 of 5')
+
+def test_boilerplate_is_found_on_easyocr_pages():
+    pages = {page: extract_text_with_easyocr([[0]], FakeReader(page)) for page in range(1, 6)}
+    cleaned, stats = strip_boilerplate(pages)
+    assert stats['lines'] == 2
+    assert cleaned[3] == BODY[3]
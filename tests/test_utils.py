@@ -0,0 +1,16 @@
+# test_utils.py
+import time
+
+from utils import TokenBucket
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(20, capacity=1)
+    assert bucket.acquire()
+    started = time.monotonic()
+    assert bucket.acquire()
+    assert time.monotonic() - started >= 0.04
+    assert not bucket.acquire(timeout=0)
+
+def test_zero_rate_is_unlimited():
+    bucket = TokenBucket(0, capacity=1)
+    assert all(bucket.acquire(timeout=0) for _ in range(10))
@@ -6,9 +6,14 @@ import PyPDF2
 from pdf2image import convert_from_bytes
 import logging
 import os
+import threading
 import numpy as np
 import tempfile
 import docx
+from collections import OrderedDict
+from metrics import timed, count
+from profiling import profiled, short_hash
+from script_detection import SCRIPT_LANGUAGES
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -38,9 +43,67 @@ LANGUAGE_MAP = {
 
 TESSERACT_LANGUAGES = ['Punjabi', 'Malayalam', 'Gujarati', 'Meetei', 'Oriya', 'Tamil']
 
+# Per-page script detection with Tesseract OSD; set to 0 to OCR every page in the selected language.
+SCRIPT_DETECTION = os.getenv('OCR_SCRIPT_DETECTION', '1').lower() not in ('0', 'false', 'no')
+# OSD script confidence below which the selected language is kept. Low values
+# (around 1) are common on pages that mix scripts, e.g. bilingual forms.
+OSD_MIN_CONFIDENCE = float(os.getenv('OSD_MIN_CONFIDENCE', '5.0'))
+# Pages are downscaled to at most this many pixels on the long side for OSD.
+OSD_MAX_SIDE = 1600
+# EasyOCR readers kept loaded (each holds its detection and recognition models).
+EASYOCR_READER_CACHE_SIZE = int(os.getenv('EASYOCR_READER_CACHE_SIZE', '4'))
+
+_easyocr_readers = OrderedDict()
+_easyocr_lock = threading.Lock()
+_osd_available = True
+
 def get_language_code(language):
     return LANGUAGE_MAP.get(language, 'eng') 
 
+def get_ocr_engine(language):
+    return 'tesseract' if language in TESSERACT_LANGUAGES else 'easyocr'
+
+def get_easyocr_reader(lang_code):
+    """EasyOCR reader for one language, loaded once and reused across pages and documents"""
+    with _easyocr_lock:
+        reader = _easyocr_readers.get(lang_code)
+        if reader is None:
+            reader = easyocr.Reader(lang_code.split('+'), gpu=True)
+            _easyocr_readers[lang_code] = reader
+            while len(_easyocr_readers) > EASYOCR_READER_CACHE_SIZE:
+                _easyocr_readers.popitem(last=False)
+        _easyocr_readers.move_to_end(lang_code)
+        return reader
+
+def detect_page_language(image, language):
+    """
+    Language to OCR one page in: the selected language unless Tesseract OSD is
+    confident the page is in a script that language is not written in, in
+    which case the script's default language from SCRIPT_LANGUAGES
+    """
+    global _osd_available
+    if not SCRIPT_DETECTION or not _osd_available:
+        return language
+    small = image.convert('L')
+    small.thumbnail((OSD_MAX_SIDE, OSD_MAX_SIDE))
+    try:
+        with timed('script_detect'):
+            osd = pytesseract.image_to_osd(small, output_type=pytesseract.Output.DICT)
+    except pytesseract.TesseractNotFoundError as e:
+        _osd_available = False
+        logging.warning(f"Script detection disabled, Tesseract OSD is unavailable: {str(e)}")
+        return language
+    except Exception as e:
+        # Usually too little text on the page for OSD to decide.
+        logging.debug(f"Script detection failed: {str(e)}")
+        return language
+    candidates = SCRIPT_LANGUAGES.get(osd.get('script'), [])
+    if osd.get('script_conf', 0) < OSD_MIN_CONFIDENCE or not candidates or language in candidates:
+        return language
+    logging.info(f"Page looks like {osd['script']} script (confidence {osd['script_conf']}), "
+                 f"reading it as {candidates[0]} instead of {language}")
+    return candidates[0]
+
 def is_pdf_valid(file):
     try:
         pdf_reader = PyPDF2.PdfReader(file)
@@ -52,15 +115,78 @@ def is_pdf_valid(file):
         logging.error(f"Error checking PDF validity: {str(e)}")
         return False
 
+def join_detections(result):
+    """
+    EasyOCR detections as text lines, like Tesseract output: boxes whose vertical
+    centres are within half a box height of each other form one line, read left
+    to right. Keeps headers and footers on lines of their own for boilerplate.py.
+    """
+    lines = []
+    for box, text, *_ in sorted(result, key=lambda detection: min(point[1] for point in detection[0])):
+        top = min(point[1] for point in box)
+        bottom = max(point[1] for point in box)
+        centre = (top + bottom) / 2
+        left = min(point[0] for point in box)
+        if lines and abs(centre - lines[-1][0]) <= (bottom - top) / 2:
+            lines[-1][1].append((left, text))
+        else:
+            lines.append((centre, [(left, text)]))
+    return '\n'.join(' '.join(text for _, text in sorted(words)) for _, words in lines)
+
 def extract_text_with_easyocr(image, reader):
-    result = reader.readtext(np.array(image))
-    return ' '.join([text[1] for text in result])
+    language = ','.join(getattr(reader, 'lang_list', []))
+    with timed('ocr', engine='easyocr', language=language):
+        result = reader.readtext(np.array(image))
+    count('pages', stage='ocr', engine='easyocr', language=language)
+    return join_detections(result)
 
 def extract_text_with_tesseract(image, lang_code):
-    return pytesseract.image_to_string(image, lang=lang_code)
+    with timed('ocr', engine='tesseract', language=lang_code):
+        text = pytesseract.image_to_string(image, lang=lang_code)
+    count('pages', stage='ocr', engine='tesseract', language=lang_code)
+    return text
+
 
+def _ocr_route(page_language, language):
+    """(engine, language code) to OCR a page in `page_language` of a document in `language`"""
+    if page_language == 'English' and language != 'English':
+        # Mostly Latin text in a document in another script is often a bilingual
+        # page: read it with both models so the other script is not lost.
+        engine = get_ocr_engine(language)
+        return engine, f"{get_language_code(language)}+{'eng' if engine == 'tesseract' else 'en'}"
+    return get_ocr_engine(page_language), get_language_code(page_language)
 
-def extract_text_from_docx(file, language):
+def _ocr_images(images, language, on_page=None, page_languages=None):
+    """
+    OCR page images into {page_number: text}, leaving out pages without text.
+    Each page's language (and so its engine) comes from detect_page_language
+    and is recorded in `page_languages`, if given; pages are then OCR'd grouped
+    by engine and language, so each model is loaded once per document.
+    """
+    groups = OrderedDict()
+    detected = {}
+    for i, image in enumerate(images):
+        detected[i] = detect_page_language(image, language)
+        groups.setdefault(_ocr_route(detected[i], language), []).append(i)
+
+    text_dict = {}
+    for (engine, lang_code), pages in groups.items():
+        count('pages', len(pages), stage='route', engine=engine, language=lang_code)
+        reader = get_easyocr_reader(lang_code) if engine == 'easyocr' else None
+        for i in pages:
+            if engine == 'tesseract':
+                text = extract_text_with_tesseract(images[i], lang_code)
+            else:
+                text = extract_text_with_easyocr(images[i], reader)
+            if text.strip():
+                text_dict[i+1] = text
+                if page_languages is not None:
+                    page_languages[i+1] = detected[i]
+                if on_page is not None:
+                    on_page(i+1, text)
+    return dict(sorted(text_dict.items()))
+
+def extract_text_from_docx(file, language, on_page=None, page_languages=None):
     """
     Extract text from a .docx file using python-docx
     If text is empty or non-unicode, fallback to OCR
@@ -75,17 +201,19 @@ def extract_text_from_docx(file, language):
                 full_text.append(para.text)
         
         if not full_text:
-            return extract_text_with_docx_ocr(file, language)
+            return extract_text_with_docx_ocr(file, language, on_page, page_languages)
         
         text_dict[1] = '\n'.join(full_text)
+        if on_page is not None:
+            on_page(1, text_dict[1])
         
         return text_dict
     
     except Exception as e:
         logging.error(f"Error processing DOCX: {str(e)}")
-        return extract_text_with_docx_ocr(file, language)
+        return extract_text_with_docx_ocr(file, language, on_page, page_languages)
 
-def extract_text_with_docx_ocr(file, language):
+def extract_text_with_docx_ocr(file, language, on_page=None, page_languages=None):
     """
     Attempt OCR extraction for .docx files by converting to images
     """
@@ -98,20 +226,7 @@ def extract_text_with_docx_ocr(file, language):
         
         os.unlink(temp_file_path)
         
-        text_dict = {}
-        lang_code = get_language_code(language)
-        
-        if language in TESSERACT_LANGUAGES:
-            for i, image in enumerate(images):
-                text = extract_text_with_tesseract(image, lang_code)
-                if text.strip():  
-                    text_dict[i+1] = text
-        else:
-            reader = easyocr.Reader([lang_code], gpu=True)
-            for i, image in enumerate(images):
-                text = extract_text_with_easyocr(image, reader)
-                if text.strip():
-                    text_dict[i+1] = text
+        text_dict = _ocr_images(images, language, on_page, page_languages)
         
         if not text_dict:
             raise ValueError("No text extracted from DOCX via OCR")
@@ -145,7 +260,8 @@ def convert_docx_to_images(docx_path):
             ], check=True)
             
             pdf_file = open(pdf_path, 'rb')
-            images = convert_from_bytes(pdf_file.read())
+            with timed('rasterize', source='docx'):
+                images = convert_from_bytes(pdf_file.read())
             pdf_file.close()
             
             return images
@@ -154,7 +270,7 @@ def convert_docx_to_images(docx_path):
         logging.error(f"Error converting DOCX to images: {str(e)}")
         return []
 
-def extract_text_from_pdf(file, language):
+def extract_text_from_pdf(file, language, on_page=None, page_languages=None):
     text_dict = {}
     
     try:
@@ -169,7 +285,8 @@ def extract_text_from_pdf(file, language):
         pdf_bytes = file.read()
         
         try:
-            images = convert_from_bytes(pdf_bytes)
+            with timed('rasterize', source='pdf'):
+                images = convert_from_bytes(pdf_bytes)
             logging.debug(f"Converted PDF to {len(images)} images")
         except Exception as e:
             raise ValueError(f"Failed to convert PDF to images: {str(e)}")
@@ -177,19 +294,7 @@ def extract_text_from_pdf(file, language):
         if not images:
             raise ValueError("No images extracted from PDF")
         
-        lang_code = get_language_code(language)
-        
-        if language in TESSERACT_LANGUAGES:
-            for i, image in enumerate(images):
-                text = extract_text_with_tesseract(image, lang_code)
-                if text.strip():  
-                    text_dict[i+1] = text
-        else:
-            reader = easyocr.Reader([lang_code],gpu=True)
-            for i, image in enumerate(images):
-                text = extract_text_with_easyocr(image, reader)
-                if text.strip():
-                    text_dict[i+1] = text
+        text_dict = _ocr_images(images, language, on_page, page_languages)
         
         if not text_dict:
             raise ValueError("No text extracted from PDF")
@@ -200,33 +305,34 @@ def extract_text_from_pdf(file, language):
     
     return text_dict
 
-def extract_text_from_image(file, language):
+def extract_text_from_image(file, language, on_page=None, page_languages=None):
     try:
         image = Image.open(file)
-        lang_code = get_language_code(language)
-        
-        if language in TESSERACT_LANGUAGES:
-            text = extract_text_with_tesseract(image, lang_code)
-        else:
-            reader = easyocr.Reader([lang_code])
-            text = extract_text_with_easyocr(image, reader)
+        text_dict = _ocr_images([image], language, on_page, page_languages)
         
-        if not text.strip():
+        if not text_dict:
             raise ValueError("No text extracted from image")
         
-        return {1: text}
+        return text_dict
     except Exception as e:
         logging.error(f"Error processing image: {str(e)}")
         return {1: f"Error processing image: {str(e)}"}
 
-def extract_text(file, language):
+@profiled('extract', lambda file, *args, **kwargs: short_hash(file))
+def extract_text(file, language, on_page=None, page_languages=None):
+    """
+    Returns {page_number: text}. on_page(page_number, text), if given, is
+    called as each page's text becomes available. `page_languages`, if given,
+    receives {page_number: language} for the pages that were OCR'd, which may
+    differ from `language` where script detection rerouted them.
+    """
     file_extension = os.path.splitext(file.name)[1].lower()
     
     if file_extension == '.pdf':
-        return extract_text_from_pdf(file, language)
+        return extract_text_from_pdf(file, language, on_page, page_languages)
     elif file_extension in ['.png', '.jpg', '.jpeg']:
-        return extract_text_from_image(file, language)
+        return extract_text_from_image(file, language, on_page, page_languages)
     elif file_extension == '.docx':
-        return extract_text_from_docx(file, language)
+        return extract_text_from_docx(file, language, on_page, page_languages)
     else:
         return {1: f"Unsupported file type: {file_extension}"}
\ No newline at end of file
@@ -1,10 +1,20 @@
 #translation.py 
 from deep_translator import GoogleTranslator, MicrosoftTranslator, MyMemoryTranslator
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
 import logging
 import os
+import re
+import threading
+import time
+from utils import TokenBucket
+from provider_health import CLOSED, HALF_OPEN, OPEN, ProviderHealth, backoff_delay
+from metrics import observe, propagate, register_collector
+import profiling
+from profiling import profiled, short_hash
+from translation_memory import create_translation_memory
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -41,11 +51,20 @@ def get_supported_language_code(language):
         return fallbacks[code]
     return code or language.lower()
 
-def chunk_text(text, max_length=1000): 
-    """Split text into smaller chunks to avoid translation service limits."""
-    if not text or len(text.strip()) == 0:
-        return []
-        
+# Largest request each provider accepts, in characters.
+PROVIDER_MAX_CHARS = {
+    'google': 5000,
+    'mymemory': 500,
+    'stub': 5000
+}
+
+# Provider order: the first is retried, the rest are fallbacks.
+TRANSLATION_PROVIDERS = [name.strip() for name in os.getenv('TRANSLATION_PROVIDERS', 'google,mymemory').split(',')]
+TRANSLATION_WORKERS = int(os.getenv('TRANSLATION_WORKERS', '8'))
+
+SENTENCE_SPLIT = re.compile(r'(?<=[।.!?॥])\s+')
+
+def _split_words(text, max_length):
     words = text.split()
     chunks = []
     current_chunk = []
@@ -53,7 +72,7 @@ def chunk_text(text, max_length=1000):
     
     for word in words:
         word_length = len(word) + 1
-        if current_length + word_length > max_length:
+        if current_length + word_length > max_length and current_chunk:
             chunks.append(' '.join(current_chunk))
             current_chunk = [word]
             current_length = word_length
@@ -65,87 +84,391 @@ def chunk_text(text, max_length=1000):
         chunks.append(' '.join(current_chunk))
     return chunks
 
+def chunk_text(text, max_length=None): 
+    """
+    Pack whole sentences into chunks of at most max_length characters
+    (default: the request limit of the primary provider). Sentences longer
+    than the limit are split between words.
+    """
+    if not text or len(text.strip()) == 0:
+        return []
+    max_length = max_length or PROVIDER_MAX_CHARS.get(TRANSLATION_PROVIDERS[0], 1000)
+    
+    pieces = []
+    for sentence in SENTENCE_SPLIT.split(text.strip()):
+        if len(sentence) <= max_length:
+            pieces.append(sentence)
+        else:
+            pieces.extend(_split_words(sentence, max_length))
+    
+    chunks = []
+    current = ''
+    for piece in pieces:
+        candidate = f"{current} {piece}" if current else piece
+        if len(candidate) > max_length and current:
+            chunks.append(current)
+            current = piece
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+# deep_translator clients keep per-request state on the instance, so each worker
+# thread reuses its own client per (provider, source, target) instead of building
+# a new one on every attempt.
+_thread_clients = threading.local()
+
+def _get_client(translator_class, source_code, target_code):
+    clients = getattr(_thread_clients, 'clients', None)
+    if clients is None:
+        clients = _thread_clients.clients = {}
+    key = (translator_class, source_code, target_code)
+    if key not in clients:
+        clients[key] = translator_class(source=source_code, target=target_code)
+    return clients[key]
+
+# Pooled keep-alive connections for providers we call over HTTP directly.
+_http_session = requests.Session()
+_http_session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=TRANSLATION_WORKERS))
+_http_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=TRANSLATION_WORKERS))
+
+def translate_with_google(text, source_code, target_code):
+    return _get_client(GoogleTranslator, source_code, target_code).translate(text)
+
 def translate_with_mymemory(text, source_code, target_code):
     """Translate using MyMemory as a fallback."""
     try:
-        translator = MyMemoryTranslator(source=source_code, target=target_code)
-        return translator.translate(text)
+        return _get_client(MyMemoryTranslator, source_code, target_code).translate(text)
     except Exception as e:
         logger.error(f"MyMemory translation failed: {str(e)}")
         raise
 
-def translate_chunk(text, source_code, target_code, retries=3, delay=2):
-    """Try multiple translation services with fallback."""
+def _stub_url():
+    return f"{os.getenv('TRANSLATION_STUB_URL', 'http://127.0.0.1:8765')}/translate"
+
+def translate_with_stub(text, source_code, target_code):
+    """Local stand-in translation server (see stub_server.py), for benchmarks."""
+    response = _http_session.post(_stub_url(), json={'q': text, 'source': source_code, 'target': target_code},
+                                  timeout=30)
+    response.raise_for_status()
+    return response.json()['translatedText']
+
+def translate_batch_with_stub(texts, source_code, target_code):
+    response = _http_session.post(_stub_url(), json={'q': texts, 'source': source_code, 'target': target_code},
+                                  timeout=60)
+    response.raise_for_status()
+    return response.json()['translatedText']
+
+PROVIDERS = {
+    'google': translate_with_google,
+    'mymemory': translate_with_mymemory,
+    'stub': translate_with_stub
+}
+
+# Providers that take several texts in one request. deep_translator's
+# translate_batch for Google and MyMemory only loops over translate(), so
+# those are left out.
+BATCH_PROVIDERS = {
+    'stub': translate_batch_with_stub
+}
+
+# Requests per second allowed per provider, shared by every thread and session; 0 disables the limit.
+PROVIDER_RATE_LIMITS = {
+    'google': float(os.getenv('GOOGLE_TRANSLATE_RPS', '5')),
+    'mymemory': float(os.getenv('MYMEMORY_TRANSLATE_RPS', '1')),
+    'stub': float(os.getenv('STUB_TRANSLATE_RPS', '100'))
+}
+_rate_limiters = {name: TokenBucket(rate, capacity=max(1.0, rate)) for name, rate in PROVIDER_RATE_LIMITS.items()}
+
+translation_memory = create_translation_memory()
+
+# A provider's breaker opens after this many consecutive failures; chunks then go
+# straight to the next provider until a trial call succeeds after the reset timeout.
+provider_health = ProviderHealth(
+    failure_threshold=int(os.getenv('TRANSLATION_BREAKER_FAILURES', '5')),
+    reset_timeout=float(os.getenv('TRANSLATION_BREAKER_RESET', '30'))
+)
+BACKOFF_BASE = float(os.getenv('TRANSLATION_BACKOFF_BASE', '0.5'))
+BACKOFF_MAX = float(os.getenv('TRANSLATION_BACKOFF_MAX', '8'))
+# Seconds one translate_text call may take before remaining chunks give up.
+TRANSLATION_DEADLINE = float(os.getenv('TRANSLATION_DEADLINE', '300'))
+
+class TranslationDeadlineExceeded(Exception):
+    pass
+
+def get_provider_metrics():
+    return provider_health.metrics()
+
+# Breaker states as gauge values, so an alert can fire on veda_translation_breaker_state == 2.
+BREAKER_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+def _collect_provider_metrics():
+    """Per-provider breaker state, trips, calls and success rate for the /metrics endpoint"""
+    for provider, entry in get_provider_metrics().items():
+        labels = {'provider': provider}
+        yield ('veda_translation_breaker_state', 'gauge',
+               'Translation provider circuit breaker: 0 closed, 1 half-open, 2 open',
+               labels, BREAKER_STATE_VALUES[entry['state']])
+        yield ('veda_translation_breaker_trips_total', 'counter',
+               'Times the provider circuit breaker opened', labels, entry['trips'])
+        for outcome in ('successes', 'failures', 'rejected'):
+            yield ('veda_translation_provider_calls_total', 'counter',
+                   'Translation provider calls by outcome (rejected: skipped by an open breaker)',
+                   dict(labels, outcome=outcome), entry[outcome])
+        yield ('veda_translation_provider_success_ratio', 'gauge',
+               'Share of translation provider calls that succeeded', labels, round(entry['success_rate'], 4))
+
+register_collector(_collect_provider_metrics)
+
+def set_rate_limit(provider, requests_per_second):
+    PROVIDER_RATE_LIMITS[provider] = requests_per_second
+    _rate_limiters[provider] = TokenBucket(requests_per_second, capacity=max(1.0, requests_per_second))
+
+def _remaining(deadline):
+    return None if deadline is None else deadline - time.monotonic()
+
+def _call_provider(provider, text, source_code, target_code, deadline=None):
+    """One provider call, re-split first if the text exceeds that provider's limit."""
+    limit = PROVIDER_MAX_CHARS.get(provider)
+    pieces = chunk_text(text, limit) if limit and len(text) > limit else [text]
+    translated = []
+    for piece in pieces:
+        remaining = _remaining(deadline)
+        if remaining is not None and remaining <= 0:
+            raise TranslationDeadlineExceeded("Translation deadline passed before the request was sent")
+        if not _rate_limiters[provider].acquire(timeout=remaining):
+            raise TranslationDeadlineExceeded(f"{provider} rate limit wait would pass the deadline")
+        translated.append(PROVIDERS[provider](piece, source_code, target_code))
+    return ' '.join(translated)
+
+def _call_with_health(provider, call):
+    started = time.monotonic()
+    try:
+        result = call()
+    except TranslationDeadlineExceeded:
+        raise
+    except Exception:
+        observe('translate', time.monotonic() - started, provider=provider, outcome='error')
+        if provider_health.record_failure(provider, time.monotonic() - started):
+            logger.warning(f"Circuit breaker opened for {provider} translator")
+        raise
+    observe('translate', time.monotonic() - started, provider=provider, outcome='success')
+    provider_health.record_success(provider, time.monotonic() - started)
+    return result
+
+def translate_chunk(text, source_code, target_code, retries=3, providers=None, deadline=None):
+    """
+    Try multiple translation services with fallback. The first provider gets
+    `retries` attempts with jittered exponential backoff, the rest one each;
+    providers whose circuit breaker is open are skipped. Raises once the
+    monotonic `deadline` has passed.
+    """
     if not text or len(text.strip()) == 0:
         return ""
         
+    if translation_memory is not None:
+        remembered = translation_memory.get(source_code, target_code, text)
+        if remembered is not None:
+            return remembered
+        
     errors = []
+    providers = providers or TRANSLATION_PROVIDERS
     
-    for attempt in range(retries):
-        try:
-            translator = GoogleTranslator(source=source_code, target=target_code)
-            return translator.translate(text)
-        except Exception as e:
-            errors.append(f"Google Translate attempt {attempt + 1}: {str(e)}")
-            time.sleep(delay * (attempt + 1))
+    for i, provider in enumerate(providers):
+        attempts = retries if i == 0 else 1
+        for attempt in range(attempts):
+            if not provider_health.allow(provider):
+                errors.append(f"{provider}: circuit open")
+                break
+            try:
+                translated = _call_with_health(
+                    provider, lambda: _call_provider(provider, text, source_code, target_code, deadline))
+                if translation_memory is not None:
+                    translation_memory.put(source_code, target_code, text, translated)
+                return translated
+            except TranslationDeadlineExceeded as e:
+                errors.append(str(e))
+                raise Exception(f"Translation deadline exceeded: {' | '.join(errors)}")
+            except Exception as e:
+                errors.append(f"{provider} attempt {attempt + 1}: {str(e)}")
+            if attempt + 1 < attempts:
+                delay = backoff_delay(attempt, BACKOFF_BASE, BACKOFF_MAX)
+                remaining = _remaining(deadline)
+                if remaining is not None and delay >= remaining:
+                    raise Exception(f"Translation deadline exceeded: {' | '.join(errors)}")
+                time.sleep(delay)
+        if i + 1 < len(providers):
+            logger.info(f"Falling back to {providers[i + 1]} translator")
     
+    error_msg = " | ".join(errors)
+    raise Exception(f"All translation attempts failed: {error_msg}")
+
+def _translate_chunk_or_error(chunk, source_code, target_code, retries, providers, deadline=None):
     try:
-        logger.info("Falling back to MyMemory translator")
-        return translate_with_mymemory(text, source_code, target_code)
+        return translate_chunk(chunk, source_code, target_code, retries=retries, providers=providers,
+                               deadline=deadline)
     except Exception as e:
-        errors.append(f"MyMemory fallback: {str(e)}")
+        logger.warning(f"Giving up on chunk: {str(e)}")
+        return f"[Translation Error: {str(e)}]"
+
+def translate_chunks_batched(chunks, source_code, target_code, retries=3, providers=None, deadline=None):
+    """
+    Translate a page's chunks with a single batch request to the primary provider
+    (for chunks not already in translation memory). If the batch fails, each
+    chunk goes through translate_chunk and its normal retries and fallbacks.
+    """
+    providers = providers or TRANSLATION_PROVIDERS
+    results = [None] * len(chunks)
+    for i, chunk in enumerate(chunks):
+        if not chunk.strip():
+            results[i] = ""
+        elif translation_memory is not None:
+            results[i] = translation_memory.get(source_code, target_code, chunk)
+    missing = [i for i, result in enumerate(results) if result is None]
     
-    error_msg = " | ".join(errors)
-    raise Exception(f"All translation attempts failed: {error_msg}")
+    primary = providers[0]
+    if missing and provider_health.allow(primary):
+        try:
+            if not _rate_limiters[primary].acquire(timeout=_remaining(deadline)):
+                raise TranslationDeadlineExceeded(f"{primary} rate limit wait would pass the deadline")
+            translated = _call_with_health(
+                primary, lambda: BATCH_PROVIDERS[primary]([chunks[i] for i in missing], source_code, target_code))
+            for i, text in zip(missing, translated):
+                results[i] = text
+                if translation_memory is not None:
+                    translation_memory.put(source_code, target_code, chunks[i], text)
+        except Exception as e:
+            logger.warning(f"Batch translation failed, translating chunks one by one: {str(e)}")
+    for i in missing:
+        if results[i] is None:
+            results[i] = _translate_chunk_or_error(chunks[i], source_code, target_code, retries, providers, deadline)
+    return results
+
+def _translate_page_batched(chunks, source_code, target_code, retries, providers, deadline):
+    return ' '.join(translate_chunks_batched(chunks, source_code, target_code, retries, providers, deadline))
 
-def translate_text(text_dict, source_language, target_language, retries=3, delay=2):
+@profiled('translate', lambda text_dict, source_language, target_language, *args, **kwargs:
+          short_hash(text_dict, source_language, target_language))
+def iter_translate_text(text_dict, source_language, target_language, retries=3, max_workers=None,
+                        providers=None, deadline_seconds=None, page_languages=None):
     """
-    Translate text with multiple fallback services and improved error handling.
+    Yield (page, translated_text) as each page finishes, in completion order.
+    Pages listed in `page_languages` (e.g. detected during OCR) are translated
+    from that language instead of source_language.
+    Pages are packed into sentence-aligned chunks up to the primary provider's
+    request limit and translated concurrently (max_workers threads, paced by each
+    provider's rate limiter). Providers with a batch API get one request per page.
+    Chunks still pending after deadline_seconds (default TRANSLATION_DEADLINE)
+    become error markers. Closing the generator cancels pages not yet started.
     """
-    translated_dict = {}
     source_code = get_supported_language_code(source_language)
     target_code = get_supported_language_code(target_language)
+    providers = providers or TRANSLATION_PROVIDERS
+    max_length = PROVIDER_MAX_CHARS.get(providers[0], 1000)
+    deadline = time.monotonic() + (deadline_seconds or TRANSLATION_DEADLINE)
     
     logger.info(f"Starting translation from {source_code} to {target_code}")
     
-    for page, text in text_dict.items():
-        if isinstance(text, bytes):
-            text = text.decode('utf-8')
-            
-        logger.info(f"Processing page {page}")
-        chunks = chunk_text(text)
-        translated_chunks = []
+    executor = ThreadPoolExecutor(max_workers=max_workers or TRANSLATION_WORKERS)
+    try:
+        page_futures = {}
+        future_pages = {}
+        for page, text in text_dict.items():
+            if isinstance(text, bytes):
+                text = text.decode('utf-8')
+            page_source_code = source_code
+            if page_languages and page in page_languages:
+                page_source_code = get_supported_language_code(page_languages[page])
+            chunks = chunk_text(text, max_length)
+            if providers[0] in BATCH_PROVIDERS and len(chunks) > 1:
+                page_futures[page] = [executor.submit(propagate(_translate_page_batched), chunks, page_source_code,
+                                                      target_code, retries, providers, deadline)]
+            else:
+                page_futures[page] = [
+                    executor.submit(propagate(_translate_chunk_or_error), chunk, page_source_code, target_code,
+                                    retries, providers, deadline)
+                    for chunk in chunks
+                ]
+            for future in page_futures[page]:
+                future_pages[future] = page
         
-        for i, chunk in enumerate(chunks):
-            retry_count = 0
-            success = False
-            
-            while not success and retry_count < retries:
-                try:
-                    logger.info(f"Translating chunk {i+1}/{len(chunks)} of page {page}")
-                    translated_chunk = translate_chunk(
-                        chunk, 
-                        source_code, 
-                        target_code, 
-                        retries=retries, 
-                        delay=delay
-                    )
-                    translated_chunks.append(translated_chunk)
-                    success = True
-                    logger.info(f"Successfully translated chunk {i+1}")
-                except Exception as e:
-                    retry_count += 1
-                    logger.warning(f"Failed attempt {retry_count} for chunk {i+1}: {str(e)}")
-                    if retry_count == retries:
-                        translated_chunks.append(f"[Translation Error: {str(e)}]")
-                
-                if i < len(chunks) - 1:
-                    time.sleep(delay)
+        # Pages without any text are finished already.
+        for page, futures in page_futures.items():
+            if not futures:
+                yield page, ''
         
-        translated_dict[page] = ' '.join(translated_chunks)
-        logger.info(f"Completed translation of page {page}")
-    
-    return translated_dict
+        remaining = {page: len(futures) for page, futures in page_futures.items()}
+        for future in as_completed(future_pages):
+            page = future_pages[future]
+            remaining[page] -= 1
+            if remaining[page] == 0:
+                logger.info(f"Completed translation of page {page}")
+                yield page, ' '.join(f.result() for f in page_futures[page])
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        if translation_memory is not None:
+            logger.info(f"Translation memory: {translation_memory.stats()}")
+        logger.info(f"Translation providers: {get_provider_metrics()}")
+
+def translate_text(text_dict, source_language, target_language, retries=3, max_workers=None, providers=None,
+                   deadline_seconds=None, on_page=None, page_languages=None):
+    """
+    Translate text with multiple fallback services and improved error handling.
+    Returns pages in their original order; on_page(page, text) is called as
+    each page finishes. See iter_translate_text.
+    """
+    translated = {}
+    for page, text in iter_translate_text(text_dict, source_language, target_language, retries, max_workers,
+                                          providers, deadline_seconds, page_languages):
+        translated[page] = text
+        if on_page is not None:
+            on_page(page, text)
+    return {page: translated[page] for page in text_dict}
+
+class TranslationJob:
+    """
+    Runs translate_text on a background thread so a UI can show finished
+    pages (`pages`) and progress while the rest are still translating.
+    """
+    def __init__(self, text_dict, source_language, target_language, **kwargs):
+        self.source_language = source_language
+        self.target_language = target_language
+        self.total_pages = len(text_dict)
+        self.pages = {}
+        self.error = None
+        self.done = False
+        self._cancelled = threading.Event()
+        # The worker thread doesn't inherit the caller's per-request profiling flag.
+        self._profile_mode = profiling.current_mode()
+        self._thread = threading.Thread(target=self._run, args=(text_dict, kwargs), daemon=True)
+        self._thread.start()
+
+    def _run(self, text_dict, kwargs):
+        generator = iter_translate_text(text_dict, self.source_language, self.target_language, **kwargs)
+        try:
+            with profiling.profile_requests(self._profile_mode):
+                for page, text in generator:
+                    self.pages[page] = text
+                    if self._cancelled.is_set():
+                        break
+        except Exception as e:
+            logger.error(f"Translation job failed: {str(e)}")
+            self.error = e
+        finally:
+            generator.close()
+            self.done = True
+
+    @property
+    def progress(self):
+        return len(self.pages) / self.total_pages if self.total_pages else 1.0
+
+    def ordered_pages(self):
+        """Finished pages so far, in page order"""
+        return {page: self.pages[page] for page in sorted(self.pages)}
+
+    def cancel(self):
+        self._cancelled.set()
 
 if __name__ == "__main__":
     sample_text = {
@@ -0,0 +1,110 @@
+# translation_memory.py
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ERROR_PREFIX = '[Translation Error'
+
+def chunk_hash(text):
+    return hashlib.sha256(' '.join(text.split()).encode('utf-8')).hexdigest()
+
+class TranslationMemory:
+    """
+    Disk-backed (SQLite) cache of translated chunks keyed by (source, target, chunk hash).
+    Entries expire after ttl_seconds; beyond max_entries the least recently used go first.
+    """
+    def __init__(self, path, max_entries=200000, ttl_seconds=30 * 24 * 3600):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS translations (
+                source TEXT NOT NULL,
+                target TEXT NOT NULL,
+                chunk_hash TEXT NOT NULL,
+                translation TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (source, target, chunk_hash)
+            )''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used)')
+        self._puts_since_eviction = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, source, target, text):
+        key = (source, target, chunk_hash(text))
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT translation, created FROM translations WHERE source=? AND target=? AND chunk_hash=?',
+                key).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._conn.execute('DELETE FROM translations WHERE source=? AND target=? AND chunk_hash=?', key)
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE translations SET last_used=? WHERE source=? AND target=? AND chunk_hash=?',
+                               (now,) + key)
+            self.hits += 1
+            return row[0]
+
+    def put(self, source, target, text, translation):
+        if not translation or translation.startswith(ERROR_PREFIX):
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?)',
+                               (source, target, chunk_hash(text), translation, now, now))
+            self._puts_since_eviction += 1
+            if self._puts_since_eviction >= 1000:
+                self._evict(now)
+
+    def _evict(self, now):
+        self._puts_since_eviction = 0
+        self._conn.execute('DELETE FROM translations WHERE created < ?', (now - self.ttl_seconds,))
+        count = self._conn.execute('SELECT COUNT(*) FROM translations').fetchone()[0]
+        if count > self.max_entries:
+            # Trim to 90% so eviction doesn't run on every insert near the limit.
+            excess = count - int(self.max_entries * 0.9)
+            self._conn.execute('''
+                DELETE FROM translations WHERE rowid IN (
+                    SELECT rowid FROM translations ORDER BY last_used LIMIT ?)''', (excess,))
+            logger.info(f"Translation memory evicted {excess} entries")
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM translations')
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM translations').fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                'entries': entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+def create_translation_memory():
+    """The memory configured by TRANSLATION_MEMORY_PATH; an empty path disables it"""
+    path = os.getenv('TRANSLATION_MEMORY_PATH', os.path.join('.cache', 'translation_memory.sqlite3'))
+    if not path:
+        return None
+    return TranslationMemory(
+        path,
+        max_entries=int(os.getenv('TRANSLATION_MEMORY_MAX_ENTRIES', '200000')),
+        ttl_seconds=float(os.getenv('TRANSLATION_MEMORY_TTL', str(30 * 24 * 3600)))
+    )
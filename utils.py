@@ -1,9 +1,78 @@
 import zipfile
 import io
+import os
+import tempfile
+import threading
+import time
 
-def save_to_zip(text_dict):
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+# Export compression choices: (zipfile method, compresslevel).
+ZIP_COMPRESSION = {
+    'stored': (zipfile.ZIP_STORED, None),
+    'fast': (zipfile.ZIP_DEFLATED, 1),
+    'default': (zipfile.ZIP_DEFLATED, 6),
+    'smallest': (zipfile.ZIP_DEFLATED, 9)
+}
+# Archives up to this size stay in memory; larger ones spill to a temp file.
+ZIP_SPOOL_MAX_BYTES = int(os.getenv('ZIP_SPOOL_MAX_BYTES', str(8 * 1024 * 1024)))
+
+def write_zip(text_dict, compression='default'):
+    """
+    Write one page_<n>.txt per page into a SpooledTemporaryFile and return it
+    rewound; pages are encoded one at a time, so no second full copy of the
+    text is built. The caller closes the file.
+    """
+    method, level = ZIP_COMPRESSION[compression]
+    spool = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MAX_BYTES)
+    with zipfile.ZipFile(spool, 'w', method, compresslevel=level) as zip_file:
         for page, text in text_dict.items():
-            zip_file.writestr(f'page_{page}.txt', text)
-    return zip_buffer.getvalue()
\ No newline at end of file
+            with zip_file.open(f'page_{page}.txt', 'w') as entry:
+                entry.write(text.encode('utf-8') if isinstance(text, str) else text)
+    spool.seek(0)
+    return spool
+
+def save_to_zip(text_dict, compression='default'):
+    with write_zip(text_dict, compression) as spool:
+        return spool.read()
+
+def open_as_upload(path):
+    """Read a file from disk into a BytesIO that looks like a Streamlit upload (has .name and .getvalue())"""
+    with open(path, 'rb') as f:
+        buffer = io.BytesIO(f.read())
+    buffer.name = os.path.basename(path)
+    return buffer
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens are added per second, up to `capacity`.
+    acquire() blocks until enough tokens are available or the timeout runs out.
+    A rate of 0 or less means no limit.
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount=1.0, timeout=None):
+        """Take `amount` tokens; returns False if they did not become available in time"""
+        if self.rate <= 0:
+            return True
+        amount = min(float(amount), self.capacity)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return True
+                wait = (amount - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)